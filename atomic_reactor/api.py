@@ -12,8 +12,7 @@ from __future__ import absolute_import
 
 from atomic_reactor.inner import DockerBuildWorkflow
 from atomic_reactor.outer import PrivilegedBuildManager, DockerhostBuildManager
-from atomic_reactor.plugins.pre_pull_base_image import PullBaseImagePlugin
-from atomic_reactor.plugins.post_tag_and_push import TagAndPushPlugin
+from atomic_reactor.constants import PLUGIN_PULL_BASE_IMAGE_KEY, PLUGIN_TAG_AND_PUSH_KEY
 
 
 __all__ = (
@@ -35,7 +34,7 @@ def _prepare_build_json(image, source, parent_registry, target_registries,
         "image": image,
         "source": source,
         "postbuild_plugins": [{
-            "name": TagAndPushPlugin.key,
+            "name": PLUGIN_TAG_AND_PUSH_KEY,
             "args": {
                 "registries": registries
             }
@@ -44,7 +43,7 @@ def _prepare_build_json(image, source, parent_registry, target_registries,
 
     if not dont_pull_base_image:
         build_json["prebuild_plugins"] = [{
-            "name": PullBaseImagePlugin.key,
+            "name": PLUGIN_PULL_BASE_IMAGE_KEY,
             "args": {
                 "parent_registry": parent_registry,
                 "parent_registry_insecure": parent_registry_insecure,
@@ -11,8 +11,92 @@ from requests.auth import AuthBase, HTTPBasicAuth
 from requests.cookies import extract_cookies_to_jar
 from requests.utils import parse_dict_header
 from six.moves.urllib.parse import urlparse
+import calendar
+import hashlib
+import logging
 import requests
 import re
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+
+class BearerTokenCache(object):
+    """Thread-safe cache of Bearer tokens with expiration.
+
+    Tokens are stored under a key identifying the registry, repository,
+    requested access and credentials they were issued for. Expired tokens
+    are evicted when looked up.
+    """
+    # Tokens without expires_in are valid for 60 seconds, see
+    # https://docs.docker.com/registry/spec/auth/token/
+    DEFAULT_EXPIRES_IN = 60
+    # Consider tokens expired a bit sooner, so that they don't expire in flight
+    EXPIRY_MARGIN = 5
+    ISSUED_AT_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return cached token for key, None if there isn't a valid one"""
+        with self._lock:
+            try:
+                token, expires_at = self._tokens[key]
+            except KeyError:
+                return None
+
+            if time.time() >= expires_at:
+                del self._tokens[key]
+                return None
+
+            return token
+
+    def set(self, key, token, expires_in=None, issued_at=None):
+        """Cache token for key
+
+        :param key: hashable, cache key
+        :param token: str, Bearer token
+        :param expires_in: int, token lifetime in seconds, as returned by realm
+        :param issued_at: str, RFC3339 UTC time the token was issued, as returned by realm
+        """
+        now = time.time()
+        start = self._parse_issued_at(issued_at) or now
+        # Don't trust issued_at in the future (clock skew)
+        start = min(start, now)
+        try:
+            expires_in = int(expires_in)
+        except (TypeError, ValueError):
+            expires_in = self.DEFAULT_EXPIRES_IN
+        expires_at = start + expires_in - self.EXPIRY_MARGIN
+
+        with self._lock:
+            self._tokens[key] = (token, expires_at)
+
+    def clear(self):
+        with self._lock:
+            self._tokens.clear()
+
+    def __len__(self):
+        return len(self._tokens)
+
+    def _parse_issued_at(self, issued_at):
+        if not issued_at:
+            return None
+        try:
+            # Fractional seconds and the 'Z' suffix are ignored
+            return calendar.timegm(time.strptime(issued_at[:19], self.ISSUED_AT_FORMAT))
+        except (TypeError, ValueError):
+            logger.debug('unable to parse token issued_at %r', issued_at)
+            return None
+
+
+# Shared by all HTTPBearerAuth instances, so that tokens aren't negotiated
+# again for each new registry session
+bearer_token_cache = BearerTokenCache()
 
 
 class HTTPBearerAuth(AuthBase):
@@ -26,15 +110,18 @@ class HTTPBearerAuth(AuthBase):
     password).
 
     Once Bearer token is retrieved, it will be cached and used in subsequent
-    requests. Since tokens are specific to repositories, the token cache may
-    store multiple tokens.
+    requests until it expires. Since tokens are specific to repositories, the
+    token cache may store multiple tokens. The cache is shared by all instances
+    (unless token_cache is provided), tokens are looked up by registry,
+    repository, requested access and credentials.
 
     Supports registry v2 API only.
     """
     BEARER_PATTERN = re.compile(r'bearer ', flags=re.IGNORECASE)
     V2_REPO_PATTERN = re.compile(r'^/v2/(.*)/(manifests|tags|blobs)/')
 
-    def __init__(self, username=None, password=None, verify=True, access=None, auth_b64=None):
+    def __init__(self, username=None, password=None, verify=True, access=None, auth_b64=None,
+                 token_cache=None):
         """Initialize HTTPBearerAuth object.
 
         :param username: str, username to be used for authentication
@@ -45,6 +132,8 @@ class HTTPBearerAuth(AuthBase):
             requested; possible values to be included are 'pull' and/or 'push';
             defaults to ('pull',)
         :param auth_b64: str, base64 credendials as described in RFC 7617
+        :param token_cache: BearerTokenCache, cache to store tokens in;
+            defaults to the cache shared by all instances
         """
         self.username = username
         self.password = password
@@ -52,13 +141,23 @@ class HTTPBearerAuth(AuthBase):
         self.verify = verify
         self.access = access or ('pull',)
 
-        self._token_cache = {}
+        self._token_cache = bearer_token_cache if token_cache is None else token_cache
+
+        if auth_b64:
+            credentials = 'b64:{}'.format(auth_b64)
+        elif username and password:
+            credentials = 'basic:{}:{}'.format(username, password)
+        else:
+            credentials = ''
+        # don't keep credentials in cache keys
+        self._credentials_key = hashlib.sha256(credentials.encode('utf-8')).hexdigest()
 
     def __call__(self, response):
         repo = self._get_repo_from_url(response.url)
 
-        if repo in self._token_cache:
-            self._set_header(response, repo)
+        token = self._token_cache.get(self._get_cache_key(response.url, repo))
+        if token:
+            self._set_header(response, token)
             return response
 
         def handle_401_with_repo(response, **kwargs):
@@ -77,7 +176,7 @@ class HTTPBearerAuth(AuthBase):
         if 'bearer' not in auth_info.lower():
             return response
 
-        self._token_cache[repo] = self._get_token(auth_info, repo)
+        token = self._get_token(auth_info, repo, response.url)
 
         # Consume content and release the original connection
         # to allow our new request to reuse the same one.
@@ -88,7 +187,7 @@ class HTTPBearerAuth(AuthBase):
         extract_cookies_to_jar(retry_request._cookies, response.request, response.raw)
         retry_request.prepare_cookies(retry_request._cookies)
 
-        self._set_header(retry_request, repo)
+        self._set_header(retry_request, token)
         retry_response = response.connection.send(retry_request, **kwargs)
         retry_response.history.append(response)
         retry_response.request = retry_request
@@ -99,7 +198,7 @@ class HTTPBearerAuth(AuthBase):
 
         return retry_response
 
-    def _get_token(self, auth_info, repo):
+    def _get_token(self, auth_info, repo, url):
         bearer_info = parse_dict_header(self.BEARER_PATTERN.sub('', auth_info, count=1))
         # If repo could not be determined, do not set scope - implies global access
         if repo:
@@ -115,10 +214,19 @@ class HTTPBearerAuth(AuthBase):
         realm_response = requests.get(realm, params=bearer_info, verify=self.verify,
                                       auth=realm_auth)
         realm_response.raise_for_status()
-        return realm_response.json()['token']
-
-    def _set_header(self, response, repo):
-        response.headers['Authorization'] = 'Bearer {}'.format(self._token_cache[repo])
+        realm_json = realm_response.json()
+        # access_token is an OAuth 2.0 compatible alias of token
+        token = realm_json.get('token') or realm_json['access_token']
+        self._token_cache.set(self._get_cache_key(url, repo), token,
+                              expires_in=realm_json.get('expires_in'),
+                              issued_at=realm_json.get('issued_at'))
+        return token
+
+    def _set_header(self, response, token):
+        response.headers['Authorization'] = 'Bearer {}'.format(token)
+
+    def _get_cache_key(self, url, repo):
+        return (urlparse(url).netloc, repo, ','.join(self.access), self._credentials_key)
 
     def _get_repo_from_url(self, url):
         url_parts = urlparse(url)
@@ -96,7 +96,8 @@ def construct_kwargs(**kwargs):
 
 def cli_inside_build(args):
     build_inside(input_method=args.input, input_args=args.input_arg,
-                 substitutions=args.substitute)
+                 substitutions=args.substitute, profile_plugins=args.profile_plugins,
+                 profile_plugins_dir=args.profile_plugins_dir)
 
 
 class CLI(object):
@@ -196,6 +197,12 @@ class CLI(object):
         self.ib_parser.add_argument("--substitute", action='append',
                                     help="substitute values in build json (key=value, or "
                                          "plugin_type.plugin_name.key=value)")
+        self.ib_parser.add_argument("--profile-plugins", action='store_true', default=False,
+                                    help="record CPU, memory, I/O and HTTP usage of each plugin "
+                                    "in plugins metadata")
+        self.ib_parser.add_argument("--profile-plugins-dir", action='store', metavar="DIR",
+                                    help="also run plugins under cProfile and store the dumps "
+                                    "in DIR (implies --profile-plugins)")
         self.ib_parser.set_defaults(func=cli_inside_build)
 
     def generate_source_types_subparsers(self):
@@ -0,0 +1,251 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+Block-parallel gzip and xz compression.
+"""
+from __future__ import absolute_import
+
+import gzip
+import logging
+import zlib
+from collections import deque
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+try:
+    # if we import "lzma" first, we get pyliblzma on Py2, but we want backports.lzma
+    #  so first try to import backports.lzma on Py2 and then 'lzma' on Py3
+    from backports import lzma
+except ImportError:
+    import lzma
+
+
+logger = logging.getLogger(__name__)
+
+COMPRESSION_METHOD_EXTENSIONS = {
+    'gzip': 'gz',
+    'lzma': 'xz',
+}
+DEFAULT_COMPRESSION_LEVEL = 6
+
+GZIP_MAGIC = b'\x1f\x8b'
+XZ_MAGIC = b'\xfd7zXZ\x00'
+
+# Input is split into blocks of this size and each block is compressed
+# independently. gzip only looks 32 KiB back so small blocks cost next to
+# nothing in ratio; xz at level 6 uses an 8 MiB dictionary, so its blocks
+# are made 3 times that size (the same default as `xz --threads`).
+COMPRESSION_BLOCK_SIZES = {
+    'gzip': 1024 ** 2,
+    'lzma': 3 * 8 * 1024 ** 2,
+}
+
+
+def compress_gzip_block(data, level=DEFAULT_COMPRESSION_LEVEL):
+    """
+    Compress data into a complete gzip member
+
+    :param data: bytes, data to compress
+    :param level: int, compression level (1-9)
+    :return: bytes
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_lzma_block(data, level=DEFAULT_COMPRESSION_LEVEL):
+    """
+    Compress data into a complete xz stream
+
+    :param data: bytes, data to compress
+    :param level: int, compression preset (0-9)
+    :return: bytes
+    """
+    return lzma.compress(data, preset=level)
+
+
+BLOCK_COMPRESSORS = {
+    'gzip': compress_gzip_block,
+    'lzma': compress_lzma_block,
+}
+
+
+class ParallelCompressedFile(object):
+    """
+    Write-only file object which compresses data using several threads
+
+    Written data is split into blocks which are compressed concurrently and
+    written to the output file in their original order. gzip output is a
+    series of gzip members (like `pigz --independent` produces), xz output
+    is a series of xz streams; both are valid files which gzip/xz and the
+    Python gzip/lzma modules decompress transparently.
+
+    zlib and lzma release the GIL while compressing, so compression
+    throughput scales with the number of threads. At most 2 * threads
+    blocks are held in memory at any time.
+    """
+
+    def __init__(self, filename, method, threads, level=None, block_size=None, fileobj=None):
+        """
+        :param filename: str, path to the output file
+        :param method: str, 'gzip' or 'lzma'
+        :param threads: int, number of compression threads
+        :param level: int, compression level, 6 by default
+        :param block_size: int, size of independently compressed blocks
+        :param fileobj: writable file object to write compressed data to
+                        instead of opening filename; it is not closed
+        """
+        self.filename = filename
+        self.method = method
+        self.threads = threads
+        self.level = DEFAULT_COMPRESSION_LEVEL if level is None else level
+        self.block_size = block_size or COMPRESSION_BLOCK_SIZES[method]
+        self._compress_block = BLOCK_COMPRESSORS[method]
+
+        self._buffer = []
+        self._buffered = 0
+        self._blocks = 0
+        self._pending = deque()
+        self._max_pending = 2 * threads
+        self._pool = ThreadPool(threads)
+        if fileobj is None:
+            self._fp = self._myfp = open(filename, 'wb')
+        else:
+            self._fp = fileobj
+            self._myfp = None
+        self.closed = False
+
+    def write(self, data):
+        if self.closed:
+            raise ValueError('write to closed file')
+
+        size = len(data)
+        self._buffer.append(data)
+        self._buffered += size
+        while self._buffered >= self.block_size:
+            buffered = b''.join(self._buffer)
+            self._submit(buffered[:self.block_size])
+            rest = buffered[self.block_size:]
+            self._buffer = [rest]
+            self._buffered = len(rest)
+
+        return size
+
+    def _submit(self, block):
+        while len(self._pending) >= self._max_pending:
+            self._write_next()
+
+        self._pending.append(self._pool.apply_async(self._compress_block,
+                                                    (block, self.level)))
+        self._blocks += 1
+
+    def _write_next(self):
+        self._fp.write(self._pending.popleft().get())
+
+    def close(self):
+        if self.closed:
+            return
+
+        try:
+            # Always write at least one block so that empty input still
+            # results in a valid compressed file
+            if self._buffered or not self._blocks:
+                self._submit(b''.join(self._buffer))
+            self._buffer = []
+            self._buffered = 0
+
+            while self._pending:
+                self._write_next()
+
+            self._pool.close()
+        except Exception:
+            self._pool.terminate()
+            raise
+        finally:
+            self._pool.join()
+            self._close_fp()
+
+        logger.debug('compressed %d blocks into %s using %d threads',
+                     self._blocks, self.filename, self.threads)
+
+    def abort(self):
+        """
+        Stop compressing and close the output file without finishing it
+        """
+        if self.closed:
+            return
+
+        self._pool.terminate()
+        self._pool.join()
+        self._close_fp()
+
+    def _close_fp(self):
+        if self._myfp is not None:
+            self._myfp.close()
+        self._fp = self._myfp = None
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def open_compressed(filename, method, threads=1, level=None, fileobj=None):
+    """
+    Open a file for writing compressed data
+
+    :param filename: str, path to the output file
+    :param method: str, 'gzip' or 'lzma'
+    :param threads: int, number of compression threads; 1 compresses the
+                    data in a single stream in the calling thread, 0 uses
+                    one thread per CPU
+    :param level: int, compression level, 6 by default
+    :param fileobj: writable file object to write compressed data to
+                    instead of opening filename (e.g. util.ChecksumWriter);
+                    it is not closed together with the returned object
+    :return: writable file object
+    """
+    if method not in COMPRESSION_METHOD_EXTENSIONS:
+        raise RuntimeError('Unsupported compression format {0}'.format(method))
+
+    if level is None:
+        level = DEFAULT_COMPRESSION_LEVEL
+    if not threads:
+        threads = cpu_count()
+
+    if threads > 1:
+        return ParallelCompressedFile(filename, method, threads, level=level, fileobj=fileobj)
+    elif method == 'gzip':
+        return gzip.GzipFile(filename, 'wb', compresslevel=level, fileobj=fileobj)
+    else:
+        return lzma.LZMAFile(fileobj or filename, 'wb', preset=level)
+
+
+def open_decompressed(filename):
+    """
+    Open a possibly compressed file for reading decompressed data
+
+    Unlike the stream modes of tarfile, this handles files made of several
+    gzip members or xz streams, as written by ParallelCompressedFile.
+
+    :param filename: str, path to a gzip, xz or uncompressed file
+    :return: readable file object
+    """
+    with open(filename, 'rb') as f:
+        magic = f.read(len(XZ_MAGIC))
+
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.GzipFile(filename, 'rb')
+    elif magic == XZ_MAGIC:
+        return lzma.LZMAFile(filename, 'rb')
+    else:
+        return open(filename, 'rb')
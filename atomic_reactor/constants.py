@@ -74,6 +74,9 @@ TOOLS_USED = (
 )
 
 DEFAULT_DOWNLOAD_BLOCK_SIZE = 10 * 1024 * 1024  # 10Mb
+DEFAULT_DOWNLOAD_WORKERS = 5
+
+KOJI_MULTICALL_BATCH_SIZE = 500
 
 TAG_NAME_REGEX = r'^[\w][\w.-]{0,127}$'
 
@@ -81,6 +84,10 @@ IMAGE_TYPE_DOCKER_ARCHIVE = 'docker-archive'
 IMAGE_TYPE_OCI = 'oci'
 IMAGE_TYPE_OCI_TAR = 'oci-tar'
 
+# files marking removal of paths from lower layers of an image
+WHITEOUT_PREFIX = '.wh.'
+WHITEOUT_OPAQUE = '.wh..wh..opq'
+
 PLUGIN_KOJI_PROMOTE_PLUGIN_KEY = 'koji_promote'
 PLUGIN_KOJI_IMPORT_PLUGIN_KEY = 'koji_import'
 PLUGIN_KOJI_UPLOAD_PLUGIN_KEY = 'koji_upload'
@@ -108,6 +115,8 @@ PLUGIN_SOURCE_CONTAINER_KEY = 'source_container'
 PLUGIN_FETCH_SOURCES_KEY = 'fetch_sources'
 PLUGIN_KOJI_DELEGATE_KEY = 'koji_delegate'
 PLUGIN_PUSH_FLOATING_TAGS_KEY = 'push_floating_tags'
+PLUGIN_PULL_BASE_IMAGE_KEY = 'pull_base_image'
+PLUGIN_TAG_AND_PUSH_KEY = 'tag_and_push'
 
 # some shared dict keys for build metadata that gets recorded with koji.
 # for consistency of metadata in historical builds, these values basically cannot change.
@@ -129,6 +138,16 @@ DOCKER_CLIENT_STATUS_RETRY = (408, 500, 502, 503, 504)
 DOCKER_PUSH_MAX_RETRIES = 6
 # how many seconds should wait before another try of docker push
 DOCKER_PUSH_BACKOFF_FACTOR = 5
+# max concurrent pushes of additional tags to a single registry
+DOCKER_PUSH_MAX_WORKERS = 4
+# max concurrent pulls of parent images
+DOCKER_PULL_MAX_WORKERS = 4
+# max concurrent checks of parent image manifests against their koji builds
+KOJI_PARENT_MAX_WORKERS = 4
+# max concurrent removals of images at the end of the build
+REMOVE_IMAGES_MAX_WORKERS = 4
+# number of most recent log items kept in memory when streaming command logs
+STREAMED_LOGS_BUFFER_SIZE = 1000
 # max retries for http requests
 HTTP_MAX_RETRIES = 3
 # how many seconds should wait before another try of http request
@@ -145,6 +164,14 @@ GIT_BACKOFF_FACTOR = 5
 KOJI_RESERVE_MAX_RETRIES = 20
 # wait for 2sec (usual time of bump_release with reserve)
 KOJI_RESERVE_RETRY_DELAY = 2
+# max releases checked in a single multicall when looking for a free release
+KOJI_RELEASE_PROBE_MAX_BATCH = 64
+# max concurrent uploads of build outputs to koji
+KOJI_UPLOAD_MAX_WORKERS = 4
+# seconds before the first check of a koji task, later checks are less and
+# less frequent, up to the poll interval
+KOJI_TASK_POLL_INITIAL_INTERVAL = 0.5
+KOJI_TASK_POLL_BACKOFF_FACTOR = 1.5
 
 # Media types
 MEDIA_TYPE_DOCKER_V2_SCHEMA1 = "application/vnd.docker.distribution.manifest.v1+json"
@@ -160,6 +187,8 @@ DOCKERIGNORE = '.dockerignore'
 
 # Operator manifest constants
 OPERATOR_MANIFESTS_ARCHIVE = 'operator_manifests.zip'
+# max total size of operator manifest files exported from an image
+OPERATOR_MANIFESTS_MAX_SIZE = 50 * 1024 * 1024
 
 KOJI_BTYPE_IMAGE = 'image'
 KOJI_BTYPE_OPERATOR_MANIFESTS = 'operator-manifests'
@@ -403,7 +403,7 @@ class CommonTasker(LastLogger):
             context = None
             try:
                 logs_gen = function(*args, **kwargs)
-                cmd_result = atomic_reactor.util.wait_for_command(logs_gen)
+                cmd_result = atomic_reactor.util.wait_for_command(logs_gen, stream_logs=True)
             except ProtocolError as e:
                 exc = e
                 context = e.args
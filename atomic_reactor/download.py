@@ -55,8 +55,10 @@ def download_url(url, dest_dir, insecure=False, session=None, dest_filename=None
                 for chunk in response.iter_content(chunk_size=DEFAULT_DOWNLOAD_BLOCK_SIZE):
                     f.write(chunk)
             break
-        except requests.exceptions.RequestException:
+        except requests.exceptions.RequestException as exc:
             if attempt < HTTP_MAX_RETRIES:
+                logger.warning('download of %s failed (attempt %d of %d): %s',
+                               url, attempt + 1, HTTP_MAX_RETRIES + 1, exc)
                 time.sleep(HTTP_BACKOFF_FACTOR * (2 ** attempt))
             else:
                 raise
@@ -335,7 +335,8 @@ class DockerBuildWorkflow(object):
     def __init__(self, image, source=None, prebuild_plugins=None, prepublish_plugins=None,
                  postbuild_plugins=None, exit_plugins=None, plugin_files=None,
                  openshift_build_selflink=None, client_version=None,
-                 buildstep_plugins=None, **kwargs):
+                 buildstep_plugins=None, profile_plugins=False, profile_plugins_dir=None,
+                 prebuild_plugins_max_workers=1, **kwargs):
         """
         :param source: dict, where/how to get source code to put in image
         :param image: str, tag for built image ([registry/]image_name[:tag])
@@ -348,6 +349,12 @@ class DockerBuildWorkflow(object):
             on openshift) without the actual hostname/IP address
         :param client_version: str, osbs-client version used to render build json
         :param buildstep_plugins: list of dicts, arguments for build-step plugins
+        :param profile_plugins: bool, record resources used by each plugin
+            in plugins_resources
+        :param profile_plugins_dir: str, directory to store cProfile dumps of plugins in,
+            implies profile_plugins
+        :param prebuild_plugins_max_workers: int, maximum number of pre-build plugins
+            run concurrently, see Plugin.reads and Plugin.writes
         """
         tmp_dir = tempfile.mkdtemp()
         if source is None:
@@ -375,6 +382,10 @@ class DockerBuildWorkflow(object):
         self.build_canceled = False
         self.plugin_failed = False
         self.plugin_files = plugin_files
+        self.plugins_resources = {}
+        self.profile_plugins = bool(profile_plugins or profile_plugins_dir)
+        self.profile_plugins_dir = profile_plugins_dir
+        self.prebuild_plugins_max_workers = prebuild_plugins_max_workers
         self.fs_watcher = FSWatcher()
 
         self.kwargs = kwargs
@@ -482,13 +493,20 @@ class DockerBuildWorkflow(object):
             signal.signal(signal.SIGTERM, self.throw_canceled_build_exception)
             prebuild_runner = PreBuildPluginsRunner(self.builder.tasker, self,
                                                     self.prebuild_plugins_conf,
-                                                    plugin_files=self.plugin_files)
+                                                    plugin_files=self.plugin_files,
+                                                    profile=self.profile_plugins,
+                                                    profile_dir=self.profile_plugins_dir,
+                                                    max_workers=self.prebuild_plugins_max_workers)
             prepublish_runner = PrePublishPluginsRunner(self.builder.tasker, self,
                                                         self.prepublish_plugins_conf,
-                                                        plugin_files=self.plugin_files)
+                                                        plugin_files=self.plugin_files,
+                                                        profile=self.profile_plugins,
+                                                        profile_dir=self.profile_plugins_dir)
             postbuild_runner = PostBuildPluginsRunner(self.builder.tasker, self,
                                                       self.postbuild_plugins_conf,
-                                                      plugin_files=self.plugin_files)
+                                                      plugin_files=self.plugin_files,
+                                                      profile=self.profile_plugins,
+                                                      profile_dir=self.profile_plugins_dir)
             # time to run pre-build plugins, so they can access cloned repo
             logger.info("running pre-build plugins")
             try:
@@ -505,7 +523,9 @@ class DockerBuildWorkflow(object):
             # might change build method
             buildstep_runner = BuildStepPluginsRunner(self.builder.tasker, self,
                                                       self.buildstep_plugins_conf,
-                                                      plugin_files=self.plugin_files)
+                                                      plugin_files=self.plugin_files,
+                                                      profile=self.profile_plugins,
+                                                      profile_dir=self.profile_plugins_dir)
 
             logger.info("running buildstep plugins")
             try:
@@ -558,7 +578,9 @@ class DockerBuildWorkflow(object):
             exit_runner = ExitPluginsRunner(self.builder.tasker, self,
                                             self.exit_plugins_conf,
                                             keep_going=True,
-                                            plugin_files=self.plugin_files)
+                                            plugin_files=self.plugin_files,
+                                            profile=self.profile_plugins,
+                                            profile_dir=self.profile_plugins_dir)
             try:
                 exit_runner.run(keep_going=True)
             except PluginFailedException as ex:
@@ -576,7 +598,8 @@ class DockerBuildWorkflow(object):
             signal.signal(signal.SIGTERM, signal.SIG_DFL)
 
 
-def build_inside(input_method, input_args=None, substitutions=None):
+def build_inside(input_method, input_args=None, substitutions=None, profile_plugins=False,
+                 profile_plugins_dir=None):
     """
     use requested input plugin to load configuration and then initiate build
     """
@@ -613,6 +636,10 @@ def build_inside(input_method, input_args=None, substitutions=None):
     if not isinstance(build_json, dict):
         raise RuntimeError("Input plugin did not return valid build json: {}".format(build_json))
 
+    if profile_plugins or profile_plugins_dir:
+        build_json['profile_plugins'] = True
+        build_json['profile_plugins_dir'] = profile_plugins_dir
+
     dbw = DockerBuildWorkflow(**build_json)
     try:
         build_result = dbw.build_docker_image()
@@ -13,19 +13,26 @@ import logging
 import os
 import random
 import time
+import zlib
+from multiprocessing.pool import ThreadPool
 from string import ascii_letters
 
 import koji
 import requests
+from six.moves import queue
 
 from atomic_reactor import __version__ as atomic_reactor_version
 from atomic_reactor.constants import (DEFAULT_DOWNLOAD_BLOCK_SIZE,
                                       HTTP_BACKOFF_FACTOR, HTTP_MAX_RETRIES, PROG,
+                                      KOJI_MULTICALL_BATCH_SIZE, KOJI_UPLOAD_MAX_WORKERS,
+                                      KOJI_TASK_POLL_INITIAL_INTERVAL,
+                                      KOJI_TASK_POLL_BACKOFF_FACTOR,
                                       PLUGIN_EXPORT_OPERATOR_MANIFESTS_KEY,
                                       OPERATOR_MANIFESTS_ARCHIVE)
 from atomic_reactor.util import (get_version_of_tools, get_docker_architecture,
                                  Output, get_image_upload_filename,
                                  get_checksums, get_manifest_media_type)
+from atomic_reactor.plugin import BuildCanceledException
 from atomic_reactor.plugins.post_rpmqa import PostBuildRPMqaPlugin
 from atomic_reactor.rpm_util import get_rpm_list, parse_rpm_output
 from osbs.exceptions import OsbsException
@@ -34,10 +41,17 @@ logger = logging.getLogger(__name__)
 
 
 class KojiUploadLogger(object):
-    def __init__(self, logger, notable_percent=10):
+    def __init__(self, logger, notable_percent=10, name=None):
+        """
+        :param logger: logger to report progress to
+        :param notable_percent: int, report progress after this much of the file
+        :param name: str, name of the uploaded file, throughput of the whole
+                     upload is reported once finished if set
+        """
         self.logger = logger
         self.notable_percent = notable_percent
         self.last_percent_done = 0
+        self.name = name
 
     def callback(self, offset, totalsize, size, t1, t2):  # pylint: disable=W0613
         if offset == 0:
@@ -53,6 +67,11 @@ class KojiUploadLogger(object):
             self.logger.debug("upload: %d%% done (%.1f MiB/sec)",
                               percent_done, size / t1 / 1024 / 1024)
 
+        if self.name and offset == totalsize and t2:
+            self.logger.info("uploaded %s: %.1f MiB in %.1fs (%.1f MiB/sec)",
+                             self.name, totalsize / 1024 / 1024, t2,
+                             totalsize / t2 / 1024 / 1024)
+
 
 class KojiSessionWrapper(object):
     """
@@ -83,6 +102,245 @@ class KojiSessionWrapper(object):
             return session_attr
 
 
+def _adler32_hexdigest(checksum):
+    return '%08x' % (checksum & 0xffffffff)
+
+
+def _get_resume_offset(session, serverdir, name, checksums):
+    """
+    Find where to continue a failed upload
+
+    :param checksums: dict, adler32 checksums of the file up to chunk boundaries
+    :return: int, offset of the end of data stored by the hub, if they match
+             the file, otherwise 0
+    """
+    try:
+        info = session.checkUpload(serverdir, name, verify='adler32')
+    except (koji.GenericError, requests.RequestException) as exc:
+        logger.debug("unable to check partial upload of %s: %s", name, exc)
+        return 0
+
+    if info:
+        # sizes over 2GiB are encoded as strings
+        size = int(info['size'])
+        if size in checksums and info['hexdigest'] == _adler32_hexdigest(checksums[size]):
+            return size
+    return 0
+
+
+def _verify_upload(session, serverdir, name, totalsize, adler32, checksum=None,
+                   checksum_type=None):
+    """
+    Verify the whole file stored by the hub
+
+    An already known md5 checksum (e.g. computed while compressing the
+    image) is preferred, older hubs only support verifying adler32.
+    """
+    info = None
+    verify, expected = 'adler32', _adler32_hexdigest(adler32)
+    if checksum and checksum_type == 'md5':
+        try:
+            info = session.checkUpload(serverdir, name, verify='md5')
+            verify, expected = 'md5', checksum
+        except koji.GenericError as exc:
+            logger.debug("hub can't verify md5 checksum of %s: %s", name, exc)
+    if info is None:
+        info = session.checkUpload(serverdir, name, verify='adler32')
+
+    if not info or int(info['size']) != totalsize:
+        raise koji.GenericError('upload of %s is incomplete' % name)
+    if info['hexdigest'] != expected:
+        raise koji.GenericError('%s checksum of uploaded %s does not match: %s != %s' %
+                                (verify, name, info['hexdigest'], expected))
+
+
+def upload_file(session, localfile, serverdir, name=None, callback=None, blocksize=None,
+                checksum=None, checksum_type=None, max_retries=HTTP_MAX_RETRIES):
+    """
+    Upload a file to koji in chunks, resuming after failures
+
+    Each chunk is verified using its adler32 checksum. When a chunk fails
+    to upload, the upload continues from the end of data already stored by
+    the hub, as long as they match the file; once finished, the whole file
+    is verified.
+
+    Without the fast upload API, session.uploadWrapper is used instead.
+
+    :param session: KojiSessionWrapper, logged in session
+    :param localfile: str, path to the file
+    :param serverdir: str, directory on the hub to upload to
+    :param name: str, name of the uploaded file, basename of localfile by default
+    :param callback: callable, progress callback, as for uploadWrapper
+    :param blocksize: int, size of uploaded chunks, the hub default if None
+    :param checksum: str, already known checksum of the file
+    :param checksum_type: str, type of checksum
+    :param max_retries: int, max number of retries of failed chunks
+    :return: str, pathname on server
+    """
+    if name is None:
+        name = os.path.basename(localfile)
+    path = os.path.join(serverdir, name)
+    opts = getattr(session, 'opts', None) or {}
+
+    if not opts.get('use_fast_upload'):
+        kwargs = {}
+        if blocksize is not None:
+            kwargs['blocksize'] = blocksize
+        session.uploadWrapper(localfile, serverdir, name=name, callback=callback, **kwargs)
+        return path
+
+    if blocksize is None:
+        blocksize = opts.get('upload_blocksize', 1048576)
+
+    totalsize = os.path.getsize(localfile)
+    # running adler32 checksums of the file, keyed by chunk boundaries
+    checksums = {0: zlib.adler32(b'')}
+    offset = 0
+    retries = 0
+    start = time.time()
+    if callback:
+        callback(0, totalsize, 0, 0, 0)
+
+    with open(localfile, 'rb') as f:
+        while True:
+            lap = time.time()
+            f.seek(offset)
+            chunk = f.read(blocksize)
+            end = offset + len(chunk)
+            checksums[end] = zlib.adler32(chunk, checksums[offset]) & 0xffffffff
+            try:
+                result = session.rawUpload(chunk, offset, serverdir, name, overwrite=True)
+                hexdigest = _adler32_hexdigest(zlib.adler32(chunk))
+                if int(result['size']) != len(chunk) or result['hexdigest'] != hexdigest:
+                    raise koji.GenericError('chunk of %s at offset %d failed verification' %
+                                            (name, offset))
+            except (koji.GenericError, requests.RequestException) as exc:
+                if retries >= max_retries:
+                    raise
+                retries += 1
+                logger.warning("uploading %s failed at offset %d, retrying: %s",
+                               path, offset, exc)
+                time.sleep(HTTP_BACKOFF_FACTOR * (2 ** (retries - 1)))
+                offset = _get_resume_offset(session, serverdir, name, checksums)
+                logger.info("resuming upload of %s at offset %d", path, offset)
+                continue
+
+            offset = end
+            if callback:
+                now = time.time()
+                callback(offset, totalsize, len(chunk),
+                         max(now - lap, 0.00001), max(now - start, 0.00001))
+            if offset >= totalsize:
+                break
+
+    if retries:
+        _verify_upload(session, serverdir, name, totalsize, checksums[offset],
+                       checksum=checksum, checksum_type=checksum_type)
+
+    return path
+
+
+def upload_outputs(session, outputs, upload, max_workers=KOJI_UPLOAD_MAX_WORKERS):
+    """
+    Upload output files to koji, several at once
+
+    Koji sessions can't be shared between threads, so each concurrent
+    upload uses its own subsession of the given session, which doesn't
+    need to log in again.
+
+    :param session: KojiSessionWrapper, logged in session
+    :param outputs: list of Output, outputs without a file are skipped
+    :param upload: callable, upload(session, output) uploading a single output
+    :param max_workers: int, max number of files uploaded at the same time
+    :return: list of results of upload, in the order of outputs
+    """
+    outputs = [output for output in outputs if output.file]
+    workers = min(max_workers, len(outputs))
+    if workers <= 1:
+        return [upload(session, output) for output in outputs]
+
+    sessions = queue.Queue()
+    sessions.put(session)
+    subsessions = []
+
+    def upload_output(output):
+        worker_session = sessions.get()
+        try:
+            return upload(worker_session, output), None
+        except Exception as exc:
+            logger.error("upload of %s failed: %s", output.metadata['filename'], exc)
+            return None, exc
+        finally:
+            sessions.put(worker_session)
+
+    # start with the largest files, so that they don't hold up the end
+    order = sorted(range(len(outputs)),
+                   key=lambda i: os.path.getsize(outputs[i].file.name), reverse=True)
+    try:
+        for _ in range(workers - 1):
+            subsession = KojiSessionWrapper(session.subsession())
+            subsessions.append(subsession)
+            sessions.put(subsession)
+
+        pool = ThreadPool(workers)
+        try:
+            results = pool.map(upload_output, [outputs[i] for i in order], chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    finally:
+        for subsession in subsessions:
+            try:
+                subsession.logout()
+            except Exception as exc:
+                logger.debug("failed to log out of koji subsession: %s", exc)
+
+    results = dict(zip(order, results))
+    for i in range(len(outputs)):
+        exc = results[i][1]
+        if exc is not None:
+            raise exc
+    return [results[i][0] for i in range(len(outputs))]
+
+
+def koji_multicall_map(session, method, args_list, batch=KOJI_MULTICALL_BATCH_SIZE, **kwargs):
+    """
+    Call a Koji hub method once for each argument, using multicall
+
+    This is equivalent to [session.<method>(arg, **kwargs) for arg in args_list],
+    but needs only one round trip to the hub for each batch of calls.
+
+    :param session: KojiSessionWrapper, Session for talking to Koji
+    :param method: str, name of the hub method
+    :param args_list: list, first positional argument for each call
+    :param batch: int, maximum number of calls sent in a single request
+    :param kwargs: keyword arguments passed to every call
+    :return: list, results in the order of args_list; the first
+        failed call raises its error (e.g. koji.GenericError); connection
+        errors are retried up to HTTP_MAX_RETRIES times
+    """
+    if not args_list:
+        return []
+
+    logger.debug("calling %s for %d arguments using multicall", method, len(args_list))
+    # multicall() bypasses KojiSessionWrapper, retry connection errors the same way;
+    # call_all() drops the queued calls, so queue them again for each attempt
+    retry_delay = HTTP_BACKOFF_FACTOR
+    last_exc = None
+    for retry in range(HTTP_MAX_RETRIES):
+        multicall = session.multicall(strict=True, batch=batch)
+        calls = [getattr(multicall, method)(arg, **kwargs) for arg in args_list]
+        try:
+            multicall.call_all()
+        except requests.ConnectionError as exc:
+            logger.debug("multicall of %s failed: %s", method, exc)
+            time.sleep(retry_delay * (2 ** retry))
+            last_exc = exc
+            continue
+        return [call.result for call in calls]
+    raise last_exc  # pylint: disable=raising-bad-type
+
+
 def koji_login(session,
                proxyuser=None,
                ssl_certs_dir=None,
@@ -159,21 +417,82 @@ def create_koji_session(hub_url, auth_info=None, use_fast_upload=True):
     return session
 
 
+def _poll_intervals(poll_interval):
+    """
+    Generate intervals between checks, growing up to poll_interval
+    """
+    interval = min(KOJI_TASK_POLL_INITIAL_INTERVAL, poll_interval)
+    while True:
+        yield interval
+        interval = min(interval * KOJI_TASK_POLL_BACKOFF_FACTOR, poll_interval)
+
+
+def wait_for_tasks(session, task_ids, poll_interval=5, cancel_on_build_cancel=False):
+    """
+    Wait for koji tasks to finish
+
+    Tasks are checked often at first, then less and less often, up to
+    poll_interval seconds apart. All unfinished tasks are checked in a
+    single multicall.
+
+    :param session: KojiSessionWrapper, Session for talking to Koji
+    :param task_ids: list of int, ids of tasks to wait for
+    :param poll_interval: int, max seconds between checks
+    :param cancel_on_build_cancel: bool, cancel unfinished tasks when the build
+        is canceled while waiting (BuildCanceledException is raised anyway)
+    :return: dict, task ids mapped to names of their states
+    """
+    task_ids = list(task_ids)
+    pending = task_ids
+    intervals = _poll_intervals(poll_interval)
+    logger.debug("waiting for koji tasks %s to finish", ', '.join(str(t) for t in task_ids))
+    try:
+        while pending:
+            if len(pending) == 1:
+                finished = [session.taskFinished(pending[0])]
+            else:
+                finished = koji_multicall_map(session, 'taskFinished', pending)
+            pending = [task_id for task_id, done in zip(pending, finished) if not done]
+            if pending:
+                time.sleep(next(intervals))
+    except BuildCanceledException:
+        if cancel_on_build_cancel:
+            for task_id in pending:
+                logger.info("build was canceled, canceling koji task %s", task_id)
+                try:
+                    session.cancelTask(task_id)
+                except Exception as exc:
+                    logger.info("failed to cancel koji task %s (ignored): %s", task_id, exc)
+        raise
+
+    logger.debug("koji tasks are finished, getting info")
+    if len(task_ids) == 1:
+        task_infos = [session.getTaskInfo(task_ids[0], request=True)]
+    else:
+        task_infos = koji_multicall_map(session, 'getTaskInfo', task_ids, request=True)
+    return {task_id: koji.TASK_STATES[task_info['state']]
+            for task_id, task_info in zip(task_ids, task_infos)}
+
+
 class TaskWatcher(object):
-    def __init__(self, session, task_id, poll_interval=5):
+    def __init__(self, session, task_id, poll_interval=5, cancel_on_build_cancel=False):
+        """
+        :param session: KojiSessionWrapper, Session for talking to Koji
+        :param task_id: int, id of the task to wait for
+        :param poll_interval: int, max seconds between checks of the task
+        :param cancel_on_build_cancel: bool, cancel the task when the build is
+            canceled while waiting
+        """
         self.session = session
         self.task_id = task_id
         self.poll_interval = poll_interval
+        self.cancel_on_build_cancel = cancel_on_build_cancel
         self.state = 'CANCELED'
 
     def wait(self):
-        logger.debug("waiting for koji task %r to finish", self.task_id)
-        while not self.session.taskFinished(self.task_id):
-            time.sleep(self.poll_interval)
-
-        logger.debug("koji task is finished, getting info")
-        task_info = self.session.getTaskInfo(self.task_id, request=True)
-        self.state = koji.TASK_STATES[task_info['state']]
+        states = wait_for_tasks(self.session, [self.task_id], poll_interval=self.poll_interval,
+                                cancel_on_build_cancel=self.cancel_on_build_cancel)
+        self.state = states[self.task_id]
         return self.state
 
     def failed(self):
@@ -345,11 +664,14 @@ def get_image_output(workflow, image_id, arch):
     :return: tuple, (metadata dict, Output instance)
 
     """
-    saved_image = workflow.exported_image_sequence[-1].get('path')
-    image_name = get_image_upload_filename(workflow.exported_image_sequence[-1],
-                                           image_id, arch)
-
-    metadata = get_output_metadata(saved_image, image_name)
+    image_metadata = workflow.exported_image_sequence[-1]
+    saved_image = image_metadata.get('path')
+    image_name = get_image_upload_filename(image_metadata, image_id, arch)
+
+    # Reuse the checksum computed when the image was exported, if there is one
+    md5sum = image_metadata.get('md5sum')
+    checksums = {'md5sum': md5sum} if md5sum else None
+    metadata = get_output_metadata(saved_image, image_name, checksums=checksums)
     output = Output(file=open(saved_image), metadata=metadata)
 
     return metadata, output
@@ -505,13 +827,18 @@ def generate_koji_upload_dir():
     return os.path.join(dir_prefix, unique_fragment)
 
 
-def get_output_metadata(path, filename):
+def get_output_metadata(path, filename, checksums=None):
     """
     Describe a file by its metadata.
 
+    :param path: str, path to the file
+    :param filename: str, name of the output
+    :param checksums: dict, already known checksums of the file (as returned
+                      by get_checksums); md5sum is computed when missing
     :return: dict
     """
-    checksums = get_checksums(path, ['md5'])
+    if not checksums or 'md5sum' not in checksums:
+        checksums = get_checksums(path, ['md5'])
     metadata = {'filename': filename,
                 'filesize': os.path.getsize(path),
                 'checksum': checksums['md5sum'],
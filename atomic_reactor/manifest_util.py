@@ -13,6 +13,7 @@ from copy import deepcopy
 
 from atomic_reactor.plugin import PluginFailedException
 from atomic_reactor.plugins.pre_reactor_config import get_registries
+from atomic_reactor.registry_cache import registry_cache
 from atomic_reactor.util import (registry_hostname, RegistrySession, ManifestDigest,
                                  get_manifest_media_type)
 from atomic_reactor.constants import (MEDIA_TYPE_DOCKER_V2_SCHEMA2,
@@ -155,6 +156,7 @@ class ManifestUtil(object):
         headers = {'Content-Type': media_type}
         response = session.put(url, data=manifest, headers=headers)
         response.raise_for_status()
+        registry_cache.invalidate_tags(session.registry, target_repo)
 
     def get_registry_session(self, registry):
         registry_conf = self.registries[registry]
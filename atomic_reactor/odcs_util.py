@@ -145,36 +145,76 @@ class ODCSClient(object):
         :return: dict, updated status of compose.
         :raise RuntimeError: if state_name becomes 'failed'
         """
-        logger.debug("Getting compose information for information for compose_id=%s",
-                     compose_id)
-        url = '{}composes/{}'.format(self.url, compose_id)
+        composes, _ = self.wait_for_composes([compose_id], burst_retry=burst_retry,
+                                             burst_length=burst_length,
+                                             slow_retry=slow_retry, timeout=timeout)
+        return composes[compose_id]
+
+    def wait_for_composes(self, compose_ids,
+                          burst_retry=1,
+                          burst_length=30,
+                          slow_retry=10,
+                          timeout=3600):
+        """Wait for several compose requests to finalize
+
+        All composes are polled in a single loop. Composes which have already
+        finalized are not queried again, and waiting stops as soon as any of
+        the composes fails.
+
+        :param compose_ids: list of int, compose IDs to wait for
+        :param burst_retry: int, seconds to wait between retries prior to exceeding
+                            the burst length
+        :param burst_length: int, seconds to switch to slower retry period
+        :param slow_retry: int, seconds to wait between retries after exceeding
+                           the burst length
+        :param timeout: int, when to give up waiting for compose requests
+
+        :return: tuple, (dict, compose ID mapped to updated status of compose,
+                 dict, compose ID mapped to seconds spent waiting for it)
+        :raise RuntimeError: if state_name of any compose becomes 'failed'
+        """
+        logger.debug("Getting compose information for compose_ids=%s", compose_ids)
+        composes = {}
+        wait_times = {}
+        # keep the order, but query each compose only once per round
+        pending = sorted(set(compose_ids), key=compose_ids.index)
         start_time = time.time()
         while True:
-            response = self.session.get(url)
-            response.raise_for_status()
-            response_json = response.json()
-
-            if response_json['state_name'] == 'failed':
-                state_reason = response_json.get('state_reason', 'Unknown')
-                logger.error(dedent("""\
-                   Compose %s failed: %s
-                   Details: %s
-                   """), compose_id, state_reason, json.dumps(response_json, indent=4))
-                raise RuntimeError('Failed request for compose_id={}: {}'
-                                   .format(compose_id, state_reason))
-
-            if response_json['state_name'] not in ['wait', 'generating']:
+            still_pending = []
+            for compose_id in pending:
+                response = self.session.get('{}composes/{}'.format(self.url, compose_id))
+                response.raise_for_status()
+                response_json = response.json()
+
+                if response_json['state_name'] == 'failed':
+                    state_reason = response_json.get('state_reason', 'Unknown')
+                    logger.error(dedent("""\
+                       Compose %s failed: %s
+                       Details: %s
+                       """), compose_id, state_reason, json.dumps(response_json, indent=4))
+                    raise RuntimeError('Failed request for compose_id={}: {}'
+                                       .format(compose_id, state_reason))
+
+                if response_json['state_name'] in ['wait', 'generating']:
+                    still_pending.append(compose_id)
+                    continue
+
                 logger.debug("Retrieved compose information for compose_id=%s: %s",
                              compose_id, json.dumps(response_json, indent=4))
-                return response_json
+                composes[compose_id] = response_json
+                wait_times[compose_id] = time.time() - start_time
+
+            pending = still_pending
+            if not pending:
+                return composes, wait_times
 
             elapsed = time.time() - start_time
             if elapsed > timeout:
-                raise RuntimeError("Retrieving %s timed out after %s seconds" %
-                                   (url, timeout))
+                raise RuntimeError("Waiting for compose_ids=%s timed out after %s seconds" %
+                                   (pending, timeout))
             else:
-                logger.debug("Retrying request compose_id=%s, elapsed_time=%s",
-                             compose_id, elapsed)
+                logger.debug("Retrying request compose_ids=%s, elapsed_time=%s",
+                             pending, elapsed)
 
                 if elapsed > burst_length:
                     time.sleep(slow_retry)
@@ -22,9 +22,14 @@ import datetime
 import inspect
 import time
 from six import PY2
+from six.moves import queue
 from collections import namedtuple
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
 
 from atomic_reactor.build import BuildResult
+from atomic_reactor.plugin_index import plugin_index
+from atomic_reactor.profiling import PluginProfiler
 from atomic_reactor.util import process_substitutions, exception_message
 from dockerfile_parse import DockerfileParser
 
@@ -63,6 +68,14 @@ class Plugin(object):
     key = None
     # by default, if plugin fails (raises exc), execution continues
     is_allowed_to_fail = True
+    # names of the workflow state the plugin reads and writes, e.g. keys of
+    # other plugins whose results it uses, 'dockerfile', 'all_yum_repourls';
+    # every plugin implicitly writes its own key (its result)
+    # plugins declaring neither are run alone, after all plugins preceding
+    # them have finished and before any following plugin is started; other
+    # plugins may be run concurrently with plugins they don't share state with
+    reads = None
+    writes = None
 
     def __init__(self, *args, **kwargs):
         """
@@ -128,16 +141,25 @@ class PluginsRunner(object):
 
         :param plugin_class_name: str, name of plugin class to filter (e.g. 'PreBuildPlugin')
         :param plugins_conf: list of dicts, configuration for plugins
+        :param profile: bool, record resources used by each plugin (keyword only)
+        :param profile_dir: str, directory to store cProfile dumps of plugins in
+            (keyword only)
+        :param max_workers: int, maximum number of plugins run concurrently,
+            see Plugin.reads and Plugin.writes; ignored when profiling
+            (keyword only)
         """
         self.plugins_results = getattr(self, "plugins_results", {})
         self.plugins_conf = plugins_conf or []
         self.plugin_files = kwargs.get("plugin_files", [])
+        self.profile_dir = kwargs.get("profile_dir")
+        self.profile = kwargs.get("profile", False) or bool(self.profile_dir)
+        self.max_workers = kwargs.get("max_workers", 1)
         self.plugin_classes = self.load_plugins(plugin_class_name)
         self.available_plugins = self.get_available_plugins()
 
     def load_plugins(self, plugin_class_name):
         """
-        load all available plugins
+        load available plugins, only those requested in plugins_conf if it is set
 
         :param plugin_class_name: str, name of plugin class (e.g. 'PreBuildPlugin')
         :return: dict, bindings for plugins of the plugin_class_name class
@@ -151,6 +173,11 @@ class PluginsRunner(object):
         if self.plugin_files:
             logger.debug("loading additional plugins from files '%s'", self.plugin_files)
             files += self.plugin_files
+        # only import modules defining requested plugins, if they are known already
+        plugins_conf = getattr(self, 'plugins_conf', None)
+        if plugins_conf is not None:
+            files = plugin_index.select_modules(files, [plugin_request['name']
+                                                        for plugin_request in plugins_conf])
         plugin_class = globals()[plugin_class_name]
         plugin_classes = {}
         for f in files:
@@ -202,6 +229,31 @@ class PluginsRunner(object):
     def save_plugin_duration(self, plugin, duration):
         pass
 
+    def save_plugin_resources(self, plugin, resources):
+        pass
+
+    @contextmanager
+    def profile_plugin(self, plugin):
+        """
+        Record resources used by the code run in this context, if profiling is enabled
+
+        :param plugin: str, plugin key
+        """
+        if not self.profile:
+            yield
+            return
+
+        profiler = PluginProfiler(plugin, profile_dir=self.profile_dir)
+        try:
+            with profiler:
+                yield
+        finally:
+            try:
+                logger.debug("plugin '%s' used %s", plugin, profiler.resources)
+                self.save_plugin_resources(plugin, profiler.resources)
+            except Exception:
+                logger.exception("failed to save plugin resources")
+
     def get_available_plugins(self):
         """
         check requested plugins availability
@@ -239,6 +291,47 @@ class PluginsRunner(object):
             available_plugins.append(plugin)
         return available_plugins
 
+    def _handle_plugin_exception(self, plugin, ex, keep_going, failed_msgs):
+        """
+        log failure of a plugin and decide whether it is fatal
+
+        :param plugin: PluginData, plugin which raised the exception
+        :param ex: Exception, exception raised by the plugin
+        :param keep_going: bool, whether to keep going after unexpected failure
+        :param failed_msgs: list, messages of failures to report once all
+                            plugins have finished are appended to it
+        :raises PluginFailedException: if the failure is fatal
+        """
+        msg = "plugin '%s' raised an exception: %s" % (plugin.plugin_class.key,
+                                                       exception_message(ex))
+        if not plugin.is_allowed_to_fail:
+            self.on_plugin_failed(plugin.plugin_class.key, ex)
+
+        if plugin.is_allowed_to_fail or keep_going:
+            logger.warning(msg)
+            logger.info("error is not fatal, continuing...")
+            if not plugin.is_allowed_to_fail:
+                failed_msgs.append(msg)
+        else:
+            logger.error(msg)
+            raise PluginFailedException(msg)
+
+    def _save_plugin_duration(self, plugin, start_time, finish_time):
+        try:
+            duration = finish_time - start_time
+            seconds = duration.total_seconds()
+            logger.debug("plugin '%s' finished in %ds", plugin.name, seconds)
+            self.save_plugin_duration(plugin.plugin_class.key, seconds)
+        except Exception:
+            logger.exception("failed to save plugin duration")
+
+    def _raise_for_failed_msgs(self, failed_msgs):
+        if len(failed_msgs) == 1:
+            raise PluginFailedException(failed_msgs[0])
+        elif len(failed_msgs) > 1:
+            raise PluginFailedException("Multiple plugins raised an exception: " +
+                                        str(failed_msgs))
+
     def run(self, keep_going=False, buildstep_phase=False):
         """
         run all requested plugins
@@ -249,6 +342,13 @@ class PluginsRunner(object):
                                 not be executed after a plugin completes
                                 (only used for build-step plugins)
         """
+        if self.max_workers > 1 and not buildstep_phase:
+            if not self.profile:
+                return self._run_concurrently(keep_going)
+            # resources are measured for the whole process and cProfile
+            # can't profile several threads at once
+            logger.info("profiling plugins, running them one at a time")
+
         failed_msgs = []
         plugin_successful = False
         plugin_response = None
@@ -265,7 +365,8 @@ class PluginsRunner(object):
                 plugin_instance = self.create_instance_from_plugin(plugin.plugin_class,
                                                                    plugin.conf)
                 self.save_plugin_timestamp(plugin.plugin_class.key, start_time)
-                plugin_response = plugin_instance.run()
+                with self.profile_plugin(plugin.plugin_class.key):
+                    plugin_response = plugin_instance.run()
                 plugin_successful = True
                 if buildstep_phase:
                     assert isinstance(plugin_response, BuildResult)
@@ -293,32 +394,11 @@ class PluginsRunner(object):
                 if not buildstep_phase:
                     raise
             except Exception as ex:
-                msg = "plugin '%s' raised an exception: %s" % (plugin.plugin_class.key,
-                                                               exception_message(ex))
                 logger.debug(traceback.format_exc())
-                if not plugin.is_allowed_to_fail:
-                    self.on_plugin_failed(plugin.plugin_class.key, ex)
-
-                if plugin.is_allowed_to_fail or keep_going:
-                    logger.warning(msg)
-                    logger.info("error is not fatal, continuing...")
-                    if not plugin.is_allowed_to_fail:
-                        failed_msgs.append(msg)
-                else:
-                    logger.error(msg)
-                    raise PluginFailedException(msg)
-
+                self._handle_plugin_exception(plugin, ex, keep_going, failed_msgs)
                 plugin_response = ex
 
-            try:
-                if start_time:
-                    finish_time = datetime.datetime.now()
-                    duration = finish_time - start_time
-                    seconds = duration.total_seconds()
-                    logger.debug("plugin '%s' finished in %ds", plugin.name, seconds)
-                    self.save_plugin_duration(plugin.plugin_class.key, seconds)
-            except Exception:
-                logger.exception("failed to save plugin duration")
+            self._save_plugin_duration(plugin, start_time, datetime.datetime.now())
 
             if not skip_response:
                 self.plugins_results[plugin.plugin_class.key] = plugin_response
@@ -328,11 +408,7 @@ class PluginsRunner(object):
                              'after first successful plugin')
                 break
 
-        if len(failed_msgs) == 1:
-            raise PluginFailedException(failed_msgs[0])
-        elif len(failed_msgs) > 1:
-            raise PluginFailedException("Multiple plugins raised an exception: " +
-                                        str(failed_msgs))
+        self._raise_for_failed_msgs(failed_msgs)
 
         if not plugin_successful and buildstep_phase and not plugin_response:
             self.on_plugin_failed("BuildStepPlugin", "No appropriate build step")
@@ -340,6 +416,166 @@ class PluginsRunner(object):
 
         return self.plugins_results
 
+    @staticmethod
+    def _get_plugin_state(plugin_class):
+        """
+        :param plugin_class: plugin class
+        :return: tuple (set of state read, set of state written), None if the
+                 plugin doesn't declare the state it uses
+        """
+        if plugin_class.reads is None and plugin_class.writes is None:
+            return None
+
+        reads = set(plugin_class.reads or ())
+        writes = set(plugin_class.writes or ())
+        writes.add(plugin_class.key)
+        return reads, writes
+
+    def get_plugin_dependencies(self, plugins):
+        """
+        find out which plugins have to finish before each plugin may be started
+
+        A plugin depends on a preceding plugin if either of them doesn't
+        declare the workflow state it uses, or if one of them writes
+        state the other one reads or writes.
+
+        :param plugins: list of PluginData
+        :return: list of sets, indices of plugins each plugin depends on
+        """
+        states = [self._get_plugin_state(plugin.plugin_class) for plugin in plugins]
+        dependencies = []
+        for index, state in enumerate(states):
+            depends_on = set()
+            for previous, previous_state in enumerate(states[:index]):
+                if state is None or previous_state is None:
+                    depends_on.add(previous)
+                    continue
+
+                reads, writes = state
+                previous_reads, previous_writes = previous_state
+                if previous_writes & (reads | writes) or previous_reads & writes:
+                    depends_on.add(previous)
+
+            dependencies.append(depends_on)
+
+        return dependencies
+
+    def _run_plugin_in_thread(self, index, plugin):
+        start_time = datetime.datetime.now()
+        try:
+            plugin_instance = self.create_instance_from_plugin(plugin.plugin_class,
+                                                               plugin.conf)
+            self.save_plugin_timestamp(plugin.plugin_class.key, start_time)
+            with self.profile_plugin(plugin.plugin_class.key):
+                plugin_response = plugin_instance.run()
+        # exceptions must not escape, the result would never be collected
+        except BaseException as ex:
+            logger.debug(traceback.format_exc())
+            return index, start_time, datetime.datetime.now(), None, ex
+
+        return index, start_time, datetime.datetime.now(), plugin_response, None
+
+    def _run_concurrently(self, keep_going):
+        """
+        run plugins in a thread pool, respecting their dependencies
+
+        Plugins not declaring the state they use are run in the calling
+        thread. When a plugin fails fatally, no more plugins are started,
+        those already running are allowed to finish and the failure of
+        the first such plugin in the configured order is raised. Results
+        are stored in the configured order of plugins.
+
+        :param keep_going: bool, whether to keep going after unexpected failure
+        """
+        plugins = self.available_plugins
+        dependencies = self.get_plugin_dependencies(plugins)
+        waiting = list(range(len(plugins)))
+        running = set()
+        finished = set()
+        finished_queue = queue.Queue()
+        failed_msgs = []
+        fatal = []
+        pool = None
+
+        def collect(outcome):
+            index, start_time, finish_time, plugin_response, ex = outcome
+            plugin = plugins[index]
+            finished.add(index)
+            running.discard(index)
+
+            if ex is not None:
+                msgs = []
+                if isinstance(ex, InappropriateBuildStepError):
+                    logger.debug('Build step %s is not appropriate', plugin.plugin_class.key)
+                    fatal.append((index, ex))
+                    return
+                if not isinstance(ex, Exception) or isinstance(ex, AutoRebuildCanceledException):
+                    fatal.append((index, ex))
+                    return
+                try:
+                    self._handle_plugin_exception(plugin, ex, keep_going, msgs)
+                except PluginFailedException as failed:
+                    fatal.append((index, failed))
+                    return
+                failed_msgs.extend((index, msg) for msg in msgs)
+                plugin_response = ex
+
+            self._save_plugin_duration(plugin, start_time, finish_time)
+            self.plugins_results[plugin.plugin_class.key] = plugin_response
+
+        try:
+            while waiting or running:
+                ready = [] if fatal else [index for index in waiting
+                                          if dependencies[index] <= finished]
+                for index in ready:
+                    plugin = plugins[index]
+                    waiting.remove(index)
+                    logger.debug("running plugin '%s'", plugin.name)
+                    if (self._get_plugin_state(plugin.plugin_class) is None or
+                            (len(ready) == 1 and not running)):
+                        # nothing else is running or may be started now,
+                        # see get_plugin_dependencies()
+                        collect(self._run_plugin_in_thread(index, plugin))
+                        break
+
+                    if pool is None:
+                        pool = ThreadPool(self.max_workers)
+                    running.add(index)
+                    pool.apply_async(self._run_plugin_in_thread, (index, plugin),
+                                     callback=finished_queue.put)
+                else:
+                    if running:
+                        try:
+                            # the timeout makes sure signals are handled on Python 2
+                            collect(finished_queue.get(timeout=1))
+                        except queue.Empty:
+                            continue
+                    elif fatal:
+                        break
+        except BaseException:
+            # e.g. BuildCanceledException raised by the SIGTERM handler;
+            # don't wait for running plugins, their threads are daemonic
+            if pool is not None:
+                pool.close()
+            raise
+
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+        # keep results in the configured order of plugins
+        for plugin in plugins:
+            key = plugin.plugin_class.key
+            if key in self.plugins_results:
+                self.plugins_results[key] = self.plugins_results.pop(key)
+
+        if fatal:
+            raise min(fatal, key=lambda failure: failure[0])[1]
+
+        self._raise_for_failed_msgs([msg for _, msg in sorted(failed_msgs)])
+
+        return self.plugins_results
+
 
 class BuildPluginsRunner(PluginsRunner):
     def __init__(self, dt, workflow, plugin_class_name, plugins_conf, *args, **kwargs):
@@ -366,6 +602,9 @@ class BuildPluginsRunner(PluginsRunner):
     def save_plugin_duration(self, plugin, duration):
         self.workflow.plugins_durations[plugin] = duration
 
+    def save_plugin_resources(self, plugin, resources):
+        self.workflow.plugins_resources[plugin] = resources
+
     def _translate_special_values(self, obj_to_translate):
         """
         you may want to write plugins for values which are not known before build:
@@ -0,0 +1,227 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+Index of plugin keys defined in plugin modules.
+
+Importing all plugin modules pulls in koji, docker_squash, osbs and
+others, so the keys of plugins defined in a module are found by parsing
+its source instead. Only modules defining requested plugins are then
+imported. The index is kept on disk and entries are refreshed whenever
+the modification time or size of a module changes.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import ast
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import six
+
+from atomic_reactor import constants
+
+
+logger = logging.getLogger(__name__)
+
+PLUGIN_INDEX_VERSION = 1
+
+
+def get_default_index_path():
+    """
+    :return: str, path to the on-disk plugin index
+    """
+    path = os.environ.get('ATOMIC_REACTOR_PLUGIN_INDEX')
+    if path:
+        return path
+
+    cache_home = (os.environ.get('XDG_CACHE_HOME') or
+                  os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(cache_home, 'atomic-reactor', 'plugin-index.json')
+
+
+def _string_value(node):
+    # ast.Str on Python 2, ast.Constant on recent Python 3
+    value = getattr(node, 'value', getattr(node, 's', None))
+    if isinstance(value, six.string_types):
+        return value
+    return None
+
+
+def get_plugin_keys(path):
+    """
+    Find keys of plugin classes defined in a module, without importing it
+
+    :param path: str, path to the module source
+    :return: list of str, keys of plugins defined in the module, None if
+             some key can't be determined without importing the module
+    """
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), path)
+
+    names = {}
+    classes = {}
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and node.module == 'atomic_reactor.constants':
+            for alias in node.names:
+                value = getattr(constants, alias.name, None)
+                if isinstance(value, six.string_types):
+                    names[alias.asname or alias.name] = value
+        elif (isinstance(node, ast.Assign) and len(node.targets) == 1 and
+                isinstance(node.targets[0], ast.Name)):
+            value = _string_value(node.value)
+            if value is not None:
+                names[node.targets[0].id] = value
+        elif isinstance(node, ast.ClassDef):
+            for statement in node.body:
+                if (isinstance(statement, ast.Assign) and
+                        any(isinstance(target, ast.Name) and target.id == 'key'
+                            for target in statement.targets)):
+                    classes[node.name] = statement.value
+
+    def resolve(value, seen):
+        key = _string_value(value)
+        if key is None and isinstance(value, ast.Name):
+            key = names.get(value.id)
+        elif (key is None and isinstance(value, ast.Attribute) and value.attr == 'key' and
+                isinstance(value.value, ast.Name) and value.value.id in classes and
+                value.value.id not in seen):
+            # key of another plugin class, e.g. key = SpamPlugin.key
+            key = resolve(classes[value.value.id], seen | {value.value.id})
+        return key
+
+    keys = []
+    for name, value in classes.items():
+        key = resolve(value, {name})
+        if key is None:
+            return None
+        keys.append(key)
+
+    return sorted(set(keys))
+
+
+class PluginIndex(object):
+    """
+    Thread-safe mapping of plugin modules to keys of plugins they define
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: str, path to the on-disk index, None to only keep it in memory
+        """
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def select_modules(self, files, plugin_keys):
+        """
+        Filter plugin modules defining any of requested plugins
+
+        :param files: list of str, paths to plugin modules
+        :param plugin_keys: iterable of str, keys of requested plugins
+        :return: list of str, paths to modules which need to be imported,
+                 in the original order
+        """
+        plugin_keys = set(plugin_keys)
+        with self._lock:
+            entries = self._get_entries(files)
+
+        selected = []
+        for f in files:
+            keys = entries[os.path.abspath(f)]['keys']
+            if keys is None or plugin_keys.intersection(keys):
+                selected.append(f)
+        return selected
+
+    def _get_entries(self, files):
+        if self._entries is None:
+            self._entries = self._load()
+
+        changed = False
+        for f in files:
+            path = os.path.abspath(f)
+            try:
+                st = os.stat(path)
+            except (IOError, OSError):
+                st = None
+            stamp = [st.st_mtime, st.st_size] if st else None
+
+            entry = self._entries.get(path)
+            if entry is not None and entry['stamp'] == stamp:
+                continue
+
+            try:
+                keys = get_plugin_keys(path)
+            except (IOError, OSError, SyntaxError, ValueError) as ex:
+                logger.debug("can't index plugin module '%s': %s", path, ex)
+                # importing it will report the problem
+                keys = None
+            self._entries[path] = {'stamp': stamp, 'keys': keys}
+            changed = True
+
+        if changed:
+            self._save()
+
+        return self._entries
+
+    def _get_constants_stamp(self):
+        # keys referencing atomic_reactor.constants are resolved when indexing
+        path = constants.__file__
+        if path.endswith(('.pyc', '.pyo')):
+            path = path[:-1]
+        try:
+            st = os.stat(path)
+        except (IOError, OSError):
+            return None
+        return [st.st_mtime, st.st_size]
+
+    def _load(self):
+        if not self.path:
+            return {}
+
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (IOError, OSError):
+            return {}
+        except ValueError:
+            logger.debug("ignoring corrupted plugin index '%s'", self.path)
+            return {}
+
+        if (not isinstance(data, dict) or
+                data.get('version') != PLUGIN_INDEX_VERSION or
+                data.get('constants') != self._get_constants_stamp()):
+            return {}
+
+        return data.get('modules', {})
+
+    def _save(self):
+        if not self.path:
+            return
+
+        data = {
+            'version': PLUGIN_INDEX_VERSION,
+            'constants': self._get_constants_stamp(),
+            'modules': self._entries,
+        }
+        try:
+            index_dir = os.path.dirname(self.path)
+            if not os.path.isdir(index_dir):
+                os.makedirs(index_dir)
+            # write to a temporary file first, so that concurrent readers
+            # never see partially written index
+            fd, tmp_path = tempfile.mkstemp(dir=index_dir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.rename(tmp_path, self.path)
+        except (IOError, OSError) as ex:
+            logger.debug("unable to store plugin index '%s': %s", self.path, ex)
+
+
+# Shared by all plugin runners in the process
+plugin_index = PluginIndex(get_default_index_path())
@@ -11,7 +11,7 @@ import subprocess
 from six import PY2
 import os
 
-from atomic_reactor.util import get_exported_image_metadata
+from atomic_reactor.util import get_exported_image_metadata, CommandResult
 from atomic_reactor.plugin import BuildStepPlugin
 from atomic_reactor.build import BuildResult
 from atomic_reactor.constants import CONTAINER_BUILDAH_BUILD_METHOD
@@ -44,23 +44,27 @@ class BuildahPlugin(BuildStepPlugin):
         ib_process = subprocess.Popen(['buildah', 'bud', '-t', image, builder.df_dir], **kwargs)
 
         self.log.debug('buildah build has begun; waiting for it to finish')
-        output = []
+        # build logs may be huge, don't keep them in memory
+        command_result = CommandResult(stream_logs=True)
+        last_line = None
         while True:
             poll = ib_process.poll()
             out = ib_process.stdout.readline()
             out = out.decode(**encoding_params) if PY2 else out
             if out:
                 self.log.info('%s', out.rstrip())
-                output.append(out)
+                command_result.append_log(out.rstrip('\n'))
+                last_line = out
             elif poll is not None:
                 break
+        command_result.finish()
 
         if ib_process.returncode != 0:
             # in the case of an apparent failure, single out the last line to
             # include in the failure summary.
-            err = output[-1] if output else "<buildah had bad exit code but no output>"
+            err = last_line or "<buildah had bad exit code but no output>"
             return BuildResult(
-                logs=output,
+                logs=command_result.logs,
                 fail_reason="image build failed (rc={}): {}".format(ib_process.returncode, err),
             )
 
@@ -77,4 +81,5 @@ class BuildahPlugin(BuildStepPlugin):
         img_metadata = get_exported_image_metadata(output_path, IMAGE_TYPE_DOCKER_ARCHIVE)
         self.workflow.exported_image_sequence.append(img_metadata)
 
-        return BuildResult(logs=output, image_id=image_id, skip_layer_squash=True)
+        return BuildResult(logs=command_result.logs, image_id=image_id,
+                           skip_layer_squash=True)
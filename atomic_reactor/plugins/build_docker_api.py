@@ -44,7 +44,8 @@ class DockerApiPlugin(BuildStepPlugin):
 
         self.log.debug('build is submitted, waiting for it to finish')
         try:
-            command_result = wait_for_command(logs_gen)
+            # build logs may be huge, don't keep them in memory
+            command_result = wait_for_command(logs_gen, stream_logs=True)
         except docker.errors.APIError as ex:
             return BuildResult(logs=[], fail_reason=ex.explanation)
 
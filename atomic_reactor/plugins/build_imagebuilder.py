@@ -11,7 +11,8 @@ import subprocess
 from six import PY2
 import os
 
-from atomic_reactor.util import get_exported_image_metadata, allow_repo_dir_in_dockerignore
+from atomic_reactor.util import (get_exported_image_metadata, allow_repo_dir_in_dockerignore,
+                                 CommandResult)
 from atomic_reactor.plugin import BuildStepPlugin
 from atomic_reactor.build import BuildResult
 from atomic_reactor.constants import CONTAINER_IMAGEBUILDER_BUILD_METHOD
@@ -53,23 +54,27 @@ class ImagebuilderPlugin(BuildStepPlugin):
         ib_process = subprocess.Popen(process_args, **kwargs)
 
         self.log.debug('imagebuilder build has begun; waiting for it to finish')
-        output = []
+        # build logs may be huge, don't keep them in memory
+        command_result = CommandResult(stream_logs=True)
+        last_line = None
         while True:
             poll = ib_process.poll()
             out = ib_process.stdout.readline()
             out = out.decode(**encoding_params) if PY2 else out
             if out:
                 self.log.info('%s', out.rstrip())
-                output.append(out)
+                command_result.append_log(out.rstrip('\n'))
+                last_line = out
             elif poll is not None:
                 break
+        command_result.finish()
 
         if ib_process.returncode != 0:
             # in the case of an apparent failure, single out the last line to
             # include in the failure summary.
-            err = output[-1] if output else "<imagebuilder had bad exit code but no output>"
+            err = last_line or "<imagebuilder had bad exit code but no output>"
             return BuildResult(
-                logs=output,
+                logs=command_result.logs,
                 fail_reason="image build failed (rc={}): {}".format(ib_process.returncode, err),
             )
 
@@ -94,4 +99,5 @@ class ImagebuilderPlugin(BuildStepPlugin):
         img_metadata = get_exported_image_metadata(output_path, IMAGE_TYPE_DOCKER_ARCHIVE)
         self.workflow.exported_image_sequence.append(img_metadata)
 
-        return BuildResult(logs=output, image_id=image_id, skip_layer_squash=True)
+        return BuildResult(logs=command_result.logs, image_id=image_id,
+                           skip_layer_squash=True)
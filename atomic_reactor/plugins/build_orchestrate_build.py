@@ -15,11 +15,14 @@ import json
 from operator import attrgetter
 import time
 import logging
+import threading
 from datetime import timedelta
 import datetime as dt
 import copy
 import platform
 
+from six.moves import queue
+
 from atomic_reactor.build import BuildResult
 from atomic_reactor.plugin import BuildStepPlugin
 from atomic_reactor.plugins.pre_reactor_config import (get_config,
@@ -140,7 +143,7 @@ def wait_for_any_cluster(contexts):
         )
 
     time_until_next = earliest_retry_at - dt.datetime.now()
-    time.sleep(max(timedelta(seconds=0), time_until_next).seconds)
+    time.sleep(max(timedelta(seconds=0), time_until_next).total_seconds())
 
 
 class WorkerBuildInfo(object):
@@ -154,18 +157,42 @@ class WorkerBuildInfo(object):
 
         self.monitor_exception = None
 
+        # time.time() at which the build was created, started running and finished
+        self.created_at = time.time() if build else None
+        self.started_at = None
+        self.finished_at = None
+
     @property
     def name(self):
         return self.build.get_build_name() if self.build else 'N/A'
 
     def wait_to_finish(self):
         self.build = self.osbs.wait_for_build_to_finish(self.name)
+        self.finished_at = time.time()
         return self.build
 
     def watch_logs(self):
         for line in self.osbs.get_build_logs(self.name, follow=True, decode=True):
+            if self.started_at is None:
+                # logs are only available once the build pod is running
+                self.started_at = time.time()
             self.log.info(line)
 
+    def get_metrics(self):
+        """
+        :return: dict, seconds the build was waiting to be scheduled ('queue_time')
+                 and running ('build_time'), None if not known
+        """
+        metrics = {'queue_time': None, 'build_time': None}
+        if self.created_at is not None and self.started_at is not None:
+            metrics['queue_time'] = self.started_at - self.created_at
+        if self.started_at is not None and self.finished_at is not None:
+            metrics['build_time'] = self.finished_at - self.started_at
+        return metrics
+
+    def is_failed(self):
+        return not self.build or not self.build.is_succeeded()
+
     def get_annotations(self):
         build_annotations = self.build.get_annotations() or {}
         annotations = {
@@ -235,7 +262,8 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
 
     If any of the worker builds fail, this plugin will return a
     failed BuildResult. Although, it does wait for all worker builds
-    to complete in any case.
+    to complete in any case. With fail_fast, remaining worker builds
+    are cancelled as soon as any of them fails.
 
     If all worker builds succeed, then this plugin returns a
     successful BuildResult, but with a remote image result. The
@@ -260,7 +288,7 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
                  failure_retry_delay=FAILURE_RETRY_DELAY,
                  max_cluster_fails=MAX_CLUSTER_FAILS,
                  url=None, verify_ssl=True, use_auth=True,
-                 goarch=None):
+                 goarch=None, fail_fast=False):
         """
         constructor
 
@@ -278,6 +306,7 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
         :param max_cluster_fails: the maximum number of times a cluster can fail before being
                                   ignored
         :param goarch: dict, keys are platform, values are go language platform names
+        :param fail_fast: bool, cancel all worker builds once any of them fails
         """
         super(OrchestrateBuildPlugin, self).__init__(tasker, workflow)
         self.platforms = get_platforms(self.workflow)
@@ -313,7 +342,13 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
         if worker_build_image:
             self.log.warning('worker_build_image is deprecated')
 
+        self.fail_fast = fail_fast
         self.worker_builds = []
+        # reason for cancelling worker builds, set when they are being cancelled
+        self._cancel_reason = None
+        self._worker_builds_lock = threading.Lock()
+        # (platform, exception) for each platform whose worker build finished
+        self._worker_build_events = queue.Queue()
         self.namespace = get_build_json().get('metadata', {}).get('namespace', None)
         self.build_image_digests = {}  # by platform
         self._openshift_session = None
@@ -587,6 +622,13 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
         override_kwargs = workspace.get(WORKSPACE_KEY_OVERRIDE_KWARGS, {})
 
         build = None
+        if self._cancel_reason:
+            self.log.info('%s - not creating worker build: %s', cluster_info.platform,
+                          self._cancel_reason)
+            build_info = WorkerBuildInfo(build=None, cluster_info=cluster_info, logger=self.log)
+            build_info.monitor_exception = self._cancel_reason
+            self._add_worker_build(build_info)
+            return
 
         try:
             worker_openshift = {
@@ -619,7 +661,10 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
                                cluster_info.platform)
 
         build_info = WorkerBuildInfo(build=build, cluster_info=cluster_info, logger=self.log)
-        self.worker_builds.append(build_info)
+        cancel_reason = self._add_worker_build(build_info)
+        if cancel_reason and build_info.build:
+            # created while other worker builds were being cancelled
+            self._cancel_worker_build(build_info, cancel_reason)
 
         if build_info.build:
             try:
@@ -639,6 +684,81 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
                 except OsbsException:
                     pass
 
+    def _add_worker_build(self, build_info):
+        """
+        :return: str, reason for cancelling worker builds, None if not cancelled
+        """
+        with self._worker_builds_lock:
+            self.worker_builds.append(build_info)
+            return self._cancel_reason
+
+    def _cancel_worker_build(self, build_info, reason):
+        build_info.monitor_exception = reason
+        try:
+            build_info.cancel_build()
+        except OsbsException:
+            build_info.log.warning('failed to cancel worker build %s', build_info.name,
+                                   exc_info=True)
+
+    def cancel_other_worker_builds(self, failed_build_info):
+        """
+        Cancel all worker builds except for the one which failed
+
+        Worker builds not created yet won't be created at all.
+        """
+        reason = 'cancelled, worker build for platform {} failed'.format(
+            failed_build_info.platform)
+        with self._worker_builds_lock:
+            self._cancel_reason = reason
+            worker_builds = [build_info for build_info in self.worker_builds
+                             if build_info is not failed_build_info]
+
+        self.log.info('fail_fast: cancelling worker builds for other platforms')
+        for build_info in worker_builds:
+            if build_info.build and not build_info.build.is_finished():
+                self._cancel_worker_build(build_info, reason)
+
+    def build_platform(self, platform):
+        """
+        Start and monitor worker build for platform, report when it's finished
+        """
+        try:
+            self.select_and_start_cluster(platform)
+        except Exception as ex:
+            self._worker_build_events.put((platform, ex))
+        else:
+            self._worker_build_events.put((platform, None))
+
+    def wait_for_worker_builds(self):
+        """
+        Wait until worker builds for all platforms finish
+
+        Worker builds are handled as soon as they finish, regardless of
+        their order. With fail_fast, the first failed worker build causes
+        all other worker builds to be cancelled.
+        """
+        remaining = set(self.platforms)
+        while remaining:
+            try:
+                # the timeout makes sure signals are handled on Python 2
+                platform, exc = self._worker_build_events.get(timeout=1)
+            except queue.Empty:
+                continue
+
+            remaining.discard(platform)
+            if exc is not None:
+                raise exc
+
+            build_info = [build_info for build_info in self.worker_builds
+                          if build_info.platform == platform][-1]
+            if not build_info.is_failed():
+                self.log.info('%s - worker build %s succeeded', platform, build_info.name)
+                continue
+
+            self.log.warning('%s - worker build %s failed', platform, build_info.name)
+            if self.fail_fast and remaining and not self._cancel_reason:
+                self.cancel_other_worker_builds(build_info)
+
     def select_and_start_cluster(self, platform):
         ''' Choose a cluster and start a build on it '''
 
@@ -664,7 +784,7 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
                                              cluster_info=cluster,
                                              logger=self.log)
                 build_info.monitor_exception = str(ex)
-                self.worker_builds.append(build_info)
+                self._add_worker_build(build_info)
                 return
 
             for cluster_info in possible_cluster_info:
@@ -858,29 +978,43 @@ class OrchestrateBuildPlugin(BuildStepPlugin):
         self.set_build_image()
 
         thread_pool = ThreadPool(len(self.platforms))
-        result = thread_pool.map_async(self.select_and_start_cluster, self.platforms)
+        for build_platform in self.platforms:
+            thread_pool.apply_async(self.build_platform, (build_platform,))
+        thread_pool.close()
 
         try:
-            result.get()
+            self.wait_for_worker_builds()
         # Always clean up worker builds on any error to avoid
         # runaway worker builds (includes orchestrator build cancellation)
         except Exception:
-            thread_pool.terminate()
             self.log.info('build cancelled, cancelling worker builds')
-            if self.worker_builds:
-                ThreadPool(len(self.worker_builds)).map(
-                    lambda bi: bi.cancel_build(), self.worker_builds)
-            while not result.ready():
-                result.wait(1)
+            with self._worker_builds_lock:
+                self._cancel_reason = 'build cancelled'
+                worker_builds = list(self.worker_builds)
+            if worker_builds:
+                cancel_pool = ThreadPool(len(worker_builds))
+                try:
+                    cancel_pool.map(lambda bi: bi.cancel_build(), worker_builds)
+                finally:
+                    cancel_pool.close()
+                    cancel_pool.join()
             raise
-        else:
-            thread_pool.close()
+        finally:
             thread_pool.join()
 
-        annotations = {'worker-builds': {
-            build_info.platform: build_info.get_annotations()
-            for build_info in self.worker_builds if build_info.build
-        }}
+        metrics = {}
+        for build_info in self.worker_builds:
+            metrics[build_info.platform] = build_info.get_metrics()
+            self.log.debug('%s - worker build metrics: %s', build_info.platform,
+                           metrics[build_info.platform])
+
+        annotations = {
+            'worker-builds': {
+                build_info.platform: build_info.get_annotations()
+                for build_info in self.worker_builds if build_info.build
+            },
+            'worker-build-metrics': metrics,
+        }
 
         self._apply_repositories(annotations)
 
@@ -9,6 +9,7 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import unicode_literals, absolute_import
 
 import copy
+from functools import partial
 import json
 import koji
 import os
@@ -44,14 +45,15 @@ from atomic_reactor.constants import (
     PLUGIN_VERIFY_MEDIA_KEY,
     PLUGIN_PUSH_OPERATOR_MANIFESTS_KEY,
     METADATA_TAG, OPERATOR_MANIFESTS_ARCHIVE,
-    KOJI_BTYPE_OPERATOR_MANIFESTS,
+    KOJI_BTYPE_OPERATOR_MANIFESTS, KOJI_UPLOAD_MAX_WORKERS,
 )
 from atomic_reactor.util import (Output, get_build_json,
                                  df_parser, ImageName, get_primary_images,
                                  get_floating_images, get_unique_images,
                                  get_manifest_media_type,
                                  get_digests_map_from_annotations, is_scratch_build)
-from atomic_reactor.koji_util import (KojiUploadLogger, get_koji_task_owner)
+from atomic_reactor.koji_util import (KojiUploadLogger, get_koji_task_owner, upload_file,
+                                      upload_outputs)
 from atomic_reactor.plugins.pre_reactor_config import get_koji_session, get_koji
 from osbs.utils import Labels
 
@@ -86,7 +88,7 @@ class KojiImportPlugin(ExitPlugin):
                  koji_ssl_certs=None, koji_proxy_user=None,
                  koji_principal=None, koji_keytab=None,
                  blocksize=None,
-                 target=None, poll_interval=5):
+                 target=None, poll_interval=5, max_workers=KOJI_UPLOAD_MAX_WORKERS):
         """
         constructor
 
@@ -103,6 +105,7 @@ class KojiImportPlugin(ExitPlugin):
         :param blocksize: int, blocksize to use for uploading files
         :param target: str, koji target
         :param poll_interval: int, seconds between Koji task status requests
+        :param max_workers: int, max number of files uploaded at the same time
         """
         super(KojiImportPlugin, self).__init__(tasker, workflow)
 
@@ -125,6 +128,7 @@ class KojiImportPlugin(ExitPlugin):
         self.blocksize = blocksize
         self.target = target
         self.poll_interval = poll_interval
+        self.max_workers = max_workers
 
         self.osbs = get_openshift_session(self.workflow, self.openshift_fallback)
         self.build_id = None
@@ -495,15 +499,14 @@ class KojiImportPlugin(ExitPlugin):
         self.log.debug("uploading %r to %r as %r",
                        output.file.name, serverdir, name)
 
-        kwargs = {}
         if self.blocksize is not None:
-            kwargs['blocksize'] = self.blocksize
             self.log.debug("using blocksize %d", self.blocksize)
 
-        upload_logger = KojiUploadLogger(self.log)
-        session.uploadWrapper(output.file.name, serverdir, name=name,
-                              callback=upload_logger.callback, **kwargs)
-        path = os.path.join(serverdir, name)
+        upload_logger = KojiUploadLogger(self.log, name=name)
+        path = upload_file(session, output.file.name, serverdir, name=name,
+                           callback=upload_logger.callback, blocksize=self.blocksize,
+                           checksum=output.metadata.get('checksum'),
+                           checksum_type=output.metadata.get('checksum_type'))
         self.log.debug("uploaded %r", path)
         return path
 
@@ -556,9 +559,9 @@ class KojiImportPlugin(ExitPlugin):
             return
 
         try:
-            for output in output_files:
-                if output.file:
-                    self.upload_file(self.session, output, server_dir)
+            upload_outputs(self.session, output_files,
+                           partial(self.upload_file, serverdir=server_dir),
+                           max_workers=self.max_workers)
         finally:
             for output in output_files:
                 if output.file:
@@ -152,14 +152,16 @@ class KojiPromotePlugin(ExitPlugin):
 
         return parse_rpm_output(output, tags)
 
-    def get_output_metadata(self, path, filename):
+    def get_output_metadata(self, path, filename, checksums=None):
         """
         Describe a file by its metadata.
 
+        :param checksums: dict, already known checksums of the file
         :return: dict
         """
 
-        checksums = get_checksums(path, ['md5'])
+        if not checksums or 'md5sum' not in checksums:
+            checksums = get_checksums(path, ['md5'])
         metadata = {'filename': filename,
                     'filesize': os.path.getsize(path),
                     'checksum': checksums['md5sum'],
@@ -272,7 +274,9 @@ class KojiPromotePlugin(ExitPlugin):
         docker_logs = NamedTemporaryFile(prefix="docker-%s" % self.build_id,
                                          suffix=".log",
                                          mode='wb')
-        docker_logs.write("\n".join(self.workflow.build_result.logs).encode('utf-8'))
+        # written line by line, logs may be streamed from disk
+        for line in self.workflow.build_result.logs:
+            docker_logs.write(line.encode('utf-8') + b'\n')
         docker_logs.flush()
         output.append(Output(file=docker_logs,
                              metadata=self.get_output_metadata(docker_logs.name,
@@ -308,15 +312,18 @@ class KojiPromotePlugin(ExitPlugin):
 
         """
 
-        saved_image = self.workflow.exported_image_sequence[-1].get('path')
-        image_name = get_image_upload_filename(self.workflow.exported_image_sequence[-1],
+        image_metadata = self.workflow.exported_image_sequence[-1]
+        saved_image = image_metadata.get('path')
+        image_name = get_image_upload_filename(image_metadata,
                                                self.workflow.builder.image_id,
                                                arch)
         if self.metadata_only:
             metadata = self.get_output_metadata(os.path.devnull, image_name)
             output = Output(file=None, metadata=metadata)
         else:
-            metadata = self.get_output_metadata(saved_image, image_name)
+            md5sum = image_metadata.get('md5sum')
+            checksums = {'md5sum': md5sum} if md5sum else None
+            metadata = self.get_output_metadata(saved_image, image_name, checksums=checksums)
             output = Output(file=open(saved_image), metadata=metadata)
 
         return metadata, output
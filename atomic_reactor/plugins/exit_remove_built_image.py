@@ -10,12 +10,35 @@ Remove built image (this only makes sense if you store the image in some registr
 """
 from __future__ import absolute_import
 
+import json
+import logging
+import os
+import subprocess
+import sys
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+from atomic_reactor.constants import REMOVE_IMAGES_MAX_WORKERS
 from atomic_reactor.plugin import ExitPlugin
 
 from docker.errors import APIError
 
 __all__ = ('GarbageCollectionPlugin', )
 
+logger = logging.getLogger(__name__)
+
+# run by a detached process, see GarbageCollectionPlugin.start_reaper
+REAPER_SCRIPT = """
+import json
+import sys
+
+from atomic_reactor.core import DockerTasker
+from atomic_reactor.plugins.exit_remove_built_image import remove_images
+
+args = json.loads(sys.argv[1])
+remove_images(DockerTasker(args['base_url']), args['images'], args['max_workers'])
+"""
+
 
 def defer_removal(workflow, image):
     key = GarbageCollectionPlugin.key
@@ -25,46 +48,158 @@ def defer_removal(workflow, image):
     workspace['images_to_remove'].add(image)
 
 
+def remove_image(tasker, image, force=False, log=logger):
+    try:
+        tasker.remove_image(image, force=force)
+    except APIError as ex:
+        if ex.is_client_error():
+            log.warning("failed to remove image %s (%s: %s), ignoring",
+                        image, ex.response.status_code, ex.response.reason)
+        else:
+            raise
+    except Exception as ex:
+        log.warning("exception while removing image %s: %r, ignoring",
+                    image, ex)
+
+
+def group_removals(tasker, images, max_workers=REMOVE_IMAGES_MAX_WORKERS, log=logger):
+    """
+    Group images to remove by their IDs
+
+    Forced removal of an image ID also removes all its tags, so once the
+    ID itself is removed by force, removing its tags is only a waste of
+    time. Other tags of one image have to be removed one by one.
+
+    :param tasker: ContainerTasker instance
+    :param images: list of (image, force) tuples
+    :param max_workers: int, max number of images inspected concurrently
+    :return: list of lists of (image, force) tuples, one list per image ID
+    """
+    forced = OrderedDict()
+    for image, force in images:
+        forced[image] = forced.get(image, False) or force
+
+    def get_image_id(image):
+        try:
+            return tasker.inspect_image(image)['Id']
+        except Exception as ex:
+            # let the removal report it
+            log.debug("failed to inspect image %s: %r", image, ex)
+            return None
+
+    names = list(forced)
+    pool = ThreadPool(min(max_workers, len(names)))
+    try:
+        image_ids = pool.map(get_image_id, names)
+    finally:
+        pool.close()
+        pool.join()
+
+    groups = OrderedDict()
+    for name, image_id in zip(names, image_ids):
+        groups.setdefault(image_id or name, []).append(name)
+
+    removals = []
+    for image_id, group in groups.items():
+        forced_ids = [name for name in group
+                      if forced[name] and image_id in (str(name), 'sha256:%s' % name)]
+        if forced_ids:
+            removals.append([(forced_ids[0], True)])
+        else:
+            removals.append([(name, forced[name]) for name in group])
+    return removals
+
+
+def remove_images(tasker, images, max_workers=REMOVE_IMAGES_MAX_WORKERS, log=logger):
+    """
+    Remove images concurrently, each image ID only once
+
+    :param tasker: ContainerTasker instance
+    :param images: list of (image, force) tuples
+    :param max_workers: int, max number of images removed concurrently
+    :param log: logger to report ignored failures to
+    """
+    if not images:
+        return
+
+    removals = group_removals(tasker, images, max_workers, log)
+
+    def remove_group(group):
+        try:
+            for image, force in group:
+                remove_image(tasker, image, force=force, log=log)
+        except Exception as ex:
+            return ex
+
+    pool = ThreadPool(min(max_workers, len(removals)))
+    try:
+        errors = pool.map(remove_group, removals)
+    finally:
+        pool.close()
+        pool.join()
+
+    for error in errors:
+        if error is not None:
+            raise error
+
+
 class GarbageCollectionPlugin(ExitPlugin):
     key = "remove_built_image"
 
-    def __init__(self, tasker, workflow, remove_pulled_base_image=True):
+    def __init__(self, tasker, workflow, remove_pulled_base_image=True,
+                 max_workers=REMOVE_IMAGES_MAX_WORKERS, background=False):
         """
         constructor
 
         :param tasker: ContainerTasker instance
         :param workflow: DockerBuildWorkflow instance
         :param remove_pulled_base_image: bool, remove also base image? default=True
+        :param max_workers: int, max number of images removed concurrently
+        :param background: bool, leave the removal to a detached process and
+                           don't wait for it to finish
         """
         # call parent constructor
         super(GarbageCollectionPlugin, self).__init__(tasker, workflow)
         self.remove_base_image = remove_pulled_base_image
+        self.max_workers = max_workers
+        self.background = background
 
     def run(self):
+        images = []
         image = self.workflow.builder.image_id
         if image:
-            self.remove_image(image, force=True)
+            images.append((image, True))
 
         if self.remove_base_image and self.workflow.pulled_base_images:
             # FIXME: we may need to add force here, let's try it like this for now
             # FIXME: when ID of pulled img matches an ID of an image already present, don't remove
             for base_image_tag in self.workflow.pulled_base_images:
-                self.remove_image(base_image_tag, force=False)
+                images.append((base_image_tag, False))
 
         workspace = self.workflow.plugin_workspace.get(self.key, {})
         images_to_remove = workspace.get('images_to_remove', [])
         for image in images_to_remove:
-            self.remove_image(image, force=True)
+            images.append((image, True))
 
-    def remove_image(self, image, force=False):
-        try:
-            self.tasker.remove_image(image, force=force)
-        except APIError as ex:
-            if ex.is_client_error():
-                self.log.warning("failed to remove image %s (%s: %s), ignoring",
-                                 image, ex.response.status_code, ex.response.reason)
-            else:
-                raise
-        except Exception as ex:
-            self.log.warning("exception while removing image %s: %r, ignoring",
-                             image, ex)
+        if self.background and images:
+            self.start_reaper(images)
+        else:
+            remove_images(self.tasker, images, self.max_workers, self.log)
+
+    def start_reaper(self, images):
+        """
+        Remove images in a detached process
+
+        :param images: list of (image, force) tuples
+        """
+        args = {
+            'base_url': getattr(self.tasker, 'base_url', None),
+            # tags may be ImageName instances
+            'images': [(str(image), force) for image, force in images],
+            'max_workers': self.max_workers,
+        }
+        with open(os.devnull, 'r+') as devnull:
+            process = subprocess.Popen([sys.executable, '-c', REAPER_SCRIPT, json.dumps(args)],
+                                       stdin=devnull, stdout=devnull, stderr=devnull,
+                                       close_fds=True, preexec_fn=os.setsid)
+        self.log.info("removing %d images in background process %s", len(images), process.pid)
@@ -25,6 +25,7 @@ from atomic_reactor.constants import (PLUGIN_KOJI_IMPORT_PLUGIN_KEY,
                                       PLUGIN_RESOLVE_REMOTE_SOURCE,
                                       SCRATCH_FROM)
 from atomic_reactor.plugin import ExitPlugin
+from atomic_reactor.registry_cache import registry_cache
 from atomic_reactor.util import get_build_json
 
 
@@ -155,6 +156,8 @@ class StoreMetadataInOSv3Plugin(ExitPlugin):
             "errors": self.workflow.plugins_errors,
             "timestamps": self.workflow.plugins_timestamps,
             "durations": self.workflow.plugins_durations,
+            "resources": self.workflow.plugins_resources,
+            "registry_cache": registry_cache.get_stats(),
         }
 
     def get_filesystem_metadata(self):
@@ -18,36 +18,67 @@ from atomic_reactor.constants import (PLUGIN_COMPARE_COMPONENTS_KEY,
 T_RPM = "rpm"
 SUPPORTED_TYPES = (T_RPM,)
 
+# fields which have to be the same for a component on all platforms
+COMPARED_FIELDS = {
+    T_RPM: ('version', 'release', 'signature'),
+}
 
-def filter_components_by_name(name, components_list, type_=T_RPM):
-    """Generator filters components from components_list by name"""
-    for components in components_list:
+
+def compare_components(components_by_platform, exceptions=()):
+    """
+    Find components which differ between platforms
+
+    All components are indexed by type and name in a single pass, then each
+    group is compared once.
+
+    :param components_by_platform: dict, platform name mapped to its list
+                                   of components
+    :param exceptions: iterable of str, names of components not to compare
+    :return: dict, (type, name) of each mismatching component mapped to a
+             dict of the platforms having it, each mapped to the list of its
+             components there (e.g. several arches of a multilib package)
+    """
+    exceptions = frozenset(exceptions)
+    index = {}
+    for platform, components in components_by_platform.items():
         for component in components:
-            if component['type'] == type_ and component['name'] == name:
-                yield component
+            name = component['name']
+            if name in exceptions:
+                continue
+
+            t = component['type']
+            if t not in SUPPORTED_TYPES:
+                raise ValueError("Type %s not supported" % t)
+
+            group = index.setdefault((t, name), {})
+            group.setdefault(platform, []).append(component)
+
+    mismatches = {}
+    for identifier, group in index.items():
+        if len(group) < 2:
+            continue
+
+        fields = COMPARED_FIELDS[identifier[0]]
+        values = set(tuple(component[field] for field in fields)
+                     for components in group.values() for component in components)
+        if len(values) > 1:
+            mismatches[identifier] = group
+
+    return mismatches
 
 
 class CompareComponentsPlugin(PostBuildPlugin):
     """
     Compare components from each worker build and verify the same version was
     on each worker.
+
+    Mismatches found are stored in the plugin workspace under 'mismatches',
+    in the format returned by compare_components().
     """
 
     key = PLUGIN_COMPARE_COMPONENTS_KEY
     is_allowed_to_fail = False
 
-    def rpm_compare(self, a, b):
-        """
-        Compare rpm component version 'a' with 'b'.
-        'name' is implied equal as it is the key() lookup
-        """
-        if a['version'] == b['version'] and \
-           a['release'] == b['release'] and \
-           a['signature'] == b['signature']:
-            return
-
-        raise ValueError("%s != %s" % (a, b))
-
     def get_component_list_from_workers(self, worker_metadatas):
         """
         Find the component lists from each worker build.
@@ -61,9 +92,9 @@ class CompareComponentsPlugin(PostBuildPlugin):
 
         Reference plugin post_koji_upload for details on how this is created.
 
-        :return: list of component lists
+        :return: dict, platform name mapped to its list of components
         """
-        comp_list = []
+        comp_list = {}
         for platform in sorted(worker_metadatas.keys()):
             for instance in worker_metadatas[platform]['output']:
                 if instance['type'] == 'docker-image':
@@ -73,16 +104,16 @@ class CompareComponentsPlugin(PostBuildPlugin):
                         )
                         continue
 
-                    comp_list.append(instance['components'])
+                    comp_list[platform] = instance['components']
 
         return comp_list
 
-    def log_rpm_component(self, component, loglevel=logging.WARNING):
+    def log_rpm_component(self, platform, component, loglevel=logging.WARNING):
         assert component['type'] == T_RPM
         self.log.log(
             loglevel,
             "%s: %s-%s-%s (%s)",  # platform: name-version-release (signature)
-            component['arch'], component['name'], component['version'],
+            platform, component['name'], component['version'],
             component['release'], component['signature']
         )
 
@@ -101,59 +132,23 @@ class CompareComponentsPlugin(PostBuildPlugin):
             raise ValueError("No components to compare")
 
         package_comparison_exceptions = get_package_comparison_exceptions(self.workflow)
-
-        # master compare list
-        master_comp = {}
-
-        # The basic strategy is to start with empty lists and add new component
-        # versions as we find them.  Upon next iteration, we should notice
-        # duplicates and be able to compare them.  If the match fails, we raise
-        # an exception.  If the component name does not exist, assume it was an
-        # arch dependency, add it to list and continue.  By the time we get to
-        # the last arch, we should have every possible component in the master
-        # list to compare with.
-
-        # Keep everything separated by component type
-        failed_components = set()
-        for components in comp_list:
-            for component in components:
-                t = component['type']
-                name = component['name']
-
-                if name in package_comparison_exceptions:
-                    self.log.info("Ignoring comparison of package %s", name)
-                    continue
-
-                if t not in SUPPORTED_TYPES:
-                    raise ValueError("Type %s not supported" % t)
-
-                if name in failed_components:
-                    # report a failed component only once
-                    continue
-
-                identifier = (t, name)
-                if identifier not in master_comp:
-                    master_comp[identifier] = component
-                    continue
-
-                if t == T_RPM:
-                    mc = master_comp[identifier]
-                    try:
-                        self.rpm_compare(mc, component)
-                    except ValueError as ex:
-                        self.log.debug("Mismatch details: %s", ex)
-                        self.log.warning(
-                            "Comparison mismatch for component %s:", name)
-
-                        # use all components to provide complete list
-                        for comp in filter_components_by_name(name, comp_list):
-                            self.log_rpm_component(comp)
-                        failed_components.add(name)
-
-        if failed_components:
+        for name in sorted(package_comparison_exceptions):
+            self.log.info("Ignoring comparison of package %s", name)
+
+        mismatches = compare_components(comp_list, package_comparison_exceptions)
+        for (t, name), group in sorted(mismatches.items()):
+            self.log.warning("Comparison mismatch for component %s:", name)
+            if t == T_RPM:
+                for platform, components in sorted(group.items()):
+                    for component in components:
+                        self.log_rpm_component(platform, component)
+
+        if mismatches:
+            # the plugin fails, keep the details for plugins run later
+            self.workflow.plugin_workspace.setdefault(self.key, {})['mismatches'] = mismatches
             raise ValueError(
                 "Failed component comparison for components: "
                 "{components}".format(
-                    components=', '.join(sorted(failed_components))
+                    components=', '.join(sorted(name for _, name in mismatches))
                 )
             )
@@ -8,19 +8,13 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import absolute_import, division
 
-import gzip
-try:
-    # if we import "lzma" first, we get pyliblzma on Py2, but we want backports.lzma
-    #  so first try to import backports.lzma on Py2 and then 'lzma' on Py3
-    from backports import lzma
-except ImportError:
-    import lzma
 import os
 
+from atomic_reactor.compress_util import COMPRESSION_METHOD_EXTENSIONS, open_compressed
 from atomic_reactor.constants import (EXPORTED_COMPRESSED_IMAGE_NAME_TEMPLATE,
                                       IMAGE_TYPE_DOCKER_ARCHIVE)
 from atomic_reactor.plugin import PostBuildPlugin
-from atomic_reactor.util import get_exported_image_metadata, human_size
+from atomic_reactor.util import ChecksumWriter, get_exported_image_metadata, human_size
 
 
 class CompressPlugin(PostBuildPlugin):
@@ -30,52 +24,68 @@ class CompressPlugin(PostBuildPlugin):
             "name": "compress",
             "args": {
                     "method": "gzip",
-                    "load_exported_image": true
+                    "load_exported_image": true,
+                    "threads": 4,
+                    "level": 6
             }
     }]
 
     Currently supported compression methods are gzip and lzma; gzip is default.
     By default, the plugin doesn't work on exported image, you have to explicitly
     ask for it by using `load_exported_image: true`.
+
+    With `threads` greater than 1 the image is split into blocks which are
+    compressed in parallel; the output is still a standard gzip/xz file,
+    made of several independently compressed members. `threads: 0` uses one
+    thread per CPU.
     """
     key = 'compress'
     is_allowed_to_fail = False
 
     # TODO: add remove_former_image?
-    def __init__(self, tasker, workflow, load_exported_image=False, method='gzip'):
+    def __init__(self, tasker, workflow, load_exported_image=False, method='gzip',
+                 threads=1, level=None):
         """
         :param tasker: ContainerTasker instance
         :param workflow: DockerBuildWorkflow instance
         :param load_exported_image: bool, when running squash plugin with `dont_load=True`,
                                     you may load the exported tar with this switch
+        :param method: str, compression method, 'gzip' or 'lzma'
+        :param threads: int, number of compression threads, 0 for one per CPU
+        :param level: int, compression level, 6 by default
         """
         super(CompressPlugin, self).__init__(tasker, workflow)
         self.load_exported_image = load_exported_image
         self.method = method
+        self.threads = threads
+        self.level = level
         self.uncompressed_size = 0
+        self.checksums = None
         self.source_build = bool(self.workflow.build_result.oci_image_path)
 
     def _compress_image_stream(self, stream):
-        outfile = os.path.join(self.workflow.source.workdir,
-                               EXPORTED_COMPRESSED_IMAGE_NAME_TEMPLATE)
-        if self.method == 'gzip':
-            outfile = outfile.format('gz')
-            fp = gzip.open(outfile, 'wb', compresslevel=6)
-        elif self.method == 'lzma':
-            outfile = outfile.format('xz')
-            fp = lzma.open(outfile, 'wb')
-        else:
+        try:
+            extension = COMPRESSION_METHOD_EXTENSIONS[self.method]
+        except KeyError:
             raise RuntimeError('Unsupported compression format {0}'.format(self.method))
+        outfile = os.path.join(self.workflow.source.workdir,
+                               EXPORTED_COMPRESSED_IMAGE_NAME_TEMPLATE.format(extension))
 
         _chunk_size = 1024**2  # 1 MB chunk size for reading/writing
-        self.log.info('compressing image %s to %s using %s method',
-                      self.workflow.image, outfile, self.method)
-        data = stream.read(_chunk_size)
-        while data != b'':
-            fp.write(data)
-            data = stream.read(_chunk_size)
-
-        self.uncompressed_size = stream.tell()
+        self.log.info('compressing image %s to %s using %s method (threads: %s)',
+                      self.workflow.image, outfile, self.method, self.threads)
+        # Checksums of the compressed image are computed as it is written,
+        # so that the (possibly huge) file doesn't need to be read again
+        with ChecksumWriter(outfile, ['md5', 'sha256']) as raw_fp:
+            with open_compressed(outfile, self.method, threads=self.threads,
+                                 level=self.level, fileobj=raw_fp) as fp:
+                data = stream.read(_chunk_size)
+                while data != b'':
+                    fp.write(data)
+                    self.uncompressed_size += len(data)
+                    data = stream.read(_chunk_size)
+
+        self.checksums = raw_fp.checksums
 
         return outfile
 
@@ -96,7 +106,7 @@ class CompressPlugin(PostBuildPlugin):
             self.log.info('fetching image %s from docker', image)
             with self.tasker.get_image(image) as image_stream:
                 outfile = self._compress_image_stream(image_stream)
-        metadata = get_exported_image_metadata(outfile, image_type)
+        metadata = get_exported_image_metadata(outfile, image_type, checksums=self.checksums)
 
         if self.uncompressed_size != 0:
             metadata['uncompressed_size'] = self.uncompressed_size
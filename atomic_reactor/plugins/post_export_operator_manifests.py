@@ -8,16 +8,21 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import absolute_import
 
+import io
+import json
 import os
-import shutil
+import posixpath
 import tarfile
 import tempfile
+import time
 import zipfile
 
 from atomic_reactor.constants import (PLUGIN_EXPORT_OPERATOR_MANIFESTS_KEY,
-                                      OPERATOR_MANIFESTS_ARCHIVE)
+                                      OPERATOR_MANIFESTS_ARCHIVE, OPERATOR_MANIFESTS_MAX_SIZE,
+                                      WHITEOUT_OPAQUE, WHITEOUT_PREFIX)
 from atomic_reactor.plugin import PostBuildPlugin
-from atomic_reactor.util import is_scratch_build, has_operator_manifest
+from atomic_reactor.util import (is_scratch_build, has_operator_manifest, open_image_archive,
+                                 StreamAdapter)
 from docker.errors import APIError
 from platform import machine
 
@@ -25,6 +30,67 @@ MANIFESTS_DIR_NAME = 'manifests'
 IMG_MANIFESTS_PATH = os.path.join('/', MANIFESTS_DIR_NAME)
 
 
+def get_manifest_path(path):
+    """
+    :param path: str, path in image filesystem or in archive of the manifests directory
+    :return: str, path relative to the manifests directory, None if it's outside of it
+    """
+    path = posixpath.normpath(path.lstrip('/'))
+    prefix = MANIFESTS_DIR_NAME + '/'
+    if path.startswith(prefix):
+        return path[len(prefix):]
+    return None
+
+
+def read_layer_manifests(layer, max_size):
+    """
+    Read operator manifest files changed by an image layer
+
+    :param layer: file-like object, layer tarball
+    :param max_size: int, max total size of the files
+    :return: tuple (removed, files); removed is a list of str, paths relative
+             to the manifests directory removed by whiteouts ('' for all of
+             them); files is a dict, paths relative to the manifests
+             directory mapped to (TarInfo, bytes) tuples
+    """
+    removed = []
+    files = {}
+    size = 0
+    with tarfile.open(fileobj=layer, mode='r|*') as tar:
+        for member in tar:
+            path = posixpath.normpath(member.name.lstrip('/'))
+            dirname, basename = posixpath.split(path)
+            if path == MANIFESTS_DIR_NAME and not member.isdir():
+                removed.append('')
+                continue
+
+            if basename.startswith(WHITEOUT_PREFIX):
+                if basename == WHITEOUT_OPAQUE:
+                    target = dirname
+                else:
+                    target = posixpath.join(dirname, basename[len(WHITEOUT_PREFIX):])
+                if target == MANIFESTS_DIR_NAME:
+                    removed.append('')
+                elif get_manifest_path(target):
+                    removed.append(get_manifest_path(target))
+                continue
+
+            manifest_path = get_manifest_path(path)
+            if not manifest_path or member.isdir():
+                continue
+
+            if member.isfile():
+                size += member.size
+                if size > max_size:
+                    raise RuntimeError('Operator manifests exceed maximum size of {} bytes'
+                                       .format(max_size))
+                files[manifest_path] = (member, tar.extractfile(member).read())
+            else:
+                files[manifest_path] = (member, None)
+
+    return removed, files
+
+
 class ExportOperatorManifestsPlugin(PostBuildPlugin):
     """
     Export operator manifest files
@@ -79,13 +145,46 @@ class ExportOperatorManifestsPlugin(PostBuildPlugin):
             return
 
         manifests_archive_dir = tempfile.mkdtemp()
-        image = self.workflow.image
-        # As in flatpak_create_oci, we specify command to prevent possible docker daemon errors.
-        container_dict = self.tasker.create_container(image, command=['/bin/bash'])
-        container_id = container_dict['Id']
+        manifests_zipfile_path = os.path.join(manifests_archive_dir, OPERATOR_MANIFESTS_ARCHIVE)
+
+        container_id = None
+        try:
+            # As in flatpak_create_oci, we specify command to prevent possible docker daemon
+            # errors.
+            container_dict = self.tasker.create_container(self.workflow.image,
+                                                          command=['/bin/bash'])
+        except Exception as ex:
+            self.log.warning('Could not create container from image, reading operator '
+                             'manifests from image layers: %s', ex)
+            manifests = self.iter_image_manifests()
+        else:
+            container_id = container_dict['Id']
+            manifests = self.iter_container_manifests(container_id)
+
         try:
-            bits, _ = self.tasker.get_archive(container_id,
-                                              IMG_MANIFESTS_PATH)
+            self.archive_manifests(manifests, manifests_zipfile_path)
+        finally:
+            manifests.close()
+            # removed here rather than by the generator, which doesn't clean
+            # up when it's closed before it started
+            if container_id is not None:
+                try:
+                    self.tasker.remove_container(container_id)
+                except Exception as ex:
+                    self.log.warning('Failed to remove container %s: %s', container_id, ex)
+        return manifests_zipfile_path
+
+    def iter_container_manifests(self, container_id):
+        """
+        Stream operator manifest files out of a container
+
+        :param container_id: str, container created from the built image;
+                             it's not removed
+        :return: generator of (TarInfo, file-like object) tuples; file-like
+                 object is None for other than regular files
+        """
+        try:
+            bits, _ = self.tasker.get_archive(container_id, IMG_MANIFESTS_PATH)
         except APIError as ex:
             msg = ('Could not extract operator manifest files. '
                    'Is there a %s path in the image?' % (IMG_MANIFESTS_PATH))
@@ -97,34 +196,105 @@ class ExportOperatorManifestsPlugin(PostBuildPlugin):
         except Exception as ex:
             raise RuntimeError('%s' % ex)
 
+        with tarfile.open(fileobj=StreamAdapter(iter(bits)), mode='r|') as tar:
+            for member in tar:
+                yield member, tar.extractfile(member) if member.isfile() else None
+
+    def iter_image_manifests(self):
+        """
+        Read operator manifest files from layers of the built image
+
+        :return: generator of (TarInfo, file-like object) tuples; file-like
+                 object is None for other than regular files
+        """
+        manifest = None
+        links = {}
+        layer_changes = {}
+        image_archive = open_image_archive(self.tasker, self.workflow, self.workflow.image)
+        try:
+            with tarfile.open(fileobj=image_archive, mode='r|*') as archive:
+                for member in archive:
+                    if member.name == 'manifest.json':
+                        manifest = json.loads(archive.extractfile(member).read().decode('utf-8'))
+                    elif member.issym():
+                        # layers shared by several images are stored only once
+                        links[member.name] = posixpath.normpath(
+                            posixpath.join(posixpath.dirname(member.name), member.linkname))
+                    elif member.isfile() and not member.name.endswith('.json'):
+                        try:
+                            layer_changes[member.name] = read_layer_manifests(
+                                archive.extractfile(member), OPERATOR_MANIFESTS_MAX_SIZE)
+                        except tarfile.ReadError:
+                            self.log.debug('%s in image archive is not a layer', member.name)
         finally:
-            try:
-                self.tasker.remove_container(container_id)
-            except Exception as ex:
-                self.log.warning('Failed to remove container %s: %s', container_id, ex)
+            image_archive.close()
 
-        with tempfile.NamedTemporaryFile() as extracted_file:
-            for chunk in bits:
-                extracted_file.write(chunk)
-            extracted_file.flush()
-            tar_archive = tarfile.TarFile(extracted_file.name)
+        if not manifest:
+            raise RuntimeError('Image archive does not contain manifest.json')
 
-        tar_archive.extractall(manifests_archive_dir)
-        manifests_path = os.path.join(manifests_archive_dir, MANIFESTS_DIR_NAME)
+        files = {}
+        for layer in manifest[0]['Layers']:
+            removed, added = layer_changes.get(links.get(layer, layer), ((), {}))
+            for path in removed:
+                for existing in list(files):
+                    if not path or existing == path or existing.startswith(path + '/'):
+                        del files[existing]
+            files.update(added)
+
+        for path in sorted(files):
+            member, data = files[path]
+            member.name = posixpath.join(MANIFESTS_DIR_NAME, path)
+            yield member, io.BytesIO(data) if data is not None else None
+
+    def archive_manifests(self, manifests, path):
+        """
+        Store operator manifest files in a zip archive
+
+        :param manifests: iterable of (TarInfo, file-like object) tuples, as
+                          returned by iter_container_manifests
+        :param path: str, path to the zip archive
+        """
+        contents = {}
+        total_size = 0
+        with zipfile.ZipFile(path, 'w') as archive:
+            for member, fileobj in manifests:
+                manifest_path = get_manifest_path(member.name)
+                if not manifest_path or member.isdir():
+                    continue
+
+                if fileobj is not None:
+                    total_size += member.size
+                    if total_size > OPERATOR_MANIFESTS_MAX_SIZE:
+                        self.log.error('Operator manifests exceed maximum size of %d bytes',
+                                       OPERATOR_MANIFESTS_MAX_SIZE)
+                        raise RuntimeError('Operator manifests exceed maximum size of {} bytes'
+                                           .format(OPERATOR_MANIFESTS_MAX_SIZE))
+                    data = fileobj.read()
+                elif member.issym() or member.islnk():
+                    if member.issym():
+                        target = posixpath.join(posixpath.dirname(member.name), member.linkname)
+                    else:
+                        target = member.linkname
+                    data = contents.get(get_manifest_path(target))
+                    if data is None:
+                        self.log.warning('Skipping link %s to %s, not a file in manifests '
+                                         'directory', member.name, member.linkname)
+                        continue
+                else:
+                    continue
+
+                contents[manifest_path] = data
+                info = zipfile.ZipInfo(manifest_path, date_time=self._date_time(member.mtime))
+                info.external_attr = (member.mode & 0o7777 | 0o100000) << 16
+                archive.writestr(info, data)
 
-        manifests_zipfile_path = os.path.join(manifests_archive_dir, OPERATOR_MANIFESTS_ARCHIVE)
-        with zipfile.ZipFile(manifests_zipfile_path, 'w') as archive:
-            for root, _, files in os.walk(manifests_path):
-                for f in files:
-                    filedir = os.path.relpath(root, manifests_path)
-                    filepath = os.path.join(filedir, f)
-                    archive.write(os.path.join(root, f), filepath)
             manifest_files = archive.namelist()
             if not manifest_files:
                 self.log.error('Empty operator manifests directory')
                 raise RuntimeError('Empty operator manifests directory')
             self.log.debug("Archiving operator manifests: %s", manifest_files)
 
-        shutil.rmtree(manifests_path)
-
-        return manifests_zipfile_path
+    @staticmethod
+    def _date_time(mtime):
+        # zip archives can't store timestamps before 1980
+        return max(time.localtime(mtime)[:6], (1980, 1, 1, 0, 0, 0))
@@ -9,42 +9,22 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import unicode_literals, absolute_import, division
 
 from collections import namedtuple
-import os
+from functools import partial
 from tempfile import NamedTemporaryFile
 
 from atomic_reactor.plugin import PostBuildPlugin
 from atomic_reactor.plugins.pre_reactor_config import (get_openshift_session,
                                                        get_koji_session)
-from atomic_reactor.constants import PLUGIN_KOJI_UPLOAD_PLUGIN_KEY
+from atomic_reactor.constants import PLUGIN_KOJI_UPLOAD_PLUGIN_KEY, KOJI_UPLOAD_MAX_WORKERS
 from atomic_reactor.util import (get_build_json, ImageName, is_scratch_build)
-from atomic_reactor.koji_util import get_buildroot, get_output, get_output_metadata
+from atomic_reactor.koji_util import (KojiUploadLogger, get_buildroot, get_output,
+                                      get_output_metadata, upload_file, upload_outputs)
 from osbs.exceptions import OsbsException
 
 # An output file and its metadata
 Output = namedtuple('Output', ['file', 'metadata'])
 
 
-class KojiUploadLogger(object):
-    def __init__(self, logger, notable_percent=10):
-        self.logger = logger
-        self.notable_percent = notable_percent
-        self.last_percent_done = 0
-
-    def callback(self, offset, totalsize, size, t1, t2):  # pylint: disable=W0613
-        if offset == 0:
-            self.logger.debug("upload size: %.1fMiB", totalsize / 1024 / 1024)
-
-        if not totalsize or not t1:
-            return
-
-        percent_done = 100 * offset // totalsize
-        if (percent_done >= 99 or
-                percent_done - self.last_percent_done >= self.notable_percent):
-            self.last_percent_done = percent_done
-            self.logger.debug("upload: %d%% done (%.1f MiB/sec)",
-                              percent_done, size / t1 / 1024 / 1024)
-
-
 class KojiUploadPlugin(PostBuildPlugin):
     """
     Upload this build to Koji
@@ -75,7 +55,8 @@ class KojiUploadPlugin(PostBuildPlugin):
                  koji_ssl_certs_dir=None, koji_proxy_user=None,
                  koji_principal=None, koji_keytab=None,
                  blocksize=None,
-                 platform='x86_64', report_multiple_digests=False):
+                 platform='x86_64', report_multiple_digests=False,
+                 max_workers=KOJI_UPLOAD_MAX_WORKERS):
         """
         constructor
 
@@ -95,6 +76,7 @@ class KojiUploadPlugin(PostBuildPlugin):
         :param platform: str, platform name for this build
         :param report_multiple_digests: bool, whether to report both schema 1
             and schema 2 digests
+        :param max_workers: int, max number of files uploaded at the same time
         """
         super(KojiUploadPlugin, self).__init__(tasker, workflow)
 
@@ -118,6 +100,7 @@ class KojiUploadPlugin(PostBuildPlugin):
         self.blocksize = blocksize
         self.koji_upload_dir = koji_upload_dir
         self.report_multiple_digests = report_multiple_digests
+        self.max_workers = max_workers
 
         self.osbs = get_openshift_session(self.workflow, self.openshift_fallback)
         self.build_id = None
@@ -134,7 +117,9 @@ class KojiUploadPlugin(PostBuildPlugin):
         build_logs = NamedTemporaryFile(prefix="buildstep-%s" % self.build_id,
                                         suffix=".log",
                                         mode='wb')
-        build_logs.write("\n".join(self.workflow.build_result.logs).encode('utf-8'))
+        # written line by line, logs may be streamed from disk
+        for line in self.workflow.build_result.logs:
+            build_logs.write(line.encode('utf-8') + b'\n')
         build_logs.flush()
         filename = "{platform}-build.log".format(platform=self.platform)
         return [Output(file=build_logs,
@@ -213,15 +198,14 @@ class KojiUploadPlugin(PostBuildPlugin):
         self.log.debug("uploading %r to %r as %r",
                        output.file.name, serverdir, name)
 
-        kwargs = {}
         if self.blocksize is not None:
-            kwargs['blocksize'] = self.blocksize
             self.log.debug("using blocksize %d", self.blocksize)
 
-        upload_logger = KojiUploadLogger(self.log)
-        session.uploadWrapper(output.file.name, serverdir, name=name,
-                              callback=upload_logger.callback, **kwargs)
-        path = os.path.join(serverdir, name)
+        upload_logger = KojiUploadLogger(self.log, name=name)
+        path = upload_file(session, output.file.name, serverdir, name=name,
+                           callback=upload_logger.callback, blocksize=self.blocksize,
+                           checksum=output.metadata.get('checksum'),
+                           checksum_type=output.metadata.get('checksum_type'))
         self.log.debug("uploaded %r", path)
         return path
 
@@ -239,9 +223,9 @@ class KojiUploadPlugin(PostBuildPlugin):
         if not is_scratch_build():
             try:
                 session = get_koji_session(self.workflow, self.koji_fallback)
-                for output in output_files:
-                    if output.file:
-                        self.upload_file(session, output, self.koji_upload_dir)
+                upload_outputs(session, output_files,
+                               partial(self.upload_file, serverdir=self.koji_upload_dir),
+                               max_workers=self.max_workers)
             finally:
                 for output in output_files:
                     if output.file:
@@ -9,7 +9,8 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import absolute_import
 
 from atomic_reactor.plugin import PostBuildPlugin
-from atomic_reactor.rpm_util import rpm_qf_args, parse_rpm_output
+from atomic_reactor.rpm_util import rpm_qf_args, parse_rpm_output, get_image_rpm_list
+from atomic_reactor.util import open_image_archive
 
 __all__ = ('PostBuildRPMqaPlugin', )
 
@@ -19,17 +20,23 @@ class PostBuildRPMqaPlugin(PostBuildPlugin):
     is_allowed_to_fail = False
     sep = ';'
 
-    def __init__(self, tasker, workflow, image_id, ignore_autogenerated_gpg_keys=True):
+    def __init__(self, tasker, workflow, image_id, ignore_autogenerated_gpg_keys=True,
+                 read_rpmdb=False):
         """
         constructor
 
         :param tasker: ContainerTasker instance
         :param workflow: DockerBuildWorkflow instance
+        :param image_id: str, id of the built image
+        :param ignore_autogenerated_gpg_keys: bool, leave out gpg-pubkey packages
+        :param read_rpmdb: bool, read the rpm database from layers of the image
+                           instead of running rpm in a container
         """
         # call parent constructor
         super(PostBuildRPMqaPlugin, self).__init__(tasker, workflow)
         self.image_id = image_id
         self.ignore_autogenerated_gpg_keys = ignore_autogenerated_gpg_keys
+        self.read_rpmdb = read_rpmdb
 
         self._container_ids = []
 
@@ -42,7 +49,10 @@ class PostBuildRPMqaPlugin(PostBuildPlugin):
             self.log.info("from scratch can't run rpmqa")
             return None
 
-        plugin_output = self.gather_output()
+        if self.read_rpmdb:
+            plugin_output = self.gather_output_from_rpmdb()
+        else:
+            plugin_output = self.gather_output()
 
         # gpg-pubkey are autogenerated packages by rpm when you import a gpg key
         # these are of course not signed, let's ignore those by default
@@ -72,3 +82,15 @@ class PostBuildRPMqaPlugin(PostBuildPlugin):
                 return output
 
         raise RuntimeError('Unable to gather list of installed packages in container')
+
+    def gather_output_from_rpmdb(self):
+        image_archive = open_image_archive(self.tasker, self.workflow, self.image_id)
+        try:
+            output = get_image_rpm_list(image_archive)
+        finally:
+            image_archive.close()
+
+        if not output:
+            raise RuntimeError('Unable to read list of installed packages from rpm database '
+                               'of the image')
+        return output
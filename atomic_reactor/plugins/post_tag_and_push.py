@@ -9,6 +9,7 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import absolute_import
 
 from copy import deepcopy
+from multiprocessing.pool import ThreadPool
 import subprocess
 import time
 import platform
@@ -16,15 +17,18 @@ import random
 
 from atomic_reactor.constants import (IMAGE_TYPE_DOCKER_ARCHIVE, IMAGE_TYPE_OCI, IMAGE_TYPE_OCI_TAR,
                                       MEDIA_TYPE_DOCKER_V2_SCHEMA2, DOCKER_PUSH_MAX_RETRIES,
-                                      DOCKER_PUSH_BACKOFF_FACTOR)
+                                      DOCKER_PUSH_BACKOFF_FACTOR, DOCKER_PUSH_MAX_WORKERS,
+                                      PLUGIN_TAG_AND_PUSH_KEY)
+from atomic_reactor.manifest_util import ManifestUtil
 from atomic_reactor.plugin import PostBuildPlugin
 from atomic_reactor.plugins.exit_remove_built_image import defer_removal
 from atomic_reactor.plugins.pre_reactor_config import (get_registries, get_group_manifests,
                                                        get_koji_session, NO_FALLBACK,
                                                        get_registries_organization)
 from atomic_reactor.plugins.pre_fetch_sources import PLUGIN_FETCH_SOURCES_KEY
+from atomic_reactor.registry_cache import registry_cache
 from atomic_reactor.util import (get_manifest_digests, get_config_from_registry, Dockercfg,
-                                 ImageName, get_all_manifests)
+                                 ImageName, ManifestDigest, get_all_manifests)
 import osbs.utils
 from osbs.constants import RAND_DIGITS
 
@@ -37,10 +41,11 @@ class TagAndPushPlugin(PostBuildPlugin):
     Use tags from workflow.tag_conf and push the images to workflow.push_conf
     """
 
-    key = "tag_and_push"
+    key = PLUGIN_TAG_AND_PUSH_KEY
     is_allowed_to_fail = False
 
-    def __init__(self, tasker, workflow, registries=None, koji_target=None):
+    def __init__(self, tasker, workflow, registries=None, koji_target=None,
+                 max_workers=DOCKER_PUSH_MAX_WORKERS, copy_manifests=False):
         """
         constructor
 
@@ -54,6 +59,13 @@ class TagAndPushPlugin(PostBuildPlugin):
                             * "secret" optional string - path to the secret, which stores
                               email, login and password for remote registry
         :param koji_target: str, used only for sourcecontainers
+        :param max_workers: int, max number of tags pushed concurrently to
+                            a single registry, after the first push uploaded
+                            all layers
+        :param copy_manifests: bool, after the first push to a registry, create
+                               remaining tags by uploading the pushed manifest
+                               through the registry API, instead of pushing
+                               the image again
         """
         # call parent constructor
         super(TagAndPushPlugin, self).__init__(tasker, workflow)
@@ -61,7 +73,9 @@ class TagAndPushPlugin(PostBuildPlugin):
         self.registries = get_registries(self.workflow, deepcopy(registries or {}))
         self.group = get_group_manifests(self.workflow, False)
         self.koji_target = koji_target
-
+        self.max_workers = max(max_workers, 1)
+        self.copy_manifests = copy_manifests
+        self.manifest_util = ManifestUtil(self.workflow, self.registries, self.log)
 
     def need_skopeo_push(self):
         if len(self.workflow.exported_image_sequence) > 0:
@@ -137,6 +151,181 @@ class TagAndPushPlugin(PostBuildPlugin):
         source_image_spec.registry = None
         return source_image_spec
 
+    def push_image(self, registry_image, registry, insecure, docker_push_secret,
+                   source_oci_image_path, max_retries):
+        """
+        Push image to the registry, retrying until its manifest digest is available
+
+        :param registry_image: ImageName, image to push, including registry
+        :param registry: str, registry to push to
+        :param insecure: bool, allow connecting to registry over plain http
+        :param docker_push_secret: str, path to the secret for the registry
+        :param source_oci_image_path: str, path to the source container image, or None
+        :param max_retries: int, max number of retries of the push
+        :return: tuple, ManifestDigest of the pushed image and its koji source manifest
+                 (None unless pushing source container image)
+        """
+        koji_source_manifest = None
+        for retry in range(max_retries + 1):
+            if self.need_skopeo_push() or source_oci_image_path:
+                self.push_with_skopeo(registry_image, insecure, docker_push_secret,
+                                      source_oci_image_path)
+            else:
+                self.tasker.tag_and_push_image(self.workflow.builder.image_id,
+                                               registry_image, insecure=insecure,
+                                               force=True, dockercfg=docker_push_secret)
+            # responses for the tag cached before the push are stale now
+            registry_cache.invalidate_tags(registry,
+                                           registry_image.to_str(registry=False, tag=False))
+
+            if source_oci_image_path:
+                manifests_dict = get_all_manifests(registry_image, registry, insecure,
+                                                   docker_push_secret, versions=('v2',))
+                try:
+                    koji_source_manifest_response = manifests_dict['v2']
+                except KeyError:
+                    raise RuntimeError('Unable to fetch v2 schema 2 digest for {}'.
+                                       format(registry_image.to_str()))
+
+                koji_source_manifest = koji_source_manifest_response.json()
+
+            # Only digests are needed, don't download the manifests
+            digests = get_manifest_digests(registry_image, registry,
+                                           insecure, docker_push_secret,
+                                           concurrent=True, use_head=True)
+
+            if (not (digests.v2 or digests.oci) and (retry < max_retries)):
+                sleep_time = DOCKER_PUSH_BACKOFF_FACTOR * (2 ** retry)
+                self.log.info("Retrying push because V2 schema 2 or "
+                              "OCI manifest not found in %is", sleep_time)
+
+                # only blocks this push, others keep going
+                time.sleep(sleep_time)
+            else:
+                if not self.need_skopeo_push():
+                    defer_removal(self.workflow, registry_image)
+                break
+
+        return digests, koji_source_manifest
+
+    def get_pushed_manifest(self, session, registry_image, digests):
+        """
+        Download manifest of a pushed image, so that it can be tagged again
+
+        :param session: RegistrySession, session for the registry
+        :param registry_image: ImageName, pushed image
+        :param digests: ManifestDigest, digests of the pushed image
+        :return: tuple, manifest (bytes) and its media type, None if the
+                 image has no V2 schema 2 or OCI manifest
+        """
+        digest = digests.v2 or digests.oci
+        if not digest:
+            self.log.info("V2 schema 2 or OCI manifest of %s is not available, "
+                          "pushing remaining tags", registry_image)
+            return None
+
+        repo = registry_image.to_str(registry=False, tag=False)
+        manifest, _, media_type, _ = self.manifest_util.get_manifest(session, repo, digest)
+        return manifest, media_type
+
+    def copy_manifest(self, session, source_image, registry_image, manifest, media_type,
+                      digests):
+        """
+        Tag manifest of an already pushed image as registry_image
+
+        Layers are not uploaded again, when the repositories differ, they're
+        mounted from the repository of source_image.
+
+        :param session: RegistrySession, session for the registry
+        :param source_image: ImageName, already pushed image
+        :param registry_image: ImageName, image to create
+        :param manifest: bytes, manifest of source_image
+        :param media_type: str, media type of the manifest
+        :param digests: ManifestDigest, digests of source_image
+        :return: ManifestDigest, digests of registry_image
+        """
+        self.log.info("tagging manifest of %s as %s", source_image, registry_image)
+        source_repo = source_image.to_str(registry=False, tag=False)
+        target_repo = registry_image.to_str(registry=False, tag=False)
+        self.manifest_util.store_manifest_in_repository(session, manifest, media_type,
+                                                        source_repo, target_repo,
+                                                        ref=registry_image.tag)
+        # The same manifest bytes give the same digest; schema 1 manifests
+        # are converted for each tag by the registry, so v1 is not known
+        return ManifestDigest(v2=digests.v2, oci=digests.oci)
+
+    def push_to_registry(self, registry, registry_conf, images, source_oci_image_path,
+                         max_retries):
+        """
+        Push images to a single registry
+
+        The first image is pushed alone, so that layers are uploaded only
+        once. Remaining tags only refer to already uploaded layers and are
+        pushed concurrently. With copy_manifests, they're created from the
+        manifest of the first image instead.
+
+        :param registry: str, registry to push to
+        :param registry_conf: dict, per-registry parameters
+        :param images: list of ImageName, images to push, without registry
+        :param source_oci_image_path: str, path to the source container image, or None
+        :param max_retries: int, max number of retries of each push
+        :return: list of tuples (ImageName, result of push_image, exception),
+                 in the order of images; exception is None for successful pushes,
+                 images which were not pushed at all are not included
+        """
+        insecure = registry_conf.get('insecure', False)
+        docker_push_secret = registry_conf.get('secret', None)
+        self.log.info("Registry %s secret %s", registry, docker_push_secret)
+
+        def task(func):
+            def wrapped(image):
+                registry_image = image.copy()
+                registry_image.registry = registry
+                try:
+                    return registry_image, func(registry_image), None
+                except Exception as ex:
+                    self.log.error("push of %s failed: %s", registry_image, ex)
+                    return registry_image, None, ex
+            return wrapped
+
+        @task
+        def push(registry_image):
+            return self.push_image(registry_image, registry, insecure, docker_push_secret,
+                                   source_oci_image_path, max_retries)
+
+        pushed = [push(images[0])]
+        source_image, source_result, exc = pushed[0]
+        if exc is not None or len(images) == 1:
+            return pushed
+
+        source_manifest = None
+        if self.copy_manifests:
+            session = self.manifest_util.get_registry_session(registry)
+            try:
+                source_manifest = self.get_pushed_manifest(session, source_image,
+                                                           source_result[0])
+            except Exception as ex:
+                self.log.error("fetching manifest of %s failed: %s", source_image, ex)
+                return [(source_image, None, ex)]
+
+        @task
+        def copy(registry_image):
+            manifest, media_type = source_manifest
+            digests, koji_source_manifest = source_result
+            session = self.manifest_util.get_registry_session(registry)
+            digests = self.copy_manifest(session, source_image, registry_image,
+                                         manifest, media_type, digests)
+            return digests, koji_source_manifest
+
+        pool = ThreadPool(min(self.max_workers, len(images) - 1))
+        try:
+            pushed.extend(pool.map(copy if source_manifest else push, images[1:]))
+        finally:
+            pool.close()
+            pool.join()
+
+        return pushed
+
     def run(self):
         pushed_images = []
 
@@ -149,67 +338,53 @@ class TagAndPushPlugin(PostBuildPlugin):
                 self.workflow.tag_conf.add_unique_image(source_unique_image)
             else:
                 self.workflow.tag_conf.add_unique_image(self.workflow.image)
+
+        images = self.workflow.tag_conf.images
+        for image in images:
+            if image.registry:
+                raise RuntimeError("Image name must not contain registry: %r" % image.registry)
+
+        expect_v2s2 = False
+        for registry_conf in self.registries.values():
+            media_types = registry_conf.get('expected_media_types', [])
+            if MEDIA_TYPE_DOCKER_V2_SCHEMA2 in media_types:
+                expect_v2s2 = True
+
+        max_retries = DOCKER_PUSH_MAX_RETRIES
+        if not (self.group or expect_v2s2):
+            max_retries = 0
+
+        registries = list(self.registries.items())
+        push_conf_registries = [
+            self.workflow.push_conf.add_docker_registry(
+                registry, insecure=registry_conf.get('insecure', False))
+            for registry, registry_conf in registries
+        ]
+
+        # Registries don't share layers, push to all of them at once
+        pool = ThreadPool(max(len(registries), 1))
+        try:
+            results = pool.map(lambda registry: self.push_to_registry(
+                registry[0], registry[1], images, source_oci_image_path, max_retries),
+                registries)
+        finally:
+            pool.close()
+            pool.join()
+
+        # Results are processed in the order of registries and images,
+        # so that push_conf is the same as when pushing one by one
         config_manifest_digest = None
         config_manifest_type = None
         config_registry_image = None
-        for registry, registry_conf in self.registries.items():
-            insecure = registry_conf.get('insecure', False)
-            push_conf_registry = \
-                self.workflow.push_conf.add_docker_registry(registry, insecure=insecure)
-
-            docker_push_secret = registry_conf.get('secret', None)
-            self.log.info("Registry %s secret %s", registry, docker_push_secret)
+        for (registry, registry_conf), push_conf_registry, pushed in zip(
+                registries, push_conf_registries, results):
+            for registry_image, result, exc in pushed:
+                if exc is not None:
+                    raise exc
 
-            for image in self.workflow.tag_conf.images:
-                if image.registry:
-                    raise RuntimeError("Image name must not contain registry: %r" % image.registry)
-
-                registry_image = image.copy()
-                registry_image.registry = registry
-                max_retries = DOCKER_PUSH_MAX_RETRIES
-
-                expect_v2s2 = False
-                for registry in self.registries:
-                    media_types = self.registries[registry].get('expected_media_types', [])
-                    if MEDIA_TYPE_DOCKER_V2_SCHEMA2 in media_types:
-                        expect_v2s2 = True
-
-                if not (self.group or expect_v2s2):
-                    max_retries = 0
-
-                for retry in range(max_retries + 1):
-                    if self.need_skopeo_push() or source_oci_image_path:
-                        self.push_with_skopeo(registry_image, insecure, docker_push_secret,
-                                              source_oci_image_path)
-                    else:
-                        self.tasker.tag_and_push_image(self.workflow.builder.image_id,
-                                                       registry_image, insecure=insecure,
-                                                       force=True, dockercfg=docker_push_secret)
-
-                    if source_oci_image_path:
-                        manifests_dict = get_all_manifests(registry_image, registry, insecure,
-                                                           docker_push_secret, versions=('v2',))
-                        try:
-                            koji_source_manifest_response = manifests_dict['v2']
-                        except KeyError:
-                            raise RuntimeError('Unable to fetch v2 schema 2 digest for {}'.
-                                               format(registry_image.to_str()))
-
-                        self.workflow.koji_source_manifest = koji_source_manifest_response.json()
-
-                    digests = get_manifest_digests(registry_image, registry,
-                                                   insecure, docker_push_secret)
-
-                    if (not (digests.v2 or digests.oci) and (retry < max_retries)):
-                        sleep_time = DOCKER_PUSH_BACKOFF_FACTOR * (2 ** retry)
-                        self.log.info("Retrying push because V2 schema 2 or "
-                                      "OCI manifest not found in %is", sleep_time)
-
-                        time.sleep(sleep_time)
-                    else:
-                        if not self.need_skopeo_push():
-                            defer_removal(self.workflow, registry_image)
-                        break
+                digests, koji_source_manifest = result
+                if koji_source_manifest is not None:
+                    self.workflow.koji_source_manifest = koji_source_manifest
 
                 pushed_images.append(registry_image)
 
@@ -227,8 +402,9 @@ class TagAndPushPlugin(PostBuildPlugin):
 
             if config_manifest_digest:
                 push_conf_registry.config = get_config_from_registry(
-                    config_registry_image, registry, config_manifest_digest, insecure,
-                    docker_push_secret, config_manifest_type)
+                    config_registry_image, registry, config_manifest_digest,
+                    registry_conf.get('insecure', False), registry_conf.get('secret', None),
+                    config_manifest_type)
             else:
                 self.log.info("V2 schema 2 or OCI manifest is not available to get config from")
 
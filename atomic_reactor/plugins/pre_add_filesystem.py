@@ -333,17 +333,13 @@ class AddFilesystemPlugin(PreBuildPlugin):
     def run_image_task(self, image_build_conf):
         task_id, filesystem_regex = self.build_filesystem(image_build_conf)
 
-        task = TaskWatcher(self.session, task_id, self.poll_interval)
+        task = TaskWatcher(self.session, task_id, self.poll_interval,
+                           cancel_on_build_cancel=True)
         try:
             task.wait()
         except BuildCanceledException:
-            self.log.info("Build was canceled, canceling task %s", task_id)
-            try:
-                self.session.cancelTask(task_id)
-                self.log.info('task %s canceled', task_id)
-            except Exception as exc:
-                self.log.info("Exception while canceling a task (ignored): %s",
-                              util.exception_message(exc))
+            # the task was canceled by TaskWatcher
+            self.log.info("Build was canceled while waiting for task %s", task_id)
 
         if task.failed():
             try:
@@ -33,6 +33,9 @@ DEFAULT_HELP_FILENAME = "help.md"
 
 class AddHelpPlugin(PreBuildPlugin):
     key = "add_help"
+    # labels and parent ENV are read through df_parser
+    reads = ('dockerfile', 'parent_images', 'base_image_inspect')
+    writes = ('dockerfile', 'help_file')
     man_filename = "help.1"
 
     NO_HELP_FILE_FOUND = 1
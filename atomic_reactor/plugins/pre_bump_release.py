@@ -9,6 +9,7 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import unicode_literals, absolute_import
 
 import time
+from atomic_reactor.koji_util import koji_multicall_map
 from atomic_reactor.plugin import PreBuildPlugin
 from atomic_reactor.util import df_parser
 from osbs.utils import Labels, utcnow
@@ -16,7 +17,7 @@ from atomic_reactor.plugins.pre_reactor_config import get_koji_session, get_koji
 from atomic_reactor.plugins.pre_check_and_set_rebuild import is_rebuild
 from atomic_reactor.plugins.pre_fetch_sources import PLUGIN_FETCH_SOURCES_KEY
 from atomic_reactor.constants import (PLUGIN_BUMP_RELEASE_KEY, PROG, KOJI_RESERVE_MAX_RETRIES,
-                                      KOJI_RESERVE_RETRY_DELAY)
+                                      KOJI_RESERVE_RETRY_DELAY, KOJI_RELEASE_PROBE_MAX_BATCH)
 from atomic_reactor.util import get_build_json, is_scratch_build
 from koji import GenericError
 import koji
@@ -62,6 +63,9 @@ class BumpReleasePlugin(PreBuildPlugin):
         self.xmlrpc = get_koji_session(self.workflow, self.koji_fallback)
         koji_setting = get_koji(self.workflow, self.koji_fallback)
         self.reserve_build = koji_setting.get('reserve_build', False)
+        # (name, version, release) of builds known to exist, kept across
+        # reservation retries so that they are not checked again
+        self._taken_releases = set()
 
     def get_patched_release(self, original_release, increment=False):
         # Split the original release by dots, make sure there at least 3 items in parts list
@@ -99,6 +103,49 @@ class BumpReleasePlugin(PreBuildPlugin):
         # Write the label back to the file (this is a property setter)
         dockerfile_labels[release_label] = next_release
 
+    def is_release_free(self, build):
+        if not build:
+            return True
+        if self.reserve_build:
+            # failed and canceled builds can be reused when reserving builds
+            return build['state'] in (koji.BUILD_STATES['FAILED'],
+                                      koji.BUILD_STATES['CANCELED'])
+        return False
+
+    def find_free_release(self, component, version, release, next_release):
+        """
+        Find the first release, starting from release, with no build in Koji
+
+        Candidates are checked in multicall batches of exponentially growing
+        size, so that components with many failed builds need only a few
+        round trips to the hub. Releases known to be taken are skipped.
+
+        :param component: str, name of the component
+        :param version: str, version of the component
+        :param release: str, first candidate release
+        :param next_release: callable, returns the candidate following a release
+        :return: str, free release
+        """
+        batch_size = 1
+        while True:
+            candidates = []
+            while len(candidates) < batch_size:
+                if (component, version, release) not in self._taken_releases:
+                    candidates.append(release)
+                release = next_release(release)
+
+            build_infos = [{'name': component, 'version': version, 'release': candidate}
+                           for candidate in candidates]
+            self.log.debug('checking that builds do not exist: %s', build_infos)
+            builds = koji_multicall_map(self.xmlrpc, 'getBuild', build_infos)
+
+            for candidate, build in zip(candidates, builds):
+                if self.is_release_free(build):
+                    return candidate
+                self._taken_releases.add((component, version, candidate))
+
+            batch_size = min(batch_size * 2, KOJI_RELEASE_PROBE_MAX_BATCH)
+
     def get_next_release_standard(self, component, version):
         build_info = {'name': component, 'version': version}
         self.log.debug('getting next release from build info: %s', build_info)
@@ -108,35 +155,21 @@ class BumpReleasePlugin(PreBuildPlugin):
         # but next_release might be a failed build. Koji's CGImport doesn't
         # allow reuploading builds, so instead we should increment next_release
         # and make sure the build doesn't exist
-        while True:
-            build_info = {'name': component, 'version': version, 'release': next_release}
-            self.log.debug('checking that the build does not exist: %s', build_info)
-            build = self.xmlrpc.getBuild(build_info)
-            if not build:
-                return next_release
-            elif self.reserve_build:
-                if build['state'] in (koji.BUILD_STATES['FAILED'], koji.BUILD_STATES['CANCELED']):
-                    return next_release
-
-            next_release = self.get_patched_release(next_release, increment=True)
+        return self.find_free_release(
+            component, version, next_release,
+            lambda release: self.get_patched_release(release, increment=True))
 
     def get_next_release_append(self, component, version, base_release, base_suffix=1):
         # This is brute force, but trying to use getNextRelease() would be fragile
-        # magic depending on the exact details of how koji increments the release,
-        # and we expect that the number of builds for any one base_release will be small.
+        # magic depending on the exact details of how koji increments the release.
         release = base_release or '1'
-        suffix = base_suffix
-        while True:
-            next_release = '%s.%s' % (release, suffix)
-            build_info = {'name': component, 'version': version, 'release': next_release}
-            self.log.debug('checking that the build does not exist: %s', build_info)
-            build = self.xmlrpc.getBuild(build_info)
-            if not build:
-                return next_release
-            elif self.reserve_build:
-                if build['state'] in (koji.BUILD_STATES['FAILED'], koji.BUILD_STATES['CANCELED']):
-                    return next_release
-            suffix += 1
+
+        def next_release(candidate):
+            suffix = int(candidate.rsplit('.', 1)[1])
+            return '%s.%s' % (release, suffix + 1)
+
+        return self.find_free_release(component, version, '%s.%s' % (release, base_suffix),
+                                      next_release)
 
     def reserve_build_in_koji(self, component, version, release, release_label,
                               dockerfile_labels, source_build=False):
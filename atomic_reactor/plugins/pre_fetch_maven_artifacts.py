@@ -69,6 +69,8 @@ class FetchMavenArtifactsPlugin(PreBuildPlugin):
 
     key = PLUGIN_FETCH_MAVEN_KEY
     is_allowed_to_fail = False
+    reads = ()
+    writes = ('artifacts',)
 
     NVR_REQUESTS_FILENAME = 'fetch-artifacts-koji.yaml'
     URL_REQUESTS_FILENAME = 'fetch-artifacts-url.yaml'
@@ -9,11 +9,15 @@ from __future__ import absolute_import
 
 import os
 import tempfile
+import threading
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 import koji
 from six import string_types
 
-from atomic_reactor.constants import PLUGIN_FETCH_SOURCES_KEY
+from atomic_reactor.constants import DEFAULT_DOWNLOAD_WORKERS, PLUGIN_FETCH_SOURCES_KEY
+from atomic_reactor.koji_util import koji_multicall_map
 from atomic_reactor.plugin import PreBuildPlugin
 from atomic_reactor.plugins.pre_reactor_config import (
     get_koji,
@@ -22,7 +26,7 @@ from atomic_reactor.plugins.pre_reactor_config import (
     get_config,
     NO_FALLBACK
 )
-from atomic_reactor.util import get_retrying_requests_session
+from atomic_reactor.util import get_retrying_requests_session, human_size
 from atomic_reactor.download import download_url
 
 
@@ -34,6 +38,7 @@ class FetchSourcesPlugin(PreBuildPlugin):
 
     def __init__(
         self, tasker, workflow, koji_build_id=None, koji_build_nvr=None, signing_intent=None,
+        workers=DEFAULT_DOWNLOAD_WORKERS,
     ):
         """
         :param tasker: ContainerTasker instance
@@ -41,6 +46,7 @@ class FetchSourcesPlugin(PreBuildPlugin):
         :param koji_build_id: int, container image koji build id
         :param koji_build_nvr: str, container image koji build NVR
         :param signing_intent: str, ODCS signing intent name
+        :param workers: int, maximum number of SRPMs looked up and downloaded concurrently
         """
         if not koji_build_id and not koji_build_nvr:
             err_msg = ('{} expects either koji_build_id or koji_build_nvr to be defined'
@@ -60,6 +66,7 @@ class FetchSourcesPlugin(PreBuildPlugin):
         self.koji_build_id = koji_build_id
         self.koji_build_nvr = koji_build_nvr
         self.signing_intent = signing_intent
+        self.workers = max(1, workers)
         self.session = get_koji_session(self.workflow, NO_FALLBACK)
         self.pathinfo = get_koji_path_info(self.workflow, NO_FALLBACK)
 
@@ -103,12 +110,37 @@ class FetchSourcesPlugin(PreBuildPlugin):
             os.makedirs(dest_dir)
 
         req_session = get_retrying_requests_session()
-        for url in urls:
-            download_url(url, dest_dir, insecure=insecure,
-                         session=req_session)
+        progress_lock = threading.Lock()
+        progress = {'done': 0}
+
+        def download(url):
+            path = download_url(url, dest_dir, insecure=insecure,
+                                session=req_session)
+            with progress_lock:
+                progress['done'] += 1
+                self.log.info('downloaded %s (%s), %d of %d', os.path.basename(path),
+                              human_size(os.path.getsize(path)), progress['done'], len(urls))
+
+        self._map_concurrently(download, urls)
 
         return dest_dir
 
+    def _map_concurrently(self, func, items):
+        """
+        Call func for each item using at most self.workers threads
+
+        :return: list, results in the order of items
+        """
+        if not items:
+            return []
+
+        pool = ThreadPool(min(self.workers, len(items)))
+        try:
+            return pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+
     def set_koji_image_build_data(self):
         build_identifier = self.koji_build_nvr or self.koji_build_id
 
@@ -168,47 +200,57 @@ class FetchSourcesPlugin(PreBuildPlugin):
             sigkeys = ['']
 
         archives = self.session.listArchives(self.koji_build_id, type='image')
-        rpms = [rpm for archive in archives
-                for rpm in self.session.listRPMs(imageID=archive['id'])]
+        # the same RPM is usually listed for several archives (one per arch)
+        rpms = OrderedDict()
+        for archive in archives:
+            for rpm in self.session.listRPMs(imageID=archive['id']):
+                rpms.setdefault(rpm['id'], rpm)
+        rpms = list(rpms.values())
 
-        srpm_build_paths = {}
         for rpm in rpms:
-            rpm_id = rpm['id']
-            self.log.debug('Resolving SRPM for RPM ID: %s', rpm_id)
-
             if rpm['external_repo_name'] != 'INTERNAL':
                 msg = ('RPM comes from an external repo (RPM ID: {}). '
-                       'External RPMs are currently not supported.').format(rpm_id)
+                       'External RPMs are currently not supported.').format(rpm['id'])
                 raise RuntimeError(msg)
 
-            rpm_hdr = self.session.getRPMHeaders(rpm_id, headers=['SOURCERPM'])
+        self.log.debug('Resolving SRPMs for %d RPMs', len(rpms))
+        rpm_hdrs = koji_multicall_map(self.session, 'getRPMHeaders',
+                                      [rpm['id'] for rpm in rpms], headers=['SOURCERPM'])
+
+        srpm_build_ids = OrderedDict()
+        for rpm, rpm_hdr in zip(rpms, rpm_hdrs):
             if 'SOURCERPM' not in rpm_hdr:
-                raise RuntimeError('Missing SOURCERPM header (RPM ID: {})'.format(rpm_id))
+                raise RuntimeError('Missing SOURCERPM header (RPM ID: {})'.format(rpm['id']))
+
+            srpm_build_ids.setdefault(rpm_hdr['SOURCERPM'], rpm['build_id'])
 
-            srpm_filename = rpm_hdr['SOURCERPM']
-            if srpm_filename in srpm_build_paths:
-                continue
-            rpm_build = self.session.getBuild(rpm['build_id'], strict=True)
-            base_url = self.pathinfo.build(rpm_build)
-            srpm_build_paths[srpm_filename] = base_url
+        build_ids = list(OrderedDict.fromkeys(srpm_build_ids.values()))
+        rpm_builds = koji_multicall_map(self.session, 'getBuild', build_ids, strict=True)
+        build_paths = {build_id: self.pathinfo.build(rpm_build)
+                       for build_id, rpm_build in zip(build_ids, rpm_builds)}
 
-        srpm_urls = []
-        missing_srpms = []
         req_session = get_retrying_requests_session()
-        for srpm_filename, base_url in srpm_build_paths.items():
+
+        def find_srpm_url(srpm_filename):
+            base_url = build_paths[srpm_build_ids[srpm_filename]]
             for sigkey in sigkeys:
                 # koji uses lowercase for paths. We make sure the sigkey is in lower case
                 url_candidate = self.assemble_srpm_url(base_url, srpm_filename, sigkey.lower())
                 request = req_session.head(url_candidate, verify=not insecure)
                 if request.ok:
-                    srpm_urls.append(url_candidate)
                     self.log.debug('%s is available for signing key "%s"', srpm_filename, sigkey)
-                    break
+                    return url_candidate
+
+            self.log.error('%s not found for the given signing intent: %s"', srpm_filename,
+                           self.signing_intent)
+            return None
+
+        srpm_filenames = list(srpm_build_ids)
+        found_urls = self._map_concurrently(find_srpm_url, srpm_filenames)
 
-            else:
-                self.log.error('%s not found for the given signing intent: %s"', srpm_filename,
-                               self.signing_intent)
-                missing_srpms.append(srpm_filename)
+        srpm_urls = [url for url in found_urls if url]
+        missing_srpms = [srpm_filename
+                         for srpm_filename, url in zip(srpm_filenames, found_urls) if not url]
 
         if missing_srpms:
             raise RuntimeError('Could not find files signed by any of {} for these SRPMS: {}'
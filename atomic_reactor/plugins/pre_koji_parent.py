@@ -7,10 +7,11 @@ of the BSD license. See the LICENSE file for details.
 """
 from __future__ import print_function, unicode_literals, absolute_import
 
+from atomic_reactor.koji_util import koji_multicall_map
 from atomic_reactor.plugin import PreBuildPlugin
 from atomic_reactor.constants import (
     INSPECT_CONFIG, PLUGIN_KOJI_PARENT_KEY, BASE_IMAGE_KOJI_BUILD, PARENT_IMAGES_KOJI_BUILDS,
-    KOJI_BTYPE_IMAGE
+    KOJI_BTYPE_IMAGE, KOJI_PARENT_MAX_WORKERS
 )
 from atomic_reactor.plugins.pre_reactor_config import (
     get_deep_manifest_list_inspection, get_koji_session, get_source_registry,
@@ -20,10 +21,12 @@ from atomic_reactor.util import (
     base_image_is_custom, get_manifest_list, get_manifest_media_type
 )
 from copy import copy
+from multiprocessing.pool import ThreadPool
 from osbs.utils import Labels
 
 import json
 import koji
+import threading
 import time
 
 
@@ -54,9 +57,12 @@ class KojiParentPlugin(PreBuildPlugin):
 
     key = PLUGIN_KOJI_PARENT_KEY
     is_allowed_to_fail = False
+    reads = ('parent_images', 'base_image_inspect', 'parent_images_digests')
+    writes = ()
 
     def __init__(self, tasker, workflow, koji_hub=None, koji_ssl_certs_dir=None,
-                 poll_interval=DEFAULT_POLL_INTERVAL, poll_timeout=DEFAULT_POLL_TIMEOUT):
+                 poll_interval=DEFAULT_POLL_INTERVAL, poll_timeout=DEFAULT_POLL_TIMEOUT,
+                 max_workers=KOJI_PARENT_MAX_WORKERS):
         """
         :param tasker: ContainerTasker instance
         :param workflow: DockerBuildWorkflow instance
@@ -65,6 +71,8 @@ class KojiParentPlugin(PreBuildPlugin):
                                    used when Koji's identity certificate is not trusted
         :param poll_interval: int, seconds between polling for Koji build
         :param poll_timeout: int, max amount of seconds to wait for Koji build
+        :param max_workers: int, max number of parent images checked against
+                            the registry at the same time
         """
         super(KojiParentPlugin, self).__init__(tasker, workflow)
 
@@ -76,6 +84,9 @@ class KojiParentPlugin(PreBuildPlugin):
 
         self.poll_interval = poll_interval
         self.poll_timeout = poll_timeout
+        self.max_workers = max_workers
+        # koji sessions must not be used by several threads at once
+        self._koji_session_lock = threading.Lock()
 
         self._base_image_nvr = None
         self._base_image_build = None
@@ -92,25 +103,13 @@ class KojiParentPlugin(PreBuildPlugin):
                 inspect_data=self.workflow.builder.base_image_inspect,
             )
 
-        manifest_mismatches = []
+        parent_nvrs = {}
         for img, local_tag in self.workflow.builder.parent_images.items():
             if base_image_is_custom(img.to_str()):
                 continue
 
             nvr = self.detect_parent_image_nvr(local_tag) if local_tag else None
-            self._parent_builds[img] = self.wait_for_parent_image_build(nvr) if nvr else None
-            if nvr == self._base_image_nvr:
-                self._base_image_build = self._parent_builds[img]
-
-            if self._parent_builds[img]:
-                # we need the possible floating tag
-                check_img = copy(local_tag)
-                check_img.tag = img.tag
-                try:
-                    self.check_manifest_digest(check_img, self._parent_builds[img])
-                except ValueError as exc:
-                    manifest_mismatches.append(exc)
-            else:
+            if not nvr:
                 err_msg = ('Could not get koji build info for parent image {}. '
                            'Was this image built in OSBS?'.format(img.to_str()))
                 if get_skip_koji_check_for_base_image(self.workflow, fallback=False):
@@ -118,7 +117,23 @@ class KojiParentPlugin(PreBuildPlugin):
                 else:
                     self.log.error(err_msg)
                     raise RuntimeError(err_msg)
+            parent_nvrs[img] = nvr
 
+        builds = self.wait_for_parent_image_builds([nvr for nvr in parent_nvrs.values() if nvr])
+
+        images_to_check = []
+        for img, nvr in parent_nvrs.items():
+            self._parent_builds[img] = builds[nvr] if nvr else None
+            if nvr == self._base_image_nvr:
+                self._base_image_build = self._parent_builds[img]
+
+            if self._parent_builds[img]:
+                # we need the possible floating tag
+                check_img = copy(self.workflow.builder.parent_images[img])
+                check_img.tag = img.tag
+                images_to_check.append((check_img, self._parent_builds[img]))
+
+        manifest_mismatches = self.check_manifest_digests(images_to_check)
         if manifest_mismatches:
             mismatch_msg = ('Error while comparing parent images manifest digests in koji with '
                             'related values from registries: %s')
@@ -129,6 +144,38 @@ class KojiParentPlugin(PreBuildPlugin):
             self.log.warning(mismatch_msg, manifest_mismatches)
         return self.make_result()
 
+    def check_manifest_digests(self, images):
+        """Check manifest digests of several parent images concurrently
+
+        :param images: list of (ImageName, dict) tuples, images to inspect
+                       and their koji build metadata
+        :return: list of ValueError, manifest digest mismatches
+        """
+        if not images:
+            return []
+
+        def check(args):
+            try:
+                self.check_manifest_digest(*args)
+            except Exception as exc:  # pylint: disable=broad-except
+                return exc
+            return None
+
+        pool = ThreadPool(min(self.max_workers, len(images)))
+        try:
+            errors = pool.map(check, images)
+        finally:
+            pool.close()
+            pool.join()
+
+        manifest_mismatches = []
+        for exc in errors:
+            if isinstance(exc, ValueError):
+                manifest_mismatches.append(exc)
+            elif exc is not None:
+                raise exc
+        return manifest_mismatches
+
     def check_manifest_digest(self, image, build_info):
         """Check if the manifest list digest is correct.
 
@@ -217,7 +264,8 @@ class KojiParentPlugin(PreBuildPlugin):
             v2_digest = manifest['digest']
             manifest_list_data[arch] = v2_digest
 
-        archives = self.koji_session.listArchives(build_id)
+        with self._koji_session_lock:
+            archives = self.koji_session.listArchives(build_id)
         koji_archives_data = {}
         for archive in (a for a in archives if a['btype'] == KOJI_BTYPE_IMAGE):
             arch = archive['extra']['docker']['config']['architecture']
@@ -267,20 +315,49 @@ class KojiParentPlugin(PreBuildPlugin):
 
         :return build info dict with 'nvr' and 'id' keys
         """
+        return self.wait_for_parent_image_builds([nvr])[nvr]
 
-        self.log.info('Waiting for Koji build for parent image %s', nvr)
+    def wait_for_parent_image_builds(self, nvrs):
+        """
+        Given image NVRs, wait for the builds that produced them to show up in koji.
+        If they don't within the timeout, raise an error.
+
+        All builds not yet complete are looked up with a single multicall
+        in each polling round, so the total wait is given by the slowest one.
+
+        :param nvrs: list of str, NVRs of parent images
+        :return: dict, NVR mapped to build info dict with 'nvr' and 'id' keys
+        """
+        builds = {}
+        pending = sorted(set(nvrs))
+        if not pending:
+            return builds
+
+        self.log.info('Waiting for Koji builds for parent images %s', ', '.join(pending))
         poll_start = time.time()
         while time.time() - poll_start < self.poll_timeout:
-            build = self.koji_session.getBuild(nvr)
-            if build:
+            still_pending = []
+            for nvr, build in zip(pending,
+                                  koji_multicall_map(self.koji_session, 'getBuild', pending)):
+                if not build:
+                    still_pending.append(nvr)
+                    continue
+
                 self.log.info('Parent image Koji build found with id %s', build.get('id'))
                 if build['state'] == koji.BUILD_STATES['COMPLETE']:
-                    return build
-                elif build['state'] != koji.BUILD_STATES['BUILDING']:
+                    builds[nvr] = build
+                elif build['state'] == koji.BUILD_STATES['BUILDING']:
+                    still_pending.append(nvr)
+                else:
                     exc_msg = ('Parent image Koji build for {} with id {} state is not COMPLETE.')
                     raise KojiParentBuildMissing(exc_msg.format(nvr, build.get('id')))
+
+            pending = still_pending
+            if not pending:
+                return builds
             time.sleep(self.poll_interval)
-        raise KojiParentBuildMissing('Parent image Koji build NOT found for {}!'.format(nvr))
+        raise KojiParentBuildMissing('Parent image Koji build NOT found for {}!'
+                                     .format(', '.join(pending)))
 
     def make_result(self):
         """Construct the result dict to be preserved in the build metadata."""
@@ -16,8 +16,11 @@ this build so that it isn't removed by other builds doing clean-up.
 
 from __future__ import unicode_literals, absolute_import
 
+from multiprocessing.pool import ThreadPool
+
 import docker
 
+from atomic_reactor.constants import DOCKER_PULL_MAX_WORKERS, PLUGIN_PULL_BASE_IMAGE_KEY
 from atomic_reactor.plugin import PreBuildPlugin
 from atomic_reactor.util import (get_build_json, get_manifest_list,
                                  get_config_from_registry, ImageName,
@@ -34,11 +37,12 @@ from osbs.utils import RegistryURI
 
 
 class PullBaseImagePlugin(PreBuildPlugin):
-    key = "pull_base_image"
+    key = PLUGIN_PULL_BASE_IMAGE_KEY
     is_allowed_to_fail = False
 
     def __init__(self, tasker, workflow, parent_registry=None, parent_registry_insecure=False,
-                 check_platforms=False, inspect_only=False, parent_images_digests=None):
+                 check_platforms=False, inspect_only=False, parent_images_digests=None,
+                 max_workers=DOCKER_PULL_MAX_WORKERS):
         """
         constructor
 
@@ -49,6 +53,7 @@ class PullBaseImagePlugin(PreBuildPlugin):
         :param check_platforms: validate parent images provide all platforms expected for the build
         :param inspect_only: bool, if set to True, base images will not be pulled
         :param parent_images_digests: dict, parent images manifest digests
+        :param max_workers: int, max number of parent images processed concurrently
         """
         # call parent constructor
         super(PullBaseImagePlugin, self).__init__(tasker, workflow)
@@ -72,6 +77,7 @@ class PullBaseImagePlugin(PreBuildPlugin):
             metadata.update(parent_images_digests)
 
         self.manifest_list_cache = {}
+        self.max_workers = max(max_workers, 1)
 
     def run(self):
         """
@@ -81,7 +87,9 @@ class PullBaseImagePlugin(PreBuildPlugin):
 
         build_json = get_build_json()
         organization = get_registries_organization(self.workflow)
-        digest_fetching_exceptions = []
+
+        # Resolve names first, parents may be renamed in place
+        parents = []
         for nonce, parent in enumerate(sorted(self.workflow.builder.parent_images.keys(),
                                               key=str)):
             if base_image_is_custom(parent.to_str()):
@@ -89,11 +97,9 @@ class PullBaseImagePlugin(PreBuildPlugin):
 
             image = parent
             is_base_image = False
-            use_original_tag = False
             # original_base_image is an ImageName, so compare parent as an ImageName also
             if image == self.workflow.builder.original_base_image:
                 is_base_image = True
-                use_original_tag = True
                 image = self._resolve_base_image(build_json)
 
             image = self._ensure_image_registry(image)
@@ -102,23 +108,42 @@ class PullBaseImagePlugin(PreBuildPlugin):
                 image.enclose(organization)
                 parent.enclose(organization)
 
-            if self.check_platforms:
-                # run only at orchestrator
-                self._validate_platforms_in_image(image)
-                try:
-                    self._store_manifest_digest(image, use_original_tag=use_original_tag)
-                except RuntimeError as exc:
-                    digest_fetching_exceptions.append(exc)
-
-            image_with_digest = self._get_image_with_digest(image)
-            if image_with_digest is None:
-                self.log.warning("Cannot resolve manifest digest for image '%s'", image)
-            else:
-                self.log.info("Replacing image '%s' with '%s'", image, image_with_digest)
-                image = image_with_digest
+            parents.append((parent, image, is_base_image, str(nonce)))
+
+        # Registry requests and pulls of different parents don't depend
+        # on each other, overlap them
+        def process(parent_info):
+            parent, image, is_base_image, nonce = parent_info
+            try:
+                return self._process_parent_image(image, is_base_image, build_json, nonce), None
+            except Exception as exc:
+                self.log.error("processing parent image '%s' failed: %s", parent, exc)
+                return None, exc
+
+        if len(parents) > 1 and self.max_workers > 1:
+            pool = ThreadPool(min(self.max_workers, len(parents)))
+            try:
+                results = pool.map(process, parents)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            results = []
+            for parent_info in parents:
+                results.append(process(parent_info))
+                if results[-1][1] is not None:
+                    break
+
+        # Results are stored in the same order as when processing one by one
+        digest_fetching_exceptions = []
+        for (parent, _, is_base_image, _), (result, exc) in zip(parents, results):
+            if exc is not None:
+                raise exc
+
+            image, digest_exc = result
+            if digest_exc is not None:
+                digest_fetching_exceptions.append(digest_exc)
 
-            if not self.inspect_only:
-                image = self._pull_and_tag_image(image, build_json, str(nonce))
             self.workflow.builder.recreate_parent_images()
             self.workflow.builder.parent_images[parent] = image
 
@@ -137,6 +162,38 @@ class PullBaseImagePlugin(PreBuildPlugin):
         self.workflow.builder.parents_pulled = not self.inspect_only
         self.workflow.builder.base_image_insecure = self.parent_registry_insecure
 
+    def _process_parent_image(self, image, is_base_image, build_json, nonce):
+        """
+        Validate and pull a single parent image
+
+        :param image: ImageName, parent image, including registry
+        :param is_base_image: bool, whether image is the base image
+        :param build_json: dict, build metadata
+        :param nonce: str, tag of the unique name given to the pulled image
+        :return: tuple, image to use for the build, and RuntimeError raised
+                 when fetching manifest digest (None if there's none)
+        """
+        digest_exc = None
+        if self.check_platforms:
+            # run only at orchestrator
+            self._validate_platforms_in_image(image)
+            try:
+                self._store_manifest_digest(image, use_original_tag=is_base_image)
+            except RuntimeError as exc:
+                digest_exc = exc
+
+        image_with_digest = self._get_image_with_digest(image)
+        if image_with_digest is None:
+            self.log.warning("Cannot resolve manifest digest for image '%s'", image)
+        else:
+            self.log.info("Replacing image '%s' with '%s'", image, image_with_digest)
+            image = image_with_digest
+
+        if not self.inspect_only:
+            image = self._pull_and_tag_image(image, build_json, nonce)
+
+        return image, digest_exc
+
     def _get_image_with_digest(self, image):
         image_str = image.to_str()
         try:
@@ -11,6 +11,7 @@ from __future__ import absolute_import
 from copy import deepcopy
 from atomic_reactor.cachito_util import CachitoAPI
 from atomic_reactor.plugin import PreBuildPlugin
+from atomic_reactor.registry_cache import registry_cache
 from atomic_reactor.constants import (CONTAINER_BUILD_METHODS, CONTAINER_DEFAULT_BUILD_METHOD,
                                       CONTAINER_BUILDAH_BUILD_METHOD)
 from atomic_reactor.util import (read_yaml, read_yaml_from_file_path,
@@ -411,6 +412,10 @@ def get_source_container(workflow, fallback=NO_FALLBACK):
     return get_value(workflow, 'source_container', fallback)
 
 
+def get_registry_cache(workflow, fallback=NO_FALLBACK):
+    return get_value(workflow, 'registry_cache', fallback)
+
+
 class ClusterConfig(object):
     """
     Configuration relating to a particular cluster
@@ -590,3 +595,8 @@ class ReactorConfigPlugin(PreBuildPlugin):
         self.workflow.default_image_build_method = default_image_build_method
         self.workflow.builder.tasker.build_method = (source_image_build_method or
                                                      default_image_build_method)
+
+        registry_cache_conf = get_registry_cache(self.workflow, fallback=None)
+        if registry_cache_conf:
+            self.log.info("configuring registry cache: %s", registry_cache_conf)
+            registry_cache.configure(**registry_cache_conf)
@@ -13,11 +13,13 @@ import yaml
 from collections import defaultdict
 
 from atomic_reactor.constants import (PLUGIN_KOJI_PARENT_KEY, PLUGIN_RESOLVE_COMPOSES_KEY,
+                                      PLUGIN_CHECK_AND_SET_PLATFORMS_KEY,
                                       REPO_CONTENT_SETS_CONFIG, BASE_IMAGE_KOJI_BUILD)
 
 from atomic_reactor.plugin import PreBuildPlugin
 from atomic_reactor.plugins.build_orchestrate_build import override_build_kwarg
-from atomic_reactor.plugins.pre_check_and_set_rebuild import is_rebuild
+from atomic_reactor.plugins.pre_check_and_set_rebuild import (is_rebuild,
+                                                              CheckAndSetRebuildPlugin)
 from atomic_reactor.plugins.pre_reactor_config import (get_config,
                                                        get_odcs_session,
                                                        get_koji_session, get_koji)
@@ -38,6 +40,9 @@ class ResolveComposesPlugin(PreBuildPlugin):
 
     key = PLUGIN_RESOLVE_COMPOSES_KEY
     is_allowed_to_fail = False
+    reads = (PLUGIN_KOJI_PARENT_KEY, PLUGIN_CHECK_AND_SET_PLATFORMS_KEY,
+             CheckAndSetRebuildPlugin.key)
+    writes = ('all_yum_repourls', 'build_kwargs.yum_repourls')
 
     def __init__(self, tasker, workflow,
                  odcs_url=None,
@@ -104,6 +109,7 @@ class ResolveComposesPlugin(PreBuildPlugin):
         self.odcs_config = None
         self.compose_config = None
         self.composes_info = None
+        self.compose_wait_times = None
         self._parent_signing_intent = None
         self.repourls = repourls or []
         self.inherit = self.workflow.source.config.inherit
@@ -255,18 +261,26 @@ class ResolveComposesPlugin(PreBuildPlugin):
 
     def wait_for_composes(self):
         self.log.debug('Waiting for ODCS composes to be available: %s', self.all_compose_ids)
-        self.composes_info = []
-        for compose_id in self.all_compose_ids:
-            compose_info = self.odcs_client.wait_for_compose(compose_id)
-
-            if self._needs_renewal(compose_info):
-                compose_info = self.odcs_client.renew_compose(compose_id)
-                compose_id = compose_info['id']
-                compose_info = self.odcs_client.wait_for_compose(compose_id)
-
-            self.composes_info.append(compose_info)
+        composes, wait_times = self.odcs_client.wait_for_composes(self.all_compose_ids)
 
+        renewed_ids = {}
+        for compose_id in self.all_compose_ids:
+            if compose_id not in renewed_ids and self._needs_renewal(composes[compose_id]):
+                renewed_ids[compose_id] = self.odcs_client.renew_compose(compose_id)['id']
+
+        if renewed_ids:
+            renewed, renewed_wait_times = self.odcs_client.wait_for_composes(
+                list(renewed_ids.values()))
+            composes.update(renewed)
+            for compose_id, renewed_id in renewed_ids.items():
+                wait_times[renewed_id] = (wait_times.pop(compose_id) +
+                                          renewed_wait_times[renewed_id])
+
+        self.composes_info = [composes[renewed_ids.get(compose_id, compose_id)]
+                              for compose_id in self.all_compose_ids]
         self.all_compose_ids = [item['id'] for item in self.composes_info]
+        self.compose_wait_times = {compose_id: wait_times[compose_id]
+                                   for compose_id in self.all_compose_ids}
 
     def _needs_renewal(self, compose_info):
         if compose_info['state_name'] == 'removed':
@@ -337,6 +351,7 @@ class ResolveComposesPlugin(PreBuildPlugin):
     def make_result(self):
         result = {
             'composes': self.composes_info,
+            'compose_wait_times': self.compose_wait_times,
             'signing_intent': self.compose_config.signing_intent['name'],
             'signing_intent_overridden': self.compose_config.has_signing_intent_changed(),
         }
@@ -28,6 +28,9 @@ class ResolveRemoteSourcePlugin(PreBuildPlugin):
 
     key = PLUGIN_RESOLVE_REMOTE_SOURCE
     is_allowed_to_fail = False
+    reads = ()
+    writes = ('remote_source_archive', 'build_kwargs.remote_source_url',
+              'build_kwargs.remote_source_build_args')
 
     def __init__(self, tasker, workflow):
         """
@@ -19,42 +19,7 @@ from atomic_reactor.plugin import PrePublishPlugin
 from atomic_reactor.plugins.pre_flatpak_create_dockerfile import get_flatpak_source_info
 from atomic_reactor.plugins.pre_reactor_config import get_flatpak_metadata
 from atomic_reactor.rpm_util import parse_rpm_output
-from atomic_reactor.util import df_parser, get_exported_image_metadata
-
-
-# This converts the generator provided by the export() operation to a file-like
-# object with a read that we can pass to tarfile.
-class StreamAdapter(object):
-    def __init__(self, gen):
-        self.gen = gen
-        self.buf = None
-        self.pos = None
-
-    def read(self, count):
-        pieces = []
-        remaining = count
-        while remaining > 0:
-            if not self.buf:
-                try:
-                    self.buf = next(self.gen)
-                    self.pos = 0
-                except StopIteration:
-                    break
-
-            if len(self.buf) - self.pos < remaining:
-                pieces.append(self.buf[self.pos:])
-                remaining -= (len(self.buf) - self.pos)
-                self.buf = None
-                self.pos = None
-            else:
-                pieces.append(self.buf[self.pos:self.pos + remaining])
-                self.pos += remaining
-                remaining = 0
-
-        return b''.join(pieces)
-
-    def close(self):
-        pass
+from atomic_reactor.util import df_parser, get_exported_image_metadata, StreamAdapter
 
 
 class FlatpakCreateOciPlugin(PrePublishPlugin):
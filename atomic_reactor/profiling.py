@@ -0,0 +1,118 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+Resource usage profiling of plugins.
+"""
+from __future__ import absolute_import
+
+import cProfile
+import logging
+import os
+import resource
+
+from atomic_reactor.util import http_stats
+
+
+logger = logging.getLogger(__name__)
+
+PROC_SELF_IO = '/proc/self/io'
+
+
+def read_proc_io(path=PROC_SELF_IO):
+    """
+    Read I/O counters of the current process
+
+    :param path: str, path to the io file in procfs
+    :return: dict, counter names mapped to their values, empty if not available
+    """
+    counters = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                try:
+                    counters[name.strip()] = int(value)
+                except ValueError:
+                    continue
+    except (IOError, OSError):
+        pass
+
+    return counters
+
+
+class PluginProfiler(object):
+    """
+    Context manager recording resources consumed while running a plugin
+
+    The measurements are process-wide, so they include whatever other
+    threads do at the same time.
+
+    After exiting the context, resources holds a dict with:
+      - cpu_user, cpu_system: float, CPU time in seconds
+      - max_rss_delta: int, growth of peak resident set size in bytes
+      - io_read_bytes, io_write_bytes: int, bytes read from and written to
+        storage (None when /proc/self/io is not available)
+      - http_requests, http_bytes: int, responses and bytes received through
+        util.get_retrying_requests_session
+      - profile: str, path to the cProfile dump (only if profile_dir is set)
+    """
+
+    def __init__(self, name, profile_dir=None):
+        """
+        :param name: str, plugin key
+        :param profile_dir: str, directory to store cProfile dumps in, None
+                            to not run cProfile
+        """
+        self.name = name
+        self.profile_dir = profile_dir
+        self.resources = None
+        self._profile = None
+
+    def __enter__(self):
+        self._start_usage = resource.getrusage(resource.RUSAGE_SELF)
+        self._start_io = read_proc_io()
+        self._start_http = http_stats.get_counts()
+
+        if self.profile_dir:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self._profile:
+            self._profile.disable()
+
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        io = read_proc_io()
+        http_requests, http_bytes = http_stats.get_counts()
+
+        def io_delta(name):
+            if name in io and name in self._start_io:
+                return io[name] - self._start_io[name]
+            return None
+
+        self.resources = {
+            'cpu_user': usage.ru_utime - self._start_usage.ru_utime,
+            'cpu_system': usage.ru_stime - self._start_usage.ru_stime,
+            # ru_maxrss is in KiB on Linux
+            'max_rss_delta': (usage.ru_maxrss - self._start_usage.ru_maxrss) * 1024,
+            'io_read_bytes': io_delta('read_bytes'),
+            'io_write_bytes': io_delta('write_bytes'),
+            'http_requests': http_requests - self._start_http[0],
+            'http_bytes': http_bytes - self._start_http[1],
+        }
+
+        if self._profile:
+            path = os.path.join(self.profile_dir, '{}.prof'.format(self.name))
+            try:
+                if not os.path.isdir(self.profile_dir):
+                    os.makedirs(self.profile_dir)
+                self._profile.dump_stats(path)
+                self.resources['profile'] = path
+            except (IOError, OSError) as exc:
+                logger.warning("failed to store profile of plugin '%s': %s", self.name, exc)
@@ -0,0 +1,236 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+Cache of registry responses.
+
+Manifests and blobs referenced by digest never change, so responses for them
+are kept until evicted from the in-memory LRU, and optionally also stored on
+disk. Responses for tags are only kept in memory, for a short time, and are
+forgotten when the build pushes to their repository.
+
+Responses are cached per credentials and access scope, so that one session
+is never served what only another one is allowed to read.
+"""
+from __future__ import absolute_import, unicode_literals
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TAG_TTL = 30
+
+
+def is_digest(reference):
+    """
+    Tell whether a manifest reference is a digest rather than a tag
+
+    Tags may not contain ':', digests always do (algorithm:hex).
+    """
+    return ':' in reference
+
+
+class RegistryCache(object):
+    """
+    Thread-safe cache of successful registry responses
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, tag_ttl=DEFAULT_TAG_TTL, cache_dir=None):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.configure(max_entries=max_entries, tag_ttl=tag_ttl, cache_dir=cache_dir)
+
+    def configure(self, max_entries=DEFAULT_MAX_ENTRIES, tag_ttl=DEFAULT_TAG_TTL, cache_dir=None):
+        """
+        :param max_entries: int, maximum number of responses kept in memory,
+                            0 disables in-memory caching
+        :param tag_ttl: int, seconds responses for tags are valid for,
+                        0 disables caching of tags
+        :param cache_dir: str, directory to store responses for digests in,
+                          None to only keep them in memory
+        """
+        with self._lock:
+            self.max_entries = max_entries
+            self.tag_ttl = tag_ttl
+            self.cache_dir = cache_dir
+            self._evict()
+
+        if cache_dir and not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    @staticmethod
+    def make_key(registry, url, media_type=None, method='GET', auth=None):
+        """
+        :param registry: str, registry the request is sent to
+        :param url: str, URL relative to registry
+        :param media_type: str, accepted media type, None for blobs
+        :param method: str, HTTP method
+        :param auth: str, identity of the credentials and access scope
+                     the request is sent with, see RegistrySession.auth_identity
+        :return: tuple
+        """
+        return (registry, url, media_type, method, auth)
+
+    def get(self, key, reference):
+        """
+        Return cached response, or None
+
+        :param key: tuple, as returned by make_key()
+        :param reference: str, digest or tag the response is for
+        :return: requests.Response or None
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                data, expires_at = entry
+                if expires_at is None or time.time() < expires_at:
+                    # re-insert as the most recently used
+                    self._entries[key] = entry
+                else:
+                    data = None
+            else:
+                data = None
+
+        if data is None and is_digest(reference):
+            data = self._load(key)
+            if data is not None:
+                self._store_in_memory(key, data, None)
+
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        return self._build_response(data)
+
+    def set(self, key, reference, response):
+        """
+        Cache response
+
+        :param key: tuple, as returned by make_key()
+        :param reference: str, digest or tag the response is for
+        :param response: requests.Response, successful response
+        """
+        data = {
+            'url': response.url,
+            'status_code': response.status_code,
+            'headers': dict(response.headers),
+            'content': base64.b64encode(response.content or b'').decode('ascii'),
+        }
+
+        if is_digest(reference):
+            self._store_in_memory(key, data, None)
+            self._save(key, data)
+        elif self.tag_ttl > 0:
+            self._store_in_memory(key, data, time.time() + self.tag_ttl)
+
+    def invalidate_tags(self, registry, repository):
+        """
+        Forget responses for tags of repository, e.g. after pushing to it
+
+        Responses for digests are kept, they never change.
+
+        :param registry: str, registry the repository is in
+        :param repository: str, repository including namespace
+        """
+        prefix = '/v2/{}/manifests/'.format(repository)
+        with self._lock:
+            stale = [key for key, (_, expires_at) in self._entries.items()
+                     if expires_at is not None and key[0] == registry and
+                     key[1].startswith(prefix)]
+            for key in stale:
+                del self._entries[key]
+
+        if stale:
+            logger.debug('forgot %d cached tag responses for %s/%s',
+                         len(stale), registry, repository)
+
+    def clear(self):
+        """
+        Forget responses kept in memory and reset statistics
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+            }
+
+    def _store_in_memory(self, key, data, expires_at):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (data, expires_at)
+            self._evict()
+
+    def _evict(self):
+        while len(self._entries) > max(self.max_entries, 0):
+            self._entries.popitem(last=False)
+
+    def _get_path(self, key):
+        name = hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, name)
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+
+        try:
+            with open(self._get_path(key)) as f:
+                return json.load(f)
+        except (IOError, OSError):
+            return None
+        except ValueError:
+            logger.warning('ignoring corrupted registry cache entry for %s', key[1])
+            return None
+
+    def _save(self, key, data):
+        if not self.cache_dir:
+            return
+
+        try:
+            # write to a temporary file first, so that concurrent readers
+            # never see partially written entries
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.rename(tmp_path, self._get_path(key))
+        except (IOError, OSError) as exc:
+            logger.warning('unable to store registry cache entry for %s: %s', key[1], exc)
+
+    @staticmethod
+    def _build_response(data):
+        response = requests.Response()
+        response.url = data['url']
+        response.status_code = data['status_code']
+        response.headers = CaseInsensitiveDict(data['headers'])
+        response._content = base64.b64decode(data['content'])
+        return response
+
+
+# Shared by all registry queries in the process
+registry_cache = RegistryCache()
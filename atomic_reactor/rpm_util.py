@@ -7,8 +7,22 @@ of the BSD license. See the LICENSE file for details.
 """
 from __future__ import absolute_import
 
+import json
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+from collections import namedtuple, OrderedDict
+from operator import itemgetter
+
 import rpm
 
+from atomic_reactor.constants import WHITEOUT_OPAQUE, WHITEOUT_PREFIX
+
+logger = logging.getLogger(__name__)
+
 image_component_rpm_tags = [
     'NAME',
     'VERSION',
@@ -22,21 +36,196 @@ image_component_rpm_tags = [
     'SIGGPG:pgpsig',
 ]
 
+# keys of dicts describing rpm packages, see parse_rpm_output
+RPM_COMPONENT_FIELDS = ('type', 'name', 'version', 'release', 'arch', 'sigmd5', 'signature',
+                        'epoch')
+
+# locations of the rpm database, relative to the root filesystem
+RPMDB_PATHS = ('var/lib/rpm', 'usr/lib/sysimage/rpm')
 
-def get_rpm_list(tags=None, separator=';'):
+# rpm lists read from image layers, keyed by the layers the rpm database
+# comes from, so that images sharing them are not queried again; the least
+# recently used lists are dropped when there are more than
+# IMAGE_RPM_LISTS_MAX_ENTRIES of them
+IMAGE_RPM_LISTS_MAX_ENTRIES = 16
+_image_rpm_lists = OrderedDict()
+_image_rpm_lists_lock = threading.Lock()
+
+# macros are global to the process, plugins may run in several threads
+_rpmdb_lock = threading.Lock()
+
+
+def get_rpm_list(tags=None, separator=';', root=None):
     """
     Return a list of RPMs in the format expected by parse_rpm_output.
+
+    :param tags: list, str fields to query
+    :param separator: str, separator of fields
+    :param root: str, path to a root filesystem whose rpm database to read,
+                 None for the host
     """
     if tags is None:
         tags = image_component_rpm_tags
-    ts = rpm.TransactionSet()
-    mi = ts.dbMatch()
-    rpms = []
-    for h in mi:
-        rpms.append(separator.join([h.sprintf("%%{%s}" % tag) for tag in tags]))
+
+    dbpath = None
+    if root is not None:
+        for path in RPMDB_PATHS:
+            if os.path.isdir(os.path.join(root, path)):
+                dbpath = '/' + path
+                break
+        else:
+            raise RuntimeError('No rpm database found in {}'.format(root))
+
+    with _rpmdb_lock:
+        if dbpath is not None:
+            # the backend (bdb, ndb or sqlite) is detected from the database files
+            rpm.addMacro('_dbpath', dbpath)
+        try:
+            ts = rpm.TransactionSet(root or '/')
+            mi = ts.dbMatch()
+            rpms = []
+            for h in mi:
+                rpms.append(separator.join([h.sprintf("%%{%s}" % tag) for tag in tags]))
+            ts.closeDB()
+        finally:
+            if dbpath is not None:
+                rpm.delMacro('_dbpath')
+
     return rpms
 
 
+def _in_rpmdb(path):
+    return any(path.startswith(dbpath + '/') for dbpath in RPMDB_PATHS)
+
+
+def _affects_rpmdb(path):
+    return any(path == dbpath or dbpath.startswith(path + '/') or path.startswith(dbpath + '/')
+               for dbpath in RPMDB_PATHS)
+
+
+def _read_layer_rpmdb(layer, stage_dir):
+    """
+    Extract rpm database files changed by a layer
+
+    :param layer: file-like object, layer tarball
+    :param stage_dir: str, directory to extract files to
+    :return: tuple (removed, files); removed is a list of str, paths removed
+             by whiteouts; files is a dict, paths in the root filesystem mapped
+             to paths of extracted files
+    """
+    removed = []
+    files = {}
+    with tarfile.open(fileobj=layer, mode='r|*') as tar:
+        for member in tar:
+            path = os.path.normpath(member.name.lstrip('/'))
+            dirname, basename = os.path.split(path)
+            if basename == WHITEOUT_OPAQUE:
+                # content of the directory in lower layers is hidden
+                if _affects_rpmdb(dirname):
+                    removed.append(dirname)
+            elif basename.startswith(WHITEOUT_PREFIX):
+                target = os.path.join(dirname, basename[len(WHITEOUT_PREFIX):])
+                if _affects_rpmdb(target):
+                    removed.append(target)
+            elif member.isfile() and _in_rpmdb(path):
+                fd, staged = tempfile.mkstemp(dir=stage_dir)
+                with os.fdopen(fd, 'wb') as f:
+                    shutil.copyfileobj(tar.extractfile(member), f)
+                files[path] = staged
+
+    return removed, files
+
+
+def get_image_rpm_list(image_archive, tags=None, separator=';'):
+    """
+    Return a list of RPMs installed in an image, in the format expected by
+    parse_rpm_output, without running a container
+
+    The rpm database is extracted from layers of the image and read
+    directly. Both the BDB/NDB and sqlite databases are supported, as far
+    as the rpm library on the host supports them.
+
+    :param image_archive: file-like object, docker-archive (output of docker
+                          save), uncompressed or compressed in a single gzip
+                          member or xz stream; it's read once, as a stream, so
+                          open files written by the compress plugin with
+                          compress_util.open_decompressed or
+                          util.open_image_archive
+    :param tags: list, str fields to query
+    :param separator: str, separator of fields
+    :return: list of str, None if the image has no rpm database
+    """
+    if tags is None:
+        tags = image_component_rpm_tags
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        manifest = None
+        links = {}
+        layer_changes = {}
+        with tarfile.open(fileobj=image_archive, mode='r|*') as archive:
+            for member in archive:
+                if member.name == 'manifest.json':
+                    manifest = json.loads(archive.extractfile(member).read().decode('utf-8'))
+                elif member.issym():
+                    # layers shared by several images are stored only once
+                    links[member.name] = os.path.normpath(
+                        os.path.join(os.path.dirname(member.name), member.linkname))
+                elif member.isfile() and not member.name.endswith('.json'):
+                    try:
+                        layer_changes[member.name] = _read_layer_rpmdb(
+                            archive.extractfile(member), tmpdir)
+                    except tarfile.ReadError:
+                        logger.debug("%s in image archive is not a layer", member.name)
+
+        if not manifest:
+            raise RuntimeError('Image archive does not contain manifest.json')
+
+        layers = [links.get(layer, layer) for layer in manifest[0]['Layers']]
+        changed = [i for i, layer in enumerate(layers) if any(layer_changes.get(layer, ()))]
+        if not changed:
+            return None
+
+        layers = layers[:changed[-1] + 1]
+        cache_key = (tuple(layers), tuple(tags), separator)
+        with _image_rpm_lists_lock:
+            cached = _image_rpm_lists.pop(cache_key, None)
+            if cached is not None:
+                # most recently used
+                _image_rpm_lists[cache_key] = cached
+        if cached is not None:
+            logger.debug("using cached rpm list of layer %s", layers[-1])
+            return list(cached)
+
+        files = {}
+        for layer in layers:
+            removed, added = layer_changes.get(layer, ((), {}))
+            for path in removed:
+                for existing in list(files):
+                    if existing == path or existing.startswith(path + '/'):
+                        del files[existing]
+            files.update(added)
+
+        if not files:
+            return None
+
+        root = os.path.join(tmpdir, 'root')
+        for path, staged in files.items():
+            dest = os.path.join(root, path)
+            if not os.path.isdir(os.path.dirname(dest)):
+                os.makedirs(os.path.dirname(dest))
+            os.rename(staged, dest)
+
+        rpms = get_rpm_list(tags=tags, separator=separator, root=root)
+        with _image_rpm_lists_lock:
+            _image_rpm_lists[cache_key] = rpms
+            while len(_image_rpm_lists) > IMAGE_RPM_LISTS_MAX_ENTRIES:
+                _image_rpm_lists.popitem(last=False)
+        return list(rpms)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
 def rpm_qf_args(tags=None, separator=';'):
     """
     Return the arguments to pass to rpm to list RPMs in the format expected
@@ -50,63 +239,101 @@ def rpm_qf_args(tags=None, separator=';'):
     return r"-qa --qf '{0}\n'".format(fmt)
 
 
-def parse_rpm_output(output, tags=None, separator=';'):
+class RpmComponent(namedtuple('RpmComponent', RPM_COMPONENT_FIELDS)):
     """
-    Parse output of the rpm query.
+    Compact description of an rpm package, as parsed by parse_rpm_output
+    """
+    __slots__ = ()
+
+    def to_dict(self):
+        """
+        :return: dict, the same as parse_rpm_output returns for the package
+        """
+        return dict(zip(self._fields, self))
 
-    :param output: list, decoded output (str) from the rpm subprocess
+
+def iter_rpm_output(output, tags=None, separator=';', compact=False):
+    """
+    Parse output of the rpm query, one package at a time.
+
+    Positions of the fields are looked up only once, so lines can be
+    consumed as they come, e.g. from a file object.
+
+    :param output: iterable of str, lines of decoded output from the rpm subprocess
     :param tags: list, str fields used for query output
-    :return: list, dicts describing each rpm package
+    :param separator: str, separator of fields
+    :param compact: bool, yield RpmComponent instances instead of dicts
+    :return: generator of dicts (or RpmComponent instances) describing each
+             rpm package
     """
 
     if tags is None:
         tags = image_component_rpm_tags
 
-    def field(tag):
-        """
-        Get a field value by name
-        """
+    def position(tag):
+        # missing tags refer to the placeholder appended to each line
         try:
-            value = fields[tags.index(tag)]
+            return tags.index(tag)
         except ValueError:
-            return None
-
-        if value == '(none)':
-            return None
-
-        return value
+            return -1
 
-    components = []
+    select = itemgetter(*[position(tag) for tag in ('NAME', 'VERSION', 'RELEASE', 'ARCH',
+                                                    'SIGMD5', 'EPOCH', 'SIGPGP:pgpsig',
+                                                    'SIGGPG:pgpsig')])
+    tags_count = len(tags)
+    none = '(none)'
     sigmarker = 'Key ID '
+    make_component = RpmComponent._make
+
     for rpm_info in output:
         fields = rpm_info.rstrip('\n').split(separator)
-        if len(fields) < len(tags):
+        if len(fields) < tags_count:
+            continue
+
+        fields.append(none)
+        name, version, release, arch, sigmd5, epoch, sigpgp, siggpg = select(fields)
+        if name == 'gpg-pubkey':
             continue
 
-        signature = field('SIGPGP:pgpsig') or field('SIGGPG:pgpsig')
+        signature = sigpgp if sigpgp != none else siggpg if siggpg != none else None
         if signature:
             parts = signature.split(sigmarker, 1)
             if len(parts) > 1:
                 signature = parts[1]
 
-        component_rpm = {
-            'type': 'rpm',
-            'name': field('NAME'),
-            'version': field('VERSION'),
-            'release': field('RELEASE'),
-            'arch': field('ARCH'),
-            'sigmd5': field('SIGMD5'),
-            'signature': signature,
-        }
+        name = name if name != none else None
+        version = version if version != none else None
+        release = release if release != none else None
+        arch = arch if arch != none else None
+        sigmd5 = sigmd5 if sigmd5 != none else None
+        # epoch must be an integer or None
+        epoch = int(epoch) if epoch != none else None
 
-        # Special handling for epoch as it must be an integer or None
-        epoch = field('EPOCH')
-        if epoch is not None:
-            epoch = int(epoch)
+        if compact:
+            yield make_component(('rpm', name, version, release, arch, sigmd5, signature,
+                                  epoch))
+        else:
+            yield {
+                'type': 'rpm',
+                'name': name,
+                'version': version,
+                'release': release,
+                'arch': arch,
+                'sigmd5': sigmd5,
+                'signature': signature,
+                'epoch': epoch,
+            }
 
-        component_rpm['epoch'] = epoch
 
-        if component_rpm['name'] != 'gpg-pubkey':
-            components.append(component_rpm)
+def parse_rpm_output(output, tags=None, separator=';', compact=False):
+    """
+    Parse output of the rpm query.
 
-    return components
+    :param output: iterable of str, lines of decoded output from the rpm
+                   subprocess (e.g. a list or a file object)
+    :param tags: list, str fields used for query output
+    :param separator: str, separator of fields
+    :param compact: bool, return RpmComponent instances instead of dicts
+    :return: list, dicts (or RpmComponent instances) describing each rpm package
+    """
+    return list(iter_rpm_output(output, tags=tags, separator=separator, compact=compact))
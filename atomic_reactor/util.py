@@ -25,16 +25,18 @@ import tempfile
 import logging
 import uuid
 import yaml
-import codecs
 import string
 import signal
+import threading
 import traceback
-from collections import namedtuple
+import zlib
+from collections import deque, namedtuple
 from copy import deepcopy
+from multiprocessing.pool import ThreadPool
 from base64 import b64decode
 
 from six.moves.urllib.parse import urlparse
-from six import PY2
+from six import PY2, text_type
 
 from atomic_reactor.constants import (DOCKERFILE_FILENAME, REPO_CONTAINER_CONFIG, TOOLS_USED,
                                       INSPECT_CONFIG,
@@ -49,8 +51,10 @@ from atomic_reactor.constants import (DOCKERFILE_FILENAME, REPO_CONTAINER_CONFIG
                                       PARENT_IMAGE_BUILDS_KEY, PARENT_IMAGES_KOJI_BUILDS,
                                       BASE_IMAGE_KOJI_BUILD, BASE_IMAGE_BUILD_ID_KEY,
                                       PARENT_IMAGES_KEY, SCRATCH_FROM, RELATIVE_REPOS_PATH,
-                                      DOCKERIGNORE)
+                                      DOCKERIGNORE, STREAMED_LOGS_BUFFER_SIZE)
 from atomic_reactor.auth import HTTPRegistryAuth
+from atomic_reactor.compress_util import open_decompressed
+from atomic_reactor.registry_cache import registry_cache
 
 from dockerfile_parse import DockerfileParser
 from pkg_resources import resource_stream
@@ -231,10 +235,106 @@ def figure_out_build_file(absolute_path, local_path=None):
                                                                   DOCKERFILE_FILENAME))
 
 
-class CommandResult(object):
+class LogSpool(object):
+    """
+    Append-only sequence of log lines stored gzip-compressed in an
+    anonymous temporary file
+
+    Iterating reads the lines back lazily, so neither writing nor reading
+    keeps all of them in memory.
+    """
+
+    # gzip header and trailer, see zlib docs
+    GZIP_WBITS = 16 + zlib.MAX_WBITS
+    READ_CHUNK_SIZE = 64 * 1024
+
     def __init__(self):
-        self._logs = []
-        self._parsed_logs = []
+        self._file = tempfile.TemporaryFile()
+        self._compressor = None
+        self._synced = True
+        self._count = 0
+
+    def append(self, line):
+        """
+        :param line: str or bytes, log line, without newline
+        """
+        if not isinstance(line, bytes):
+            line = line.encode('utf-8')
+        if self._compressor is None:
+            # each finished stream is a separate gzip member
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, self.GZIP_WBITS)
+        self._write(self._compressor.compress(line + b'\n'))
+        self._synced = False
+        self._count += 1
+
+    def finish(self):
+        """
+        Terminate the gzip stream, making the file a valid gzip file
+
+        Lines appended later start a new gzip member.
+        """
+        if self._compressor is not None:
+            self._write(self._compressor.flush())
+            self._file.flush()
+            self._compressor = None
+            self._synced = True
+
+    def _write(self, data):
+        # iteration may have moved the position
+        self._file.seek(0, os.SEEK_END)
+        self._file.write(data)
+
+    def _sync(self):
+        # make everything written so far decompressable
+        if not self._synced:
+            self._write(self._compressor.flush(zlib.Z_SYNC_FLUSH))
+            self._synced = True
+
+    def __iter__(self):
+        self._sync()
+        self._file.seek(0, os.SEEK_END)
+        end = self._file.tell()
+        pos = 0
+        decompressor = zlib.decompressobj(self.GZIP_WBITS)
+        pending = b''
+        while pos < end:
+            self._file.seek(pos)
+            chunk = self._file.read(min(self.READ_CHUNK_SIZE, end - pos))
+            pos += len(chunk)
+            while chunk:
+                pending += decompressor.decompress(chunk)
+                chunk = decompressor.unused_data
+                if chunk:
+                    decompressor = zlib.decompressobj(self.GZIP_WBITS)
+
+            lines = pending.split(b'\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line.decode('utf-8', 'replace')
+
+    def __len__(self):
+        return self._count
+
+
+class CommandResult(object):
+    def __init__(self, stream_logs=False, max_buffered_logs=STREAMED_LOGS_BUFFER_SIZE):
+        """
+        :param stream_logs: bool, store log lines in a compressed temporary
+                            file instead of keeping all of them in memory
+        :param max_buffered_logs: int, number of most recent parsed log items
+                                  kept in memory when streaming logs, error
+                                  items are kept always
+        """
+        self._stream_logs = stream_logs
+        if stream_logs:
+            self._logs = LogSpool()
+            self._parsed_logs = deque(maxlen=max_buffered_logs)
+        else:
+            self._logs = []
+            self._parsed_logs = []
+        # (index, item) of error items which may no longer be in _parsed_logs
+        self._error_items = []
+        self._parsed_count = 0
         self._error = None
         self._error_detail = None
 
@@ -243,7 +343,11 @@ class CommandResult(object):
         :param item: dict, decoded log data
         """
         # append here just in case .get bellow fails
-        self._parsed_logs.append(item)
+        if self._stream_logs:
+            self._parsed_logs.append((self._parsed_count, item))
+        else:
+            self._parsed_logs.append(item)
+        self._parsed_count += 1
 
         # make sure the log item is a dictionary object
         if isinstance(item, dict):
@@ -263,13 +367,44 @@ class CommandResult(object):
             self._error_detail = item.get("errorDetail", None)
             if self._error:
                 logger.error(item)
+                if self._stream_logs:
+                    self._error_items.append((self._parsed_count - 1, item))
+
+    def append_log(self, line):
+        """
+        Store a log line as is, without parsing or logging it
+
+        :param line: str, log line
+        """
+        self._logs.append(line)
+
+    def finish(self):
+        """
+        Finish writing streamed logs, no-op when they're kept in memory
+        """
+        if self._stream_logs:
+            self._logs.finish()
 
     @property
     def parsed_logs(self):
-        return self._parsed_logs
+        """
+        :return: list of parsed log items; when streaming logs, only the most
+                 recent ones and earlier error items
+        """
+        if not self._stream_logs:
+            return self._parsed_logs
+
+        if not self._parsed_logs:
+            return []
+        first_buffered = self._parsed_logs[0][0]
+        return ([item for index, item in self._error_items if index < first_buffered] +
+                [item for _, item in self._parsed_logs])
 
     @property
     def logs(self):
+        """
+        :return: list of log lines, or LogSpool reading them lazily when streaming logs
+        """
         return self._logs
 
     @property
@@ -284,16 +419,19 @@ class CommandResult(object):
         return bool(self.error) or bool(self.error_detail)
 
 
-def wait_for_command(logs_generator):
+def wait_for_command(logs_generator, stream_logs=False):
     """
     Create a CommandResult from given iterator
 
+    :param stream_logs: bool, store log lines in a compressed temporary file
+                        instead of keeping all of them in memory
     :return: CommandResult
     """
     logger.info("wait_for_command")
-    cr = CommandResult()
+    cr = CommandResult(stream_logs=stream_logs)
     for item in logs_generator:
         cr.parse_item(item)
+    cr.finish()
 
     logger.info("no more logs")
     return cr
@@ -479,6 +617,23 @@ def _compute_checksums(fd, hash_objs, blocksize=65536):
         buf = fd.read(blocksize)
 
 
+def _get_hash_objects(algorithms):
+    allowed_algorithms = ['md5', 'sha256']
+    if not all(elem in allowed_algorithms for elem in algorithms):
+        raise ValueError('Algorithms supported {}. Found {}'.format(allowed_algorithms, algorithms))
+
+    return [getattr(hashlib, algorithm)() for algorithm in algorithms]
+
+
+def _get_hexdigests(hash_objs):
+    checksums = {}
+    for hash_obj in hash_objs:
+        sum_name = '{}sum'.format(hash_obj.name)
+        checksums[sum_name] = hash_obj.hexdigest()
+        logger.debug('%s: %s', sum_name, checksums[sum_name])
+    return checksums
+
+
 def get_checksums(filename, algorithms):
     """
     Compute a checksum(s) of given file using specified algorithms.
@@ -490,23 +645,131 @@ def get_checksums(filename, algorithms):
     if not algorithms:
         return {}
 
-    allowed_algorithms = ['md5', 'sha256']
-    if not all(elem in allowed_algorithms for elem in algorithms):
-        raise ValueError('Algorithms supported {}. Found {}'.format(allowed_algorithms, algorithms))
-
-    hash_objs = [getattr(hashlib, algorithm)() for algorithm in algorithms]
+    hash_objs = _get_hash_objects(algorithms)
     if hasattr(filename, 'read'):
         _compute_checksums(filename, hash_objs)
     else:
         with open(filename, mode='rb') as f:
             _compute_checksums(f, hash_objs)
 
-    checksums = {}
-    for hash_obj in hash_objs:
-        sum_name = '{}sum'.format(hash_obj.name)
-        checksums[sum_name] = hash_obj.hexdigest()
-        logger.debug('%s: %s', sum_name, checksums[sum_name])
-    return checksums
+    return _get_hexdigests(hash_objs)
+
+
+class ChecksumWriter(object):
+    """
+    Write-only file object computing checksums of the data written through it
+
+    Wrapping the output file of a stream being written (e.g. compressed
+    image) gives its checksums without reading the file again afterwards.
+
+    usage:
+
+        with ChecksumWriter(path, ['md5', 'sha256']) as f:
+            f.write(data)
+        f.checksums  # {'md5sum': ..., 'sha256sum': ...}, same as get_checksums
+        f.size  # number of bytes written
+    """
+    def __init__(self, filename, algorithms):
+        """
+        :param filename: str, path to the output file
+        :param algorithms: list of cryptographic hash functions, currently
+                           supported: md5, sha256
+        """
+        self._hash_objs = _get_hash_objects(algorithms)
+        self.name = filename
+        self.size = 0
+        self._fp = open(filename, 'wb')
+
+    def write(self, data):
+        for hash_object in self._hash_objs:
+            hash_object.update(data)
+        self.size += len(data)
+        self._fp.write(data)
+        return len(data)
+
+    def flush(self):
+        self._fp.flush()
+
+    def close(self):
+        self._fp.close()
+
+    @property
+    def closed(self):
+        return self._fp.closed
+
+    @property
+    def checksums(self):
+        """
+        :return: dict, checksums of data written so far (see get_checksums)
+        """
+        return _get_hexdigests(self._hash_objs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# This converts a generator of chunks, e.g. provided by the export() or
+# get_image() operations, to a file-like object with a read that we can
+# pass to tarfile.
+class StreamAdapter(object):
+    def __init__(self, gen):
+        self.gen = gen
+        self.buf = None
+        self.pos = None
+
+    def read(self, count):
+        pieces = []
+        remaining = count
+        while remaining > 0:
+            if not self.buf:
+                try:
+                    self.buf = next(self.gen)
+                    self.pos = 0
+                except StopIteration:
+                    break
+
+            if len(self.buf) - self.pos < remaining:
+                pieces.append(self.buf[self.pos:])
+                remaining -= (len(self.buf) - self.pos)
+                self.buf = None
+                self.pos = None
+            else:
+                pieces.append(self.buf[self.pos:self.pos + remaining])
+                self.pos += remaining
+                remaining = 0
+
+        return b''.join(pieces)
+
+    def close(self):
+        pass
+
+
+def open_image_archive(tasker, workflow, image):
+    """
+    Open an image as docker-archive, reusing the exported image if possible
+
+    :param tasker: ContainerTasker instance
+    :param workflow: DockerBuildWorkflow instance
+    :param image: str or ImageName, image to fetch from docker if it was not exported
+    :return: file-like object, uncompressed docker-archive; it should be read as a stream
+    """
+    if workflow.exported_image_sequence:
+        image_metadata = workflow.exported_image_sequence[-1]
+        if image_metadata.get('type') == IMAGE_TYPE_DOCKER_ARCHIVE:
+            logger.debug("reading exported image %s", image_metadata['path'])
+            # the compress plugin may have written several gzip members or
+            # xz streams, which tarfile can't read as a stream
+            return open_decompressed(image_metadata['path'])
+
+    logger.debug("fetching image %s from docker", image)
+    image_stream = tasker.get_image(image)
+    if not hasattr(image_stream, 'read'):
+        # docker-py 3.x returns a generator of chunks
+        image_stream = StreamAdapter(iter(image_stream))
+    return image_stream
 
 
 def get_docker_architecture(tasker):
@@ -517,13 +780,26 @@ def get_docker_architecture(tasker):
     return (host_arch, docker_version['Version'])
 
 
-def get_exported_image_metadata(path, image_type):
+def get_exported_image_metadata(path, image_type, checksums=None):
+    """
+    Describe an exported image for workflow.exported_image_sequence
+
+    :param path: str, path to the exported image
+    :param image_type: str, type of the exported image
+    :param checksums: dict, md5sum and sha256sum of the file if they are
+                      already known (e.g. computed while it was written);
+                      when not provided, they are computed from the file
+    :return: dict
+    """
     logger.info('getting metadata for exported image %s (%s)', path, image_type)
     metadata = {'path': path, 'type': image_type}
     if image_type != IMAGE_TYPE_OCI:
         metadata['size'] = os.path.getsize(path)
         logger.debug('size: %d bytes', metadata['size'])
-        metadata.update(get_checksums(path, ['md5', 'sha256']))
+        if checksums:
+            metadata.update(checksums)
+        else:
+            metadata.update(get_checksums(path, ['md5', 'sha256']))
     return metadata
 
 
@@ -732,6 +1008,10 @@ class RegistrySession(object):
             password = dockercfg.get('password')
             auth_b64 = dockercfg.get('auth')
         self.auth = HTTPRegistryAuth(username, password, access=access, auth_b64=auth_b64)
+        # identifies the credentials and access scope in registry_cache keys,
+        # without storing the secrets themselves
+        identity = json.dumps([username, password, auth_b64, list(access or ())])
+        self.auth_identity = hashlib.sha256(identity.encode('utf-8')).hexdigest()
 
         self._fallback = None
         if re.match('http(s)?://', self.registry):
@@ -745,6 +1025,11 @@ class RegistrySession(object):
                 self._fallback = 'http://{}'.format(self.registry)
 
         self.session = get_retrying_requests_session()
+        # Reuse connections opened by other sessions to the same registry
+        adapter = get_registry_adapter(self.registry)
+        hostname = registry_hostname(self.registry)
+        for scheme in ('https', 'http'):
+            self.session.mount('{}://{}/'.format(scheme, hostname), adapter)
 
     def _do(self, f, relative_url, *args, **kwargs):
         kwargs['auth'] = self.auth
@@ -838,7 +1123,8 @@ def get_digests_map_from_annotations(digests_str):
     return digests
 
 
-def query_registry(registry_session, image, digest=None, version='v1', is_blob=False):
+def query_registry(registry_session, image, digest=None, version='v1', is_blob=False,
+                   method='GET', use_cache=True):
     """Return manifest digest for image.
 
     :param registry_session: RegistrySession
@@ -846,6 +1132,9 @@ def query_registry(registry_session, image, digest=None, version='v1', is_blob=F
     :param digest: str, digest of the image manifest
     :param version: str, which manifest schema version to fetch digest
     :param is_blob: bool, read blob config if set to True
+    :param method: str, HTTP method to use, 'GET' or 'HEAD'
+    :param use_cache: bool, when True successful responses are cached (see
+                            registry_cache) and served from the cache
 
     :return: requests.Response object
     """
@@ -858,15 +1147,31 @@ def query_registry(registry_session, image, digest=None, version='v1', is_blob=F
 
     headers = {'Accept': (get_manifest_media_type(version))}
     url = '/v2/{}/{}/{}'.format(context, object_type, reference)
-    logger.debug("query_registry: querying %s, headers: %s", url, headers)
-
-    response = registry_session.get(url, headers=headers)
+    logger.debug("query_registry: querying %s %s, headers: %s", method, url, headers)
+
+    if use_cache:
+        cache_key = registry_cache.make_key(registry_session.registry, url,
+                                            media_type=None if is_blob else headers['Accept'],
+                                            method=method,
+                                            auth=registry_session.auth_identity)
+        response = registry_cache.get(cache_key, reference)
+        if response is not None:
+            logger.debug("query_registry: using cached response")
+            return response
+
+    if method == 'HEAD':
+        response = registry_session.head(url, headers=headers)
+    else:
+        response = registry_session.get(url, headers=headers)
     for r in chain(response.history, [response]):
         logger.debug("query_registry: [%s] %s", r.status_code, r.url)
 
     logger.debug("query_registry: response headers: %s", response.headers)
     response.raise_for_status()
 
+    if use_cache:
+        registry_cache.set(cache_key, reference, response)
+
     return response
 
 
@@ -924,11 +1229,12 @@ def manifest_is_media_type(response, media_type):
     return response_h_prefix == request_h_prefix
 
 
-def get_manifest(image, registry_session, version):
+def get_manifest(image, registry_session, version, method='GET', use_cache=True):
     saved_not_found = None
     media_type = get_manifest_media_type(version)
     try:
-        response = query_registry(registry_session, image, digest=None, version=version)
+        response = query_registry(registry_session, image, digest=None, version=version,
+                                  method=method, use_cache=use_cache)
     except (HTTPError, RetryError) as ex:
         if ex.response.status_code == requests.codes.not_found:
             saved_not_found = ex
@@ -952,6 +1258,11 @@ def get_manifest(image, registry_session, version):
         else:
             raise
 
+    if method == 'HEAD' and 'Content-Type' not in response.headers:
+        # Media type can only be guessed from the manifest itself
+        logger.debug("no Content-Type in HEAD response for %s, fetching manifest", media_type)
+        return get_manifest(image, registry_session, version, use_cache=use_cache)
+
     if not manifest_is_media_type(response, media_type):
         logger.warning("content does not match expected media type")
         return None, saved_not_found
@@ -960,7 +1271,8 @@ def get_manifest(image, registry_session, version):
 
 
 def get_manifest_digests(image, registry, insecure=False, dockercfg_path=None,
-                         versions=('v1', 'v2', 'v2_list', 'oci', 'oci_index'), require_digest=True):
+                         versions=('v1', 'v2', 'v2_list', 'oci', 'oci_index'), require_digest=True,
+                         concurrent=False, use_head=False):
     """Return manifest digest for image.
 
     :param image: ImageName, the remote image to inspect
@@ -971,11 +1283,30 @@ def get_manifest_digests(image, registry, insecure=False, dockercfg_path=None,
     :param versions: tuple, which manifest schema versions to fetch digest
     :param require_digest: bool, when True exception is thrown if no digest is
                                  set in the headers.
+    :param concurrent: bool, when True all versions are queried at once
+    :param use_head: bool, when True HEAD requests are used instead of GET,
+                           manifests are only fetched if the registry doesn't
+                           send Content-Type
 
     :return: dict, versions mapped to their digest
     """
 
     registry_session = RegistrySession(registry, insecure=insecure, dockercfg_path=dockercfg_path)
+    method = 'HEAD' if use_head else 'GET'
+
+    # Tags are usually being checked right after a push, don't use cached responses
+    def probe(version):
+        return get_manifest(image, registry_session, version, method=method, use_cache=False)
+
+    if concurrent and len(versions) > 1:
+        pool = ThreadPool(len(versions))
+        try:
+            results = pool.map(probe, versions)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [probe(version) for version in versions]
 
     digests = {}
     # If all of the media types return a 404 NOT_FOUND status, then we rethrow
@@ -984,9 +1315,8 @@ def get_manifest_digests(image, registry, insecure=False, dockercfg_path=None,
     # This is interesting for the Pulp "retry until the manifest shows up" case.
     all_not_found = True
     saved_not_found = None
-    for version in versions:
+    for version, (response, saved_not_found) in zip(versions, results):
         media_type = get_manifest_media_type(version)
-        response, saved_not_found = get_manifest(image, registry_session, version)
 
         if saved_not_found is None:
             all_not_found = False
@@ -1268,30 +1598,125 @@ def read_yaml_from_file_path(file_path, schema):
     return read_yaml(yaml_data, schema)
 
 
+# compiled JSON schema validators, keyed by schema name and digest of its content
+_schema_validators = {}
+# data which passed validation, keyed by digest of the schema and yaml content
+_validated_yaml = {}
+
+
+def get_validation_cache_dir():
+    """
+    :return: str, directory to persist validated yaml data in, None to only
+             keep it in memory
+    """
+    return os.environ.get('ATOMIC_REACTOR_VALIDATION_CACHE') or None
+
+
+def _get_schema_validator(schema_name, schema_content):
+    schema_digest = hashlib.sha256(schema_content).hexdigest()
+    key = (schema_name, schema_digest)
+    validator = _schema_validators.get(key)
+    if validator is not None:
+        return validator, schema_digest
+
+    try:
+        schema = json.loads(schema_content.decode('utf-8'))
+    except ValueError:
+        logger.error('unable to decode JSON schema, cannot validate')
+        raise
+
+    try:
+        jsonschema.Draft4Validator.check_schema(schema)
+    except jsonschema.SchemaError:
+        logger.error('invalid schema, cannot validate')
+        raise
+
+    validator = jsonschema.Draft4Validator(schema=schema)
+    _schema_validators[key] = validator
+    return validator, schema_digest
+
+
+def _load_validated_yaml(digest):
+    cache_dir = get_validation_cache_dir()
+    if not cache_dir:
+        return None
+
+    path = os.path.join(cache_dir, '{}.json'.format(digest))
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError):
+        return None
+    except ValueError:
+        logger.debug("ignoring corrupted validation cache entry '%s'", path)
+        return None
+
+
+def _store_validated_yaml(digest, data):
+    cache_dir = get_validation_cache_dir()
+    if not cache_dir:
+        return
+
+    try:
+        serialized = json.dumps(data)
+    except (TypeError, ValueError):
+        return
+    # e.g. non-string keys or dates can't be stored as JSON
+    if json.loads(serialized) != data:
+        return
+
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        # write to a temporary file first, so that concurrent readers
+        # never see partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+        with os.fdopen(fd, 'w') as f:
+            f.write(serialized)
+        os.rename(tmp_path, os.path.join(cache_dir, '{}.json'.format(digest)))
+    except (IOError, OSError) as ex:
+        logger.debug("unable to store validated yaml in '%s': %s", cache_dir, ex)
+
+
 def read_yaml(yaml_data, schema):
     """
+    Load yaml content and validate it against JSON schema
+
+    Compiled schema validators and data which passed validation are cached,
+    so identical content is parsed and validated only once per process. When
+    ATOMIC_REACTOR_VALIDATION_CACHE is set to a directory, validated data is
+    also stored there and reused by other processes.
+
     :param yaml_data: string, yaml content
+    :param schema: str, path to the JSON schema in atomic_reactor package
+    :return: validated data; a copy which the caller may modify
     """
     try:
         resource = resource_stream('atomic_reactor', schema)
-        schema = codecs.getreader('utf-8')(resource)
+        try:
+            schema_content = resource.read()
+        finally:
+            resource.close()
     except (IOError, TypeError):
         logger.error('unable to extract JSON schema, cannot validate')
         raise
 
-    try:
-        schema = json.load(schema)
-    except ValueError:
-        logger.error('unable to decode JSON schema, cannot validate')
-        raise
+    validator, schema_digest = _get_schema_validator(schema, schema_content)
+
+    content = yaml_data.encode('utf-8') if isinstance(yaml_data, text_type) else yaml_data
+    digest = hashlib.sha256(schema_digest.encode('utf-8') + b'\0' + content).hexdigest()
+    data = _validated_yaml.get(digest)
+    if data is None:
+        data = _load_validated_yaml(digest)
+        if data is not None:
+            _validated_yaml[digest] = data
+    if data is not None:
+        logger.debug('using cached validated data for %s', schema)
+        return deepcopy(data)
+
     data = yaml.safe_load(yaml_data)
-    validator = jsonschema.Draft4Validator(schema=schema)
     try:
-        jsonschema.Draft4Validator.check_schema(schema)
         validator.validate(data)
-    except jsonschema.SchemaError:
-        logger.error('invalid schema, cannot validate')
-        raise
     except jsonschema.ValidationError:
         for error in validator.iter_errors(data):
             path = "".join(
@@ -1306,6 +1731,8 @@ def read_yaml(yaml_data, schema):
 
         raise
 
+    _validated_yaml[digest] = deepcopy(data)
+    _store_validated_yaml(digest, data)
     return data
 
 
@@ -1340,12 +1767,49 @@ class SessionWithTimeout(requests.Session):
         return super(SessionWithTimeout, self).request(*args, **kwargs)
 
 
+class HTTPStats(object):
+    """
+    Thread-safe counters of HTTP responses received through sessions
+    created by get_retrying_requests_session
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+
+    def count_response(self, response, *args, **kwargs):
+        """
+        requests response hook
+
+        Body size is taken from Content-Length, so that streamed responses
+        don't have to be read here.
+        """
+        try:
+            size = int(response.headers.get('Content-Length', 0))
+        except (TypeError, ValueError):
+            size = 0
+
+        with self._lock:
+            self.requests += 1
+            self.bytes += size
+
+    def get_counts(self):
+        """
+        :return: tuple, number of responses and bytes received so far
+        """
+        with self._lock:
+            return self.requests, self.bytes
+
+
+http_stats = HTTPStats()
+
+
 # This is a hook to mock during tests to temporarily disable retries
 def _http_retries_disabled():
     return False
 
 
-def get_retrying_requests_session(client_statuses=HTTP_CLIENT_STATUS_RETRY,
+def get_retrying_requests_adapter(client_statuses=HTTP_CLIENT_STATUS_RETRY,
                                   times=HTTP_MAX_RETRIES, delay=HTTP_BACKOFF_FACTOR,
                                   method_whitelist=None, raise_on_status=True):
     if _http_retries_disabled():
@@ -1363,13 +1827,60 @@ def get_retrying_requests_session(client_statuses=HTTP_CLIENT_STATUS_RETRY,
     if hasattr(retry, 'raise_on_status'):
         retry.raise_on_status = raise_on_status
 
+    return HTTPAdapter(max_retries=retry)
+
+
+def get_retrying_requests_session(client_statuses=HTTP_CLIENT_STATUS_RETRY,
+                                  times=HTTP_MAX_RETRIES, delay=HTTP_BACKOFF_FACTOR,
+                                  method_whitelist=None, raise_on_status=True):
+    adapter_kwargs = {
+        'client_statuses': client_statuses,
+        'times': times,
+        'delay': delay,
+        'method_whitelist': method_whitelist,
+        'raise_on_status': raise_on_status,
+    }
+
     session = SessionWithTimeout()
-    session.mount('http://', HTTPAdapter(max_retries=retry))
-    session.mount('https://', HTTPAdapter(max_retries=retry))
+    session.mount('http://', get_retrying_requests_adapter(**adapter_kwargs))
+    session.mount('https://', get_retrying_requests_adapter(**adapter_kwargs))
+    session.hooks['response'].append(http_stats.count_response)
 
     return session
 
 
+# HTTP adapters (connection pools) shared by all RegistrySession instances,
+# keyed by registry hostname
+_registry_adapters = {}
+_registry_adapters_lock = threading.Lock()
+
+
+def get_registry_adapter(registry):
+    """
+    Get the HTTP adapter shared by all sessions talking to registry
+
+    :param registry: str, registry hostname:port, optionally with URI schema
+    :return: requests.adapters.HTTPAdapter
+    """
+    hostname = registry_hostname(registry)
+    with _registry_adapters_lock:
+        adapter = _registry_adapters.get(hostname)
+        if adapter is None:
+            adapter = get_retrying_requests_adapter()
+            _registry_adapters[hostname] = adapter
+        return adapter
+
+
+def clear_registry_adapters():
+    """
+    Close and forget all shared registry connection pools
+    """
+    with _registry_adapters_lock:
+        for adapter in _registry_adapters.values():
+            adapter.close()
+        _registry_adapters.clear()
+
+
 def get_primary_images(workflow):
     primary_images = workflow.tag_conf.primary_images
     if not primary_images:
@@ -0,0 +1,98 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+Compare the components of worker builds the way the compare_components
+plugin does, against the previous approach which collected the components
+of all platforms again for each mismatch.
+
+    PYTHONPATH=. python benchmarks/compare_components_benchmark.py --components 10000
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import time
+
+from atomic_reactor.plugins.post_compare_components import compare_components
+
+ARCHES = ['x86_64', 'ppc64le', 's390x', 'aarch64', 'i686', 'armv7hl']
+
+
+def make_components(count, mismatch_every):
+    names = ['package-{}'.format(i) for i in range(count)]
+    mismatching = set(names[::mismatch_every])
+    return {
+        arch: [{
+            'type': 'rpm',
+            'name': name,
+            'version': '2.0' if name in mismatching and arch == 's390x' else '1.0',
+            'release': '1',
+            'arch': arch,
+            'epoch': None,
+            'sigmd5': '0' * 32,
+            'signature': '199e2f91fd431d51',
+        } for name in names]
+        for arch in ARCHES
+    }
+
+
+def compare_components_rescanning(components_by_platform):
+    """
+    Previous implementation, scanning all platforms for each mismatch
+    """
+    components_list = list(components_by_platform.values())
+
+    def filter_components_by_name(name):
+        for components in components_list:
+            for component in components:
+                if component['type'] == 'rpm' and component['name'] == name:
+                    yield component
+
+    mismatches = {}
+    reference = {}
+    for components in components_list:
+        for component in components:
+            name = component['name']
+            first = reference.setdefault(name, component)
+            if (name not in mismatches and
+                    any(first[field] != component[field]
+                        for field in ('version', 'release', 'signature'))):
+                mismatches[name] = list(filter_components_by_name(name))
+    return mismatches
+
+
+def measure(compare, components, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.time()
+        compare(components)
+        durations.append(time.time() - start)
+    return min(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--components', type=int, default=10000,
+                        help='number of components per platform')
+    parser.add_argument('--mismatch-every', type=int, default=100,
+                        help='every n-th component differs on one platform')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    components = make_components(args.components, args.mismatch_every)
+    indexed = measure(compare_components, components, args.repeat)
+    rescanning = measure(compare_components_rescanning, components, args.repeat)
+
+    print('{:>12} {:>10}'.format('method', 'seconds'))
+    print('{:>12} {:>10.3f}'.format('indexed', indexed))
+    print('{:>12} {:>10.3f}'.format('rescanning', rescanning))
+    print('speedup: {:.1f}x'.format(rescanning / indexed))
+
+
+if __name__ == '__main__':
+    main()
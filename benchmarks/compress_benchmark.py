@@ -0,0 +1,97 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+Measure compression throughput of the compress plugin's engine for an
+increasing number of threads.
+
+    PYTHONPATH=. python benchmarks/compress_benchmark.py --size 256 --method gzip
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+from multiprocessing import cpu_count
+
+from atomic_reactor.compress_util import open_compressed
+
+CHUNK_SIZE = 1024 ** 2
+
+
+def generate_input(path, size):
+    """
+    Write `size` bytes of data which compresses roughly like an image
+    tarball: a mix of repetitive text and incompressible bytes
+    """
+    rand = random.Random(0)
+    words = [b'usr', b'lib64', b'share', b'python', b'.so', b'locale', b'\x00' * 8]
+    with open(path, 'wb') as f:
+        written = 0
+        while written < size:
+            if rand.random() < 0.3:
+                chunk = bytearray(rand.getrandbits(8) for _ in range(4096))
+            else:
+                chunk = b'/'.join(rand.choice(words) for _ in range(800))
+            chunk = bytes(chunk[:size - written])
+            f.write(chunk)
+            written += len(chunk)
+
+
+def compress(path, out, method, threads, level):
+    start = time.time()
+    fp = open_compressed(out, method, threads=threads, level=level)
+    with open(path, 'rb') as stream, fp:
+        data = stream.read(CHUNK_SIZE)
+        while data:
+            fp.write(data)
+            data = stream.read(CHUNK_SIZE)
+    return time.time() - start
+
+
+def thread_counts(max_threads):
+    threads = 1
+    while threads < max_threads:
+        yield threads
+        threads *= 2
+    yield max_threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size', type=int, default=256, help='input size in MiB')
+    parser.add_argument('--method', choices=('gzip', 'lzma'), default='gzip')
+    parser.add_argument('--level', type=int, default=6)
+    parser.add_argument('--max-threads', type=int, default=cpu_count())
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'input.tar')
+        out = os.path.join(workdir, 'output')
+        size = args.size * 1024 ** 2
+        generate_input(path, size)
+
+        print('{:>8} {:>10} {:>10} {:>8} {:>8}'.format(
+            'threads', 'seconds', 'MiB/s', 'speedup', 'ratio'))
+        baseline = None
+        for threads in thread_counts(args.max_threads):
+            duration = compress(path, out, args.method, threads, args.level)
+            baseline = baseline or duration
+            print('{:>8} {:>10.2f} {:>10.1f} {:>8.2f} {:>8.3f}'.format(
+                threads, duration, args.size / duration, baseline / duration,
+                os.path.getsize(out) / size))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == '__main__':
+    main()
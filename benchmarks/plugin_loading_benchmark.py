@@ -0,0 +1,79 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+Load pre-build plugins the way a build does, importing only the modules
+of plugins in plugins_conf with the help of the plugin index, against
+loading all plugin modules. Each run is a fresh interpreter, so imports
+are not cached between runs.
+
+    PYTHONPATH=. python benchmarks/plugin_loading_benchmark.py --repeat 5
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+LOAD_PLUGINS_SCRIPT = """
+import time
+
+from atomic_reactor.plugin import PluginsRunner
+
+start = time.time()
+runner = PluginsRunner('PreBuildPlugin', {conf})
+if {load_all}:
+    # pretend plugins_conf is not known yet, as for the "auto" input plugin
+    del runner.plugins_conf
+    runner.load_plugins('PreBuildPlugin')
+print(time.time() - start)
+"""
+
+
+def load_plugins(index_path, conf, load_all=False):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(sys.path)
+    env['ATOMIC_REACTOR_PLUGIN_INDEX'] = index_path
+    script = LOAD_PLUGINS_SCRIPT.format(conf=conf, load_all=load_all)
+    output = subprocess.check_output([sys.executable, '-c', script], env=env)
+    return float(output.decode('utf-8'))
+
+
+def measure(index_path, conf, load_all, repeat):
+    return min(load_plugins(index_path, conf, load_all) for _ in range(repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--plugin', default='add_labels_in_dockerfile',
+                        help='pre-build plugin requested by the build')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    conf = [{'name': args.plugin}]
+    tmpdir = tempfile.mkdtemp()
+    try:
+        index_path = os.path.join(tmpdir, 'index.json')
+        # first run creates the index
+        load_plugins(index_path, conf)
+        lazy = measure(index_path, conf, False, args.repeat)
+        full = measure(index_path, None, True, args.repeat)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    print('{:>12} {:>10}'.format('method', 'seconds'))
+    print('{:>12} {:>10.3f}'.format('requested', lazy))
+    print('{:>12} {:>10.3f}'.format('all', full))
+    print('speedup: {:.1f}x'.format(full / lazy))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+
+
+Parse rpm query output with parse_rpm_output, producing dicts and compact
+RpmComponent instances, against the previous implementation which looked
+up the position of each field on each line.
+
+    PYTHONPATH=. python benchmarks/rpm_output_benchmark.py --packages 5000
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import time
+
+from atomic_reactor.rpm_util import image_component_rpm_tags, parse_rpm_output
+
+SIGMD5 = '0' * 32
+SIGNATURE = "RSA/SHA256, Tue 30 Aug 2016 00:00:00, Key ID 01234567890abc"
+
+
+def make_output(count):
+    output = []
+    for i in range(count):
+        epoch = str(i % 3) if i % 2 else '(none)'
+        signature = SIGNATURE if i % 5 else '(none)'
+        output.append(';'.join(['package-{}'.format(i), '1.{}'.format(i), '1.fc31', 'x86_64',
+                                epoch, str(i * 1000), SIGMD5, '1573000000',
+                                signature, '(none)']) + '\n')
+    return output
+
+
+def parse_rpm_output_per_field(output, tags=image_component_rpm_tags, separator=';'):
+    """
+    Previous implementation, looking up position of each field of each line
+    """
+    def field(tag):
+        try:
+            value = fields[tags.index(tag)]
+        except ValueError:
+            return None
+        if value == '(none)':
+            return None
+        return value
+
+    components = []
+    for rpm_info in output:
+        fields = rpm_info.rstrip('\n').split(separator)
+        if len(fields) < len(tags):
+            continue
+
+        signature = field('SIGPGP:pgpsig') or field('SIGGPG:pgpsig')
+        if signature:
+            parts = signature.split('Key ID ', 1)
+            if len(parts) > 1:
+                signature = parts[1]
+
+        epoch = field('EPOCH')
+        component_rpm = {
+            'type': 'rpm',
+            'name': field('NAME'),
+            'version': field('VERSION'),
+            'release': field('RELEASE'),
+            'arch': field('ARCH'),
+            'sigmd5': field('SIGMD5'),
+            'signature': signature,
+            'epoch': int(epoch) if epoch is not None else None,
+        }
+        if component_rpm['name'] != 'gpg-pubkey':
+            components.append(component_rpm)
+
+    return components
+
+
+def measure(parse, output, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.time()
+        parse(output)
+        durations.append(time.time() - start)
+    return min(durations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--packages', type=int, default=5000,
+                        help='number of packages in the output')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    output = make_output(args.packages)
+    reference = measure(parse_rpm_output_per_field, output, args.repeat)
+    results = [
+        ('per field', reference),
+        ('dicts', measure(parse_rpm_output, output, args.repeat)),
+        ('compact', measure(lambda lines: parse_rpm_output(lines, compact=True),
+                            output, args.repeat)),
+    ]
+
+    print('{:>10} {:>10} {:>8}'.format('method', 'seconds', 'speedup'))
+    for name, duration in results:
+        print('{:>10} {:>10.3f} {:>8.2f}'.format(name, duration, reference / duration))
+
+
+if __name__ == '__main__':
+    main()
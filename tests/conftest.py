@@ -14,7 +14,10 @@ import requests.exceptions
 from tests.constants import LOCALHOST_REGISTRY_HTTP, DOCKER0_REGISTRY_HTTP, MOCK
 from tests.util import uuid_value
 
-from atomic_reactor.util import ImageName
+from atomic_reactor.auth import bearer_token_cache
+from atomic_reactor.plugin_index import plugin_index
+from atomic_reactor.registry_cache import registry_cache
+from atomic_reactor.util import ImageName, clear_registry_adapters
 from atomic_reactor.core import ContainerTasker
 from atomic_reactor.constants import CONTAINER_DOCKERPY_BUILD_METHOD
 from atomic_reactor.inner import DockerBuildWorkflow
@@ -24,6 +27,30 @@ if MOCK:
     from tests.docker_mock import mock_docker
 
 
+@pytest.fixture(autouse=True)
+def reset_registry_caches():
+    """
+    Don't let registry tokens, connections and responses leak from one test to another
+    """
+    bearer_token_cache.clear()
+    clear_registry_adapters()
+    registry_cache.configure()
+    registry_cache.clear()
+    yield
+    bearer_token_cache.clear()
+    clear_registry_adapters()
+    registry_cache.configure()
+    registry_cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def in_memory_plugin_index(monkeypatch):
+    """
+    Don't store plugin index in the home directory of the user running tests
+    """
+    monkeypatch.setattr(plugin_index, 'path', None)
+
+
 @pytest.fixture()
 def temp_image_name():
     return ImageName(repo=("atomic-reactor-tests-%s" % uuid_value()))
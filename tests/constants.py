@@ -172,6 +172,10 @@ deep_manifest_list_inspection: True
 
 fail_on_digest_mismatch: True
 
+registry_cache:
+  max_entries: 100
+  tag_ttl: 10
+
 clusters:
   foo:
    - name: blah
@@ -117,7 +117,8 @@ def test_failed_build(workflow):
 
     assert isinstance(workflow.build_result, BuildResult)
     assert workflow.build_result.is_failed()
-    assert cmd_output in workflow.build_result.logs
-    assert cmd_error in workflow.build_result.logs
+    # log lines are stored without newlines
+    assert cmd_output.rstrip() in workflow.build_result.logs
+    assert cmd_error.rstrip() in workflow.build_result.logs
     assert cmd_error in workflow.build_result.fail_reason
     assert workflow.build_result.skip_layer_squash is False
@@ -22,6 +22,7 @@ from atomic_reactor.plugins.pre_reactor_config import (ReactorConfigPlugin,
 from atomic_reactor.util import df_parser
 from atomic_reactor.constants import PROG
 from flexmock import flexmock
+from tests.util import KojiMulticallMock
 import time
 import pytest
 
@@ -394,6 +395,9 @@ class TestBumpRelease(object):
             def krb_login(self, *args, **kwargs):
                 return True
 
+            def multicall(self, strict=False, batch=None):
+                return KojiMulticallMock(self, strict, batch)
+
             def CGInitBuild(self, cg_name, nvr_data):
                 assert cg_name == PROG
                 assert nvr_data['name'] == list(component.values())[0]
@@ -478,6 +482,53 @@ class TestBumpRelease(object):
             assert plugin.workflow.reserved_build_id == build_id
             assert plugin.workflow.reserved_token == token
 
+    @pytest.mark.parametrize(('append', 'builds', 'expected', 'multicalls'), [
+        (False, [str(n) for n in range(1, 101)], '101', 7),
+        (False, [str(n) for n in range(1, 101) if n != 50], '50', 6),
+        (True, ['42.{}'.format(n) for n in range(1, 11)], '42.11', 4),
+    ])
+    def test_next_release_many_builds(self, tmpdir, append, builds, expected, multicalls,
+                                      reactor_config_map):
+        class MockedClientSession(object):
+            def __init__(self, hub, opts=None):
+                self.checked = []
+                self.multicalls = 0
+
+            def getNextRelease(self, build_info):
+                return '1'
+
+            def getBuild(self, build_info):
+                self.checked.append(build_info['release'])
+                if build_info['release'] in builds:
+                    return {'state': koji.BUILD_STATES['COMPLETE']}
+                return None
+
+            def multicall(self, strict=False, batch=None):
+                self.multicalls += 1
+                return KojiMulticallMock(self, strict, batch)
+
+            def krb_login(self, *args, **kwargs):
+                return True
+
+        session = MockedClientSession('')
+        flexmock(koji, ClientSession=session)
+        plugin = self.prepare(tmpdir, reactor_config_map=reactor_config_map)
+
+        def next_release():
+            if append:
+                return plugin.get_next_release_append('component', 'version', '42')
+            return plugin.get_next_release_standard('component', 'version')
+
+        assert next_release() == expected
+        # candidates are checked in batches of 1, 2, 4, ...
+        assert session.multicalls == multicalls
+        assert len(session.checked) == 2 ** multicalls - 1
+
+        # e.g. retrying reservation, releases known to exist are not checked again
+        del session.checked[:]
+        assert next_release() == expected
+        assert session.checked == [expected]
+
     @pytest.mark.parametrize('reserve_build, init_fails', [
         (True, RuntimeError),
         (True, koji.GenericError),
@@ -526,6 +577,9 @@ class TestBumpRelease(object):
             def krb_login(self, *args, **kwargs):
                 return True
 
+            def multicall(self, strict=False, batch=None):
+                return KojiMulticallMock(self, strict, batch)
+
             def CGInitBuild(self, cg_name, nvr_data):
                 assert cg_name == PROG
                 assert nvr_data['name'] == "%s-source" % koji_name
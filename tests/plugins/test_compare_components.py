@@ -22,9 +22,7 @@ from atomic_reactor.plugin import PostBuildPluginsRunner, PluginFailedException
 from atomic_reactor.plugins.pre_reactor_config import (ReactorConfigPlugin,
                                                        WORKSPACE_CONF_KEY,
                                                        ReactorConfig)
-from atomic_reactor.plugins.post_compare_components import (
-    filter_components_by_name
-)
+from atomic_reactor.plugins.post_compare_components import compare_components
 from atomic_reactor.util import ImageName
 
 from tests.constants import MOCK_SOURCE, TEST_IMAGE, INPUT_IMAGE, FILES
@@ -98,25 +96,6 @@ def mock_metadatas():
     return worker_metadatas
 
 
-def test_filter_components_by_name():
-    """Test function filter_components_by_name"""
-    worker_metadatas = mock_metadatas()
-    component_name = 'openssl'
-
-    component_list = [
-        worker_metadata['output'][2]['components']
-        for worker_metadata in worker_metadatas.values()
-    ]
-
-    filtered = list(filter_components_by_name(component_name, component_list))
-
-    expected_count = len(worker_metadatas)
-    assert len(filtered) == expected_count
-
-    expected_platforms = set(worker_metadatas.keys())
-    assert set(f['arch'] for f in filtered) == expected_platforms
-
-
 @pytest.mark.parametrize('base_from_scratch', (True, False))
 @pytest.mark.parametrize(('mismatch', 'exception', 'fail'), (
     (False, False, False),
@@ -258,8 +237,92 @@ def test_mismatch_reporting(tmpdir, caplog, mismatch):
         for entry in log_entries:
             # component mismatch must be reported only once
             assert caplog.text.count(entry) == 1
+
+        workspace = workflow.plugin_workspace[PLUGIN_COMPARE_COMPONENTS_KEY]
+        group = workspace['mismatches'][('rpm', component_name)]
+        assert sorted(group) == ['ppc64le', 's390x', 'x86_64']
+        assert [c['version'] for c in group['ppc64le']] == ['bacon']
+        assert [c['version'] for c in group['s390x']] == ['sandwich']
+        assert [c['version'] for c in group['x86_64']] == ['1.0.2k']
     else:
         # no mismatch, no failure, no log entries
         runner.run()
         for entry in log_entries:
             assert entry not in caplog.text
+        assert PLUGIN_COMPARE_COMPONENTS_KEY not in workflow.plugin_workspace
+
+
+def make_rpm(name, arch, version='1.0', release='1', signature='199e2f91fd431d51'):
+    return {
+        'type': 'rpm',
+        'name': name,
+        'version': version,
+        'release': release,
+        'arch': arch,
+        'epoch': None,
+        'sigmd5': '0' * 32,
+        'signature': signature,
+    }
+
+
+def test_compare_components():
+    components = {
+        'x86_64': [make_rpm('bash', 'x86_64'), make_rpm('glibc', 'x86_64'),
+                   make_rpm('glibc', 'i686'), make_rpm('grub2', 'x86_64'),
+                   make_rpm('kernel', 'x86_64'), make_rpm('tzdata', 'noarch')],
+        'ppc64le': [make_rpm('bash', 'ppc64le'), make_rpm('glibc', 'ppc64le', release='2'),
+                    make_rpm('kernel', 'ppc64le', version='2.0'),
+                    make_rpm('tzdata', 'noarch', version='2.0')],
+        's390x': [make_rpm('bash', 's390x', signature=None), make_rpm('glibc', 's390x'),
+                  make_rpm('tzdata', 'noarch')],
+    }
+
+    mismatches = compare_components(components, exceptions=['kernel'])
+
+    assert mismatches == {
+        ('rpm', 'bash'): {
+            'x86_64': [components['x86_64'][0]],
+            'ppc64le': [components['ppc64le'][0]],
+            's390x': [components['s390x'][0]],
+        },
+        ('rpm', 'glibc'): {
+            # multilib
+            'x86_64': components['x86_64'][1:3],
+            'ppc64le': [components['ppc64le'][1]],
+            's390x': [components['s390x'][1]],
+        },
+        # platforms are known even though the arch is the same
+        ('rpm', 'tzdata'): {
+            'x86_64': [components['x86_64'][5]],
+            'ppc64le': [components['ppc64le'][3]],
+            's390x': [components['s390x'][2]],
+        },
+    }
+
+
+def test_compare_components_unsupported_type():
+    with pytest.raises(ValueError):
+        compare_components({'x86_64': [{'type': 'foo', 'name': 'bar'}]})
+
+
+def test_compare_components_many_platforms():
+    """
+    See benchmarks/compare_components_benchmark.py for performance
+    """
+    arches = ['x86_64', 'ppc64le', 's390x', 'aarch64', 'i686', 'armv7hl']
+    names = ['package-{}'.format(i) for i in range(10000)]
+    mismatching = set(names[::100])
+    components = {
+        arch: [make_rpm(name, arch,
+                        version='2.0' if name in mismatching and arch == 's390x' else '1.0')
+               for name in names]
+        for arch in arches
+    }
+
+    mismatches = compare_components(components)
+
+    assert set(name for _, name in mismatches) == mismatching
+    for (_, name), group in mismatches.items():
+        assert sorted(group) == sorted(arches)
+        assert group['s390x'][0]['version'] == '2.0'
+        assert group['x86_64'][0]['version'] == '1.0'
@@ -11,7 +11,7 @@ from atomic_reactor.core import DockerTasker
 from atomic_reactor.inner import DockerBuildWorkflow
 from atomic_reactor.plugin import PostBuildPluginsRunner
 from atomic_reactor.plugins.post_compress import CompressPlugin
-from atomic_reactor.util import ImageName
+from atomic_reactor.util import ImageName, get_checksums
 from atomic_reactor.build import BuildResult
 
 from tests.constants import INPUT_IMAGE, MOCK
@@ -34,6 +34,7 @@ class X(object):
 
 
 class TestCompress(object):
+    @pytest.mark.parametrize('threads', (1, 4))
     @pytest.mark.parametrize('source_build', (True, False))
     @pytest.mark.parametrize('method, load_exported_image, give_export, extension', [
         ('gzip', False, True, 'gz'),
@@ -43,7 +44,7 @@ class TestCompress(object):
         ('spam', True, True, None),
     ])
     def test_compress(self, tmpdir, caplog, source_build, method,
-                      load_exported_image, give_export, extension):
+                      load_exported_image, give_export, extension, threads):
         if MOCK:
             mock_docker()
 
@@ -74,6 +75,7 @@ class TestCompress(object):
                 'args': {
                     'method': method,
                     'load_exported_image': load_exported_image,
+                    'threads': threads,
                 },
             }]
         )
@@ -98,4 +100,9 @@ class TestCompress(object):
             assert metadata['type'] == IMAGE_TYPE_DOCKER_ARCHIVE
             assert 'uncompressed_size' in metadata
             assert isinstance(metadata['uncompressed_size'], integer_types)
+            assert metadata['size'] == os.path.getsize(compressed_img)
+            checksums = get_checksums(compressed_img, ['md5', 'sha256'])
+            assert metadata['md5sum'] == checksums['md5sum']
+            assert metadata['sha256sum'] == checksums['sha256sum']
             assert ", ratio: " in caplog.text
+            assert 'threads: {}'.format(threads) in caplog.text
@@ -9,14 +9,19 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import absolute_import
 
+import io
+import json
 import os
 import pytest
 import tarfile
 import zipfile
 from atomic_reactor import util
+from atomic_reactor.compress_util import ParallelCompressedFile
 from atomic_reactor.constants import (
+    IMAGE_TYPE_DOCKER_ARCHIVE,
     PLUGIN_EXPORT_OPERATOR_MANIFESTS_KEY,
     PLUGIN_BUILD_ORCHESTRATE_KEY)
+from atomic_reactor.plugins import post_export_operator_manifests
 from atomic_reactor.inner import DockerBuildWorkflow
 from atomic_reactor.plugins.post_export_operator_manifests import ExportOperatorManifestsPlugin
 from atomic_reactor.plugin import PostBuildPluginsRunner, PluginFailedException
@@ -78,9 +83,37 @@ def generate_archive(tmpdir, empty=False):
     os.unlink(archive_path)
 
 
+def add_tar_file(tar, name, data=b'', **attrs):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    for attr, value in attrs.items():
+        setattr(info, attr, value)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def generate_image_archive(tmpdir, layers):
+    """
+    Create docker-archive with layers made of (name, data) pairs
+    """
+    archive_path = os.path.join(str(tmpdir), 'image.tar')
+    layer_names = []
+    with tarfile.open(archive_path, 'w') as archive:
+        for i, files in enumerate(layers):
+            layer = io.BytesIO()
+            with tarfile.open(fileobj=layer, mode='w') as layer_tar:
+                for name, data in files:
+                    add_tar_file(layer_tar, name, data)
+            layer_name = 'layer{}/layer.tar'.format(i)
+            layer_names.append(layer_name)
+            add_tar_file(archive, layer_name, layer.getvalue())
+        manifest = [{'Config': 'config.json', 'Layers': layer_names}]
+        add_tar_file(archive, 'manifest.json', json.dumps(manifest).encode('utf-8'))
+    return archive_path
+
+
 def mock_env(tmpdir, docker_tasker, has_label=True, label=True, has_archive=True,
              scratch=False, orchestrator=False, selected_platform=True, empty_archive=False,
-             remove_fails=False):
+             remove_fails=False, create_fails=False):
     build_json = {'metadata': {'labels': {'scratch': scratch}}}
     flexmock(util).should_receive('get_build_json').and_return(build_json)
     mock_dockerfile(tmpdir, has_label, label)
@@ -92,6 +125,16 @@ def mock_env(tmpdir, docker_tasker, has_label=True, label=True, has_archive=True
                                   'platform': machine()}
     runner = PostBuildPluginsRunner(docker_tasker, workflow, plugin_conf)
 
+    if create_fails:
+        (flexmock(docker_tasker.tasker.d.wrapped)
+         .should_receive('create_container')
+         .with_args(workflow.image, command=["/bin/bash"])
+         .and_raise(Exception('error')))
+        (flexmock(docker_tasker.tasker.d.wrapped)
+         .should_receive('remove_container')
+         .never())
+        return runner
+
     (flexmock(docker_tasker.tasker.d.wrapped)
      .should_receive('create_container')
      .with_args(workflow.image, command=["/bin/bash"])
@@ -186,3 +229,114 @@ class TestExportOperatorManifests(object):
                 assert 'Empty operator manifests directory' in str(exc.value)
         else:
             runner.run()
+
+    @pytest.mark.parametrize(('max_size', 'fails'), [
+        (8, False),
+        (7, True),
+    ])
+    def test_max_size(self, docker_tasker, tmpdir, max_size, fails):
+        runner = mock_env(tmpdir, docker_tasker)
+        stream = io.BytesIO()
+        with tarfile.open(fileobj=stream, mode='w') as tar:
+            add_tar_file(tar, 'manifests/spam.yml', b'spam')
+            add_tar_file(tar, 'manifests/bacon.yml', b'eggs')
+        (flexmock(docker_tasker.tasker.d.wrapped)
+         .should_receive('get_archive')
+         .with_args(CONTAINER_ID, '/manifests')
+         .and_return(iter([stream.getvalue()]), {}))
+        flexmock(post_export_operator_manifests, OPERATOR_MANIFESTS_MAX_SIZE=max_size)
+        plugin = ExportOperatorManifestsPlugin(docker_tasker, runner.workflow,
+                                               operator_manifests_extract_platform=machine())
+
+        if fails:
+            with pytest.raises(RuntimeError) as exc:
+                plugin.run()
+            assert 'Operator manifests exceed maximum size of 7 bytes' in str(exc.value)
+        else:
+            assert zipfile.is_zipfile(plugin.run())
+
+    def test_archiving_fails(self, docker_tasker, tmpdir):
+        runner = mock_env(tmpdir, docker_tasker)
+        (flexmock(docker_tasker)
+         .should_receive('remove_container')
+         .with_args(CONTAINER_ID)
+         .once())
+        plugin = ExportOperatorManifestsPlugin(docker_tasker, runner.workflow,
+                                               operator_manifests_extract_platform=machine())
+        # fails before reading any manifests from the container
+        (flexmock(plugin)
+         .should_receive('archive_manifests')
+         .and_raise(IOError('No space left on device')))
+
+        with pytest.raises(IOError):
+            plugin.run()
+
+    def test_links(self, docker_tasker, tmpdir, caplog):
+        runner = mock_env(tmpdir, docker_tasker)
+        stream = io.BytesIO()
+        with tarfile.open(fileobj=stream, mode='w') as tar:
+            add_tar_file(tar, 'manifests/spam.yml', b'spam')
+            add_tar_file(tar, 'manifests/bacon.yml', type=tarfile.SYMTYPE, linkname='spam.yml')
+            add_tar_file(tar, 'manifests/eggs.yml', type=tarfile.LNKTYPE,
+                         linkname='manifests/spam.yml')
+            add_tar_file(tar, 'manifests/ham.yml', type=tarfile.SYMTYPE, linkname='/etc/passwd')
+        (flexmock(docker_tasker.tasker.d.wrapped)
+         .should_receive('get_archive')
+         .with_args(CONTAINER_ID, '/manifests')
+         .and_return(iter([stream.getvalue()]), {}))
+
+        archive = runner.run()[PLUGIN_EXPORT_OPERATOR_MANIFESTS_KEY]
+        with zipfile.ZipFile(archive, 'r') as z:
+            assert sorted(z.namelist()) == ['bacon.yml', 'eggs.yml', 'spam.yml']
+            assert z.read('bacon.yml') == b'spam'
+            assert z.read('eggs.yml') == b'spam'
+        assert 'Skipping link manifests/ham.yml' in caplog.text
+
+    @pytest.mark.parametrize('exported', [True, False, 'gzip', 'lzma'])
+    def test_create_container_fails(self, docker_tasker, tmpdir, caplog, exported):
+        runner = mock_env(tmpdir, docker_tasker, create_fails=True)
+        archive_path = generate_image_archive(tmpdir, [
+            [('etc/os-release', b'fedora'),
+             ('manifests/old/stub.yml', b'old'),
+             ('manifests/removed.yml', b'removed'),
+             ('manifests/stub.yml', b'stub')],
+            [('manifests/old/.wh..wh..opq', b''),
+             ('manifests/old/new.yml', b'new'),
+             ('manifests/.wh.removed.yml', b''),
+             ('manifests/another_dir/yayml.yml', b'yayml')],
+        ])
+        if exported in ('gzip', 'lzma'):
+            # output of the compress plugin using several threads
+            compressed_path = archive_path + '.compressed'
+            with open(archive_path, 'rb') as src:
+                with ParallelCompressedFile(compressed_path, exported, 3, block_size=512) as f:
+                    f.write(src.read())
+            archive_path = compressed_path
+        if exported:
+            runner.workflow.exported_image_sequence.append({'path': archive_path,
+                                                            'type': IMAGE_TYPE_DOCKER_ARCHIVE})
+        else:
+            with open(archive_path, 'rb') as f:
+                image_stream = iter([f.read()])
+            (flexmock(docker_tasker.tasker.d.wrapped)
+             .should_receive('get_image')
+             .with_args(runner.workflow.image)
+             .and_return(image_stream))
+
+        archive = runner.run()[PLUGIN_EXPORT_OPERATOR_MANIFESTS_KEY]
+        with zipfile.ZipFile(archive, 'r') as z:
+            assert sorted(z.namelist()) == ['another_dir/yayml.yml', 'old/new.yml', 'stub.yml']
+            assert z.read('stub.yml') == b'stub'
+        assert 'reading operator manifests from image layers' in caplog.text
+
+    def test_create_container_fails_no_manifests(self, docker_tasker, tmpdir):
+        runner = mock_env(tmpdir, docker_tasker, create_fails=True)
+        archive_path = generate_image_archive(tmpdir, [
+            [('manifests/stub.yml', b'stub')],
+            [('.wh.manifests', b'')],
+        ])
+        runner.workflow.exported_image_sequence.append({'path': archive_path,
+                                                        'type': IMAGE_TYPE_DOCKER_ARCHIVE})
+        with pytest.raises(PluginFailedException) as exc:
+            runner.run()
+        assert 'Empty operator manifests directory' in str(exc.value)
@@ -28,6 +28,7 @@ from atomic_reactor.plugins.pre_reactor_config import (ReactorConfigPlugin,
                                                        WORKSPACE_CONF_KEY, ReactorConfig)
 from tests.constants import TEST_IMAGE
 from tests.stubs import StubInsideBuilder, StubSource
+from tests.util import mock_koji_multicall
 
 
 KOJI_HUB = 'http://koji.com/hub'
@@ -113,7 +114,8 @@ def mock_workflow(tmpdir, for_orchestrator=False, config_map=None,
 
 
 def mock_env(tmpdir, docker_tasker, scratch=False, orchestrator=False, koji_build_id=None,
-             koji_build_nvr=None, config_map=None, default_si=DEFAULT_SIGNING_INTENT):
+             koji_build_nvr=None, config_map=None, default_si=DEFAULT_SIGNING_INTENT,
+             workers=None):
     build_json = {'metadata': {'labels': {'scratch': scratch}}}
     flexmock(util).should_receive('get_build_json').and_return(build_json)
     workflow = mock_workflow(tmpdir, for_orchestrator=orchestrator, config_map=config_map,
@@ -123,6 +125,8 @@ def mock_env(tmpdir, docker_tasker, scratch=False, orchestrator=False, koji_buil
         'koji_build_id': koji_build_id,
         'koji_build_nvr': koji_build_nvr
         }
+    if workers is not None:
+        plugin_conf[0]['args']['workers'] = workers
 
     runner = PreBuildPluginsRunner(docker_tasker, workflow, plugin_conf)
     return runner
@@ -152,6 +156,7 @@ def koji_session():
      .and_return({'SOURCERPM': 'foobar-1-1.src.rpm'}))
     flexmock(session).should_receive('getBuild').and_return(KOJI_BUILD)
     flexmock(session).should_receive('krb_login').and_return(True)
+    mock_koji_multicall(session)
     flexmock(koji).should_receive('ClientSession').and_return(session)
     return session
 
@@ -416,3 +421,44 @@ class TestFetchSources(object):
             runner.run()
 
         assert 'No srpms found for source container' in str(exc_info.value)
+
+    @pytest.mark.parametrize('workers', [1, 3])
+    def test_dedup_and_concurrent_download(self, requests_mock, docker_tasker, koji_session,
+                                           tmpdir, caplog, workers):
+        srpms = ['baz-1-1.src.rpm', 'lib-foobar-1-1.src.rpm', 'qux-2-1.src.rpm']
+        archive_rpms = [
+            {'id': rpm_id, 'build_id': 1, 'nvr': 'foobar-1-1', 'arch': 'x86_64',
+             'external_repo_name': 'INTERNAL'}
+            for rpm_id in range(len(srpms))
+        ]
+        # every archive lists all the RPMs
+        (flexmock(koji_session)
+            .should_receive('listRPMs')
+            .and_return(archive_rpms))
+        for rpm_id, srpm in enumerate(srpms):
+            (flexmock(koji_session)
+                .should_receive('getRPMHeaders')
+                .with_args(rpm_id, headers=['SOURCERPM'])
+                .and_return({'SOURCERPM': srpm})
+                .once())
+
+        srpm_urls = [get_srpm_url(srpm_filename_override=srpm) for srpm in srpms]
+        for srpm_url, srpm in zip(srpm_urls, srpms):
+            requests_mock.register_uri('HEAD', srpm_url)
+            requests_mock.register_uri('GET', srpm_url, content=srpm.encode('utf-8'))
+
+        runner = mock_env(tmpdir, docker_tasker, koji_build_nvr='foobar-1-1', workers=workers)
+        result = runner.run()
+
+        sources_dir = result[constants.PLUGIN_FETCH_SOURCES_KEY]['image_sources_dir']
+        assert sorted(os.listdir(sources_dir)) == srpms
+        for srpm in srpms:
+            with open(os.path.join(sources_dir, srpm), 'rb') as f:
+                assert f.read() == srpm.encode('utf-8')
+
+        head_requests = [req.url for req in requests_mock.request_history
+                         if req.method == 'HEAD']
+        assert sorted(head_requests) == sorted(srpm_urls)
+        for srpm in srpms:
+            assert 'downloaded {}'.format(srpm) in caplog.text
+        assert '{0} of {0}'.format(len(srpms)) in caplog.text
@@ -108,6 +108,10 @@ class MockedClientSession(object):
     def logout(self):
         pass
 
+    def subsession(self):
+        # uploads running concurrently record to the same session
+        return self
+
     def uploadWrapper(self, localfile, path, name=None, callback=None,
                       blocksize=1048576, overwrite=True):
         self.blocksize = blocksize
@@ -10,6 +10,7 @@ from __future__ import unicode_literals, absolute_import
 
 import json
 import koji
+import time
 
 import atomic_reactor
 from atomic_reactor.constants import (
@@ -26,6 +27,7 @@ from atomic_reactor.util import ImageName, get_manifest_media_type
 from atomic_reactor.constants import SCRATCH_FROM
 from flexmock import flexmock
 from tests.constants import MOCK, MOCK_SOURCE
+from tests.util import mock_koji_multicall
 
 import pytest
 
@@ -113,6 +115,7 @@ def koji_session():
     session = flexmock()
     flexmock(session).should_receive('getBuild').with_args(KOJI_BUILD_NVR).and_return(KOJI_BUILD)
     flexmock(session).should_receive('krb_login').and_return(True)
+    mock_koji_multicall(session)
     flexmock(koji).should_receive('ClientSession').and_return(session)
     return session
 
@@ -146,6 +149,43 @@ class TestKojiParent(object):
 
         self.run_plugin_with_args(workflow, reactor_config_map=reactor_config_map)
 
+    def test_koji_builds_waited_together(self, workflow, koji_session, reactor_config_map):  # noqa
+        builder_build = {'nvr': 'somebuilder-1.0-1', 'id': 42, 'state': KOJI_STATE_COMPLETE,
+                         'extra': KOJI_EXTRA}
+        builder_labels = {'com.redhat.component': 'somebuilder', 'version': '1.0',
+                          'release': '1'}
+        builder_tag = ImageName.parse('somebuilder:stubDigest')
+        workflow.builder._parent_images_inspect[builder_tag] = {
+            INSPECT_CONFIG: {'Labels': builder_labels}}
+        workflow.builder.parent_images[ImageName.parse('somebuilder')] = builder_tag
+        workflow.builder.parent_images_digests['somebuilder:latest'] = {V2_LIST: 'stubDigest'}
+
+        (flexmock(koji_session)
+            .should_receive('getBuild')
+            .with_args(KOJI_BUILD_NVR)
+            .and_return(KOJI_BUILD_BUILDING)
+            .and_return(KOJI_BUILD)
+            .times(2))
+        (flexmock(koji_session)
+            .should_receive('getBuild')
+            .with_args(builder_build['nvr'])
+            .and_return(None)
+            .and_return(dict(builder_build, state=KOJI_STATE_BUILDING))
+            .and_return(builder_build)
+            .times(3))
+        # parents are polled in the same loop, so the wait is given by the slowest one
+        flexmock(time).should_receive('sleep').times(2)
+
+        expected_result = {
+            BASE_IMAGE_KOJI_BUILD: KOJI_BUILD,
+            PARENT_IMAGES_KOJI_BUILDS: {
+                ImageName.parse('base'): KOJI_BUILD,
+                ImageName.parse('somebuilder'): builder_build,
+            },
+        }
+        self.run_plugin_with_args(workflow, expect_result=expected_result,
+                                  reactor_config_map=reactor_config_map)
+
     def test_koji_ssl_certs_used(self, tmpdir, workflow, koji_session, reactor_config_map):  # noqa
         serverca = tmpdir.join('serverca')
         serverca.write('spam')
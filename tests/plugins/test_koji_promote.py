@@ -29,7 +29,8 @@ from atomic_reactor.plugins.pre_reactor_config import (ReactorConfigPlugin,
                                                        ReactorConfig)
 from atomic_reactor.plugin import ExitPluginsRunner, PluginFailedException
 from atomic_reactor.inner import DockerBuildWorkflow, TagConf, PushConf
-from atomic_reactor.util import ImageName, ManifestDigest, get_manifest_media_type
+from atomic_reactor.util import (ImageName, ManifestDigest, get_manifest_media_type,
+                                 LogSpool)
 from atomic_reactor.rpm_util import parse_rpm_output
 from atomic_reactor.source import GitSource, PathSource
 from atomic_reactor.build import BuildResult
@@ -1411,6 +1412,22 @@ class TestKojiPromote(object):
         runner = create_runner(tasker, workflow, reactor_config_map=reactor_config_map)
         runner.run()
 
+    def test_koji_promote_streamed_logs(self, tmpdir, os_env):
+        tasker, workflow = mock_environment(tmpdir, name='name', version='1.0', release='1')
+        logs = LogSpool()
+        for line in ['Step 1', 'docker build log - \u2018 \u2017 \u2019']:
+            logs.append(line)
+        workflow.build_result = BuildResult(logs=logs, image_id='id1234')
+        plugin = KojiPromotePlugin(tasker, workflow, kojihub='', url='/')
+        plugin.build_id = BUILD_ID
+
+        outputs = plugin.get_logs()
+        [docker_logs] = [output for output in outputs
+                         if output.metadata['filename'] == 'build.log']
+        with open(docker_logs.file.name, 'rb') as f:
+            content = f.read()
+        assert content.decode('utf-8') == 'Step 1\ndocker build log - \u2018 \u2017 \u2019\n'
+
     def test_koji_promote_set_media_types(self, tmpdir, os_env, reactor_config_map):  # noqa
         session = MockedClientSession('')
         tasker, workflow = mock_environment(tmpdir,
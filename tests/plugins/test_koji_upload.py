@@ -29,7 +29,7 @@ from atomic_reactor.plugins.pre_reactor_config import (ReactorConfigPlugin,
 from atomic_reactor.plugin import PostBuildPluginsRunner, PluginFailedException
 
 from atomic_reactor.inner import DockerBuildWorkflow, TagConf, PushConf
-from atomic_reactor.util import ImageName, ManifestDigest
+from atomic_reactor.util import ImageName, ManifestDigest, LogSpool
 from atomic_reactor.rpm_util import parse_rpm_output
 from atomic_reactor.source import GitSource
 from atomic_reactor.build import BuildResult
@@ -131,6 +131,10 @@ class MockedClientSession(object):
     def logout(self):
         pass
 
+    def subsession(self):
+        # uploads running concurrently record to the same session
+        return self
+
     def uploadWrapper(self, localfile, path, name=None, callback=None,
                       blocksize=1048576, overwrite=True):
         self.uploaded_files.append(name)
@@ -1102,6 +1106,20 @@ class TestKojiUpload(object):
         if not is_scratch:
             assert images[0].endswith(platform + ".tar.xz")
 
+    def test_koji_upload_streamed_logs(self, tmpdir, os_env):
+        tasker, workflow = mock_environment(tmpdir, name='name', version='1.0', release='1')
+        logs = LogSpool()
+        for line in ['Step 1', 'docker build log - \u2018 \u2017 \u2019']:
+            logs.append(line)
+        workflow.build_result = BuildResult(logs=logs, image_id='id1234')
+        plugin = KojiUploadPlugin(tasker, workflow, KOJI_UPLOAD_DIR, kojihub='', url='/',
+                                  build_json_dir='')
+
+        [output] = plugin.get_logs()
+        with open(output.file.name, 'rb') as f:
+            content = f.read()
+        assert content.decode('utf-8') == 'Step 1\ndocker build log - \u2018 \u2017 \u2019\n'
+
     @pytest.mark.parametrize('multiple', [False, True])
     def test_koji_upload_multiple_digests(self, tmpdir, os_env,
                                           multiple, reactor_config_map):
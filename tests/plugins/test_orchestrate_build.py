@@ -16,7 +16,9 @@ from atomic_reactor.plugins import pre_reactor_config
 from atomic_reactor.plugins.build_orchestrate_build import (OrchestrateBuildPlugin,
                                                             get_worker_build_info,
                                                             get_koji_upload_dir,
-                                                            override_build_kwarg)
+                                                            override_build_kwarg,
+                                                            wait_for_any_cluster,
+                                                            ClusterRetryContext)
 from atomic_reactor.plugins.pre_reactor_config import (ReactorConfig,
                                                        ReactorConfigPlugin,
                                                        WORKSPACE_CONF_KEY)
@@ -26,7 +28,7 @@ import atomic_reactor.util
 from atomic_reactor.constants import (PLUGIN_ADD_FILESYSTEM_KEY,
                                       PLUGIN_CHECK_AND_SET_PLATFORMS_KEY)
 from flexmock import flexmock
-from multiprocessing.pool import AsyncResult
+from six.moves.queue import Queue
 from osbs.api import OSBS
 from osbs.conf import Configuration
 from osbs.build.build_response import BuildResponse
@@ -41,6 +43,7 @@ import json
 import os
 import sys
 import pytest
+import threading
 import time
 import platform
 
@@ -419,6 +422,11 @@ def test_orchestrate_build(tmpdir, caplog, config_kwargs,
     build_result = runner.run()
     assert not build_result.is_failed()
 
+    metrics = build_result.annotations.pop('worker-build-metrics')
+    assert set(metrics) == {'x86_64'}
+    assert metrics['x86_64']['queue_time'] >= 0
+    assert metrics['x86_64']['build_time'] >= 0
+
     assert (build_result.annotations == {
         'worker-builds': {
             'x86_64': {
@@ -556,6 +564,8 @@ def test_orchestrate_build_annotations_and_labels(tmpdir, metadata_fragment):
         expected['worker-builds']['x86_64'].update(md)
         expected['worker-builds']['ppc64le'].update(md)
 
+    metrics = build_result.annotations.pop('worker-build-metrics')
+    assert set(metrics) == {'x86_64', 'ppc64le'}
     assert (build_result.annotations == expected)
 
     assert (build_result.labels == {'koji-build-id': 'koji-build-id'})
@@ -680,33 +690,150 @@ def test_orchestrate_build_cancelation(tmpdir):
 
     flexmock(OSBS).should_receive('cancel_build').once()
 
-    (flexmock(AsyncResult).should_receive('ready')
-        .and_return(False)  # normal execution
-        .and_return(False)  # after cancel_build
-        .and_return(True))  # finally succeed
+    def mock_get(timeout=None):
+        # orchestrator build cancelled while waiting for worker builds
+        time.sleep(0.1)
+        raise BuildCanceledException()
+    (flexmock(Queue).should_receive('get')
+        .replace_with(mock_get)
+        .once())
 
-    class RaiseOnce(object):
-        """
-        Only raise an exception the first time this mocked wait() method
-        is called.
-        """
+    with pytest.raises(PluginFailedException) as exc:
+        runner.run()
+    assert 'BuildCanceledException' in str(exc.value)
 
-        def __init__(self):
-            self.exception_raised = False
 
-        def get(self, timeout=None):
-            time.sleep(0.1)
-            if not self.exception_raised:
-                self.exception_raised = True
-                raise BuildCanceledException()
+@pytest.mark.parametrize('fail_fast', [True, False])
+def test_orchestrate_build_fail_fast(tmpdir, fail_fast):
+    workflow = mock_workflow(tmpdir)
+    mock_osbs()
+    mock_manifest_list()
+    mock_reactor_config(tmpdir)
 
-    raise_once = RaiseOnce()
-    (flexmock(AsyncResult).should_receive('get')
-        .replace_with(raise_once.get))
+    cancelled = threading.Event()
 
-    with pytest.raises(PluginFailedException) as exc:
-        runner.run()
-    assert 'BuildCanceledException' in str(exc.value)
+    def mock_wait_for_build_to_finish(build_name):
+        if build_name == 'worker-build-x86_64':
+            return make_build_response(build_name, 'Failed')
+        # ppc64le worker build runs until cancelled
+        if cancelled.wait(0.5 if not fail_fast else 10):
+            return make_build_response(build_name, 'Cancelled')
+        return make_build_response(build_name, 'Complete')
+    (flexmock(OSBS)
+     .should_receive('wait_for_build_to_finish')
+     .replace_with(mock_wait_for_build_to_finish))
+
+    (flexmock(OSBS)
+     .should_receive('cancel_build')
+     .with_args('worker-build-ppc64le')
+     .replace_with(lambda build_name: cancelled.set())
+     .times(1 if fail_fast else 0))
+    flexmock(OSBS).should_receive('get_pod_for_build').and_raise(OsbsException())
+
+    runner = BuildStepPluginsRunner(
+        workflow.builder.tasker,
+        workflow,
+        [{
+            'name': OrchestrateBuildPlugin.key,
+            'args': {
+                'platforms': ['x86_64', 'ppc64le'],
+                'build_kwargs': make_worker_build_kwargs(),
+                'osbs_client_config': str(tmpdir),
+                'goarch': {'x86_64': 'amd64'},
+                'fail_fast': fail_fast,
+            }
+        }]
+    )
+
+    build_result = runner.run()
+    assert build_result.is_failed()
+
+    fail_reason = json.loads(build_result.fail_reason)
+    assert 'x86_64' in fail_reason
+    if fail_fast:
+        assert (fail_reason['ppc64le']['general'] ==
+                'cancelled, worker build for platform x86_64 failed')
+    else:
+        assert 'ppc64le' not in fail_reason
+
+
+def test_orchestrate_build_fail_fast_not_created(tmpdir):
+    workflow = mock_workflow(tmpdir)
+    mock_osbs()
+    mock_manifest_list()
+    mock_reactor_config(tmpdir)
+
+    first_thread = []
+    first_finished = threading.Event()
+
+    def mock_list_builds(**kwargs):
+        if not first_thread:
+            first_thread.append(threading.current_thread())
+        elif first_thread[0] != threading.current_thread():
+            # finding a cluster for the other platform takes longer than the first build
+            assert first_finished.wait(10)
+            time.sleep(0.5)
+        return []
+    (flexmock(OSBS)
+     .should_receive('list_builds')
+     .replace_with(mock_list_builds))
+
+    created = []
+
+    def mock_create_worker_build(**kwargs):
+        created.append(kwargs['platform'])
+        return make_build_response('worker-build-{}'.format(kwargs['platform']), 'Running')
+    (flexmock(OSBS)
+     .should_receive('create_worker_build')
+     .replace_with(mock_create_worker_build))
+
+    def mock_wait_for_build_to_finish(build_name):
+        first_finished.set()
+        return make_build_response(build_name, 'Failed')
+    (flexmock(OSBS)
+     .should_receive('wait_for_build_to_finish')
+     .replace_with(mock_wait_for_build_to_finish))
+
+    flexmock(OSBS).should_receive('cancel_build').never()
+    flexmock(OSBS).should_receive('get_pod_for_build').and_raise(OsbsException())
+
+    runner = BuildStepPluginsRunner(
+        workflow.builder.tasker,
+        workflow,
+        [{
+            'name': OrchestrateBuildPlugin.key,
+            'args': {
+                'platforms': ['x86_64', 'ppc64le'],
+                'build_kwargs': make_worker_build_kwargs(),
+                'osbs_client_config': str(tmpdir),
+                'goarch': {'x86_64': 'amd64'},
+                'fail_fast': True,
+            }
+        }]
+    )
+
+    build_result = runner.run()
+    assert build_result.is_failed()
+
+    # worker build for the other platform was never created
+    assert len(created) == 1
+    other_platform = ({'x86_64', 'ppc64le'} - set(created)).pop()
+    fail_reason = json.loads(build_result.fail_reason)
+    assert (fail_reason[other_platform]['general'] ==
+            'cancelled, worker build for platform {} failed'.format(created[0]))
+
+
+def test_wait_for_any_cluster():
+    ctx = ClusterRetryContext(max_cluster_fails=5)
+    ctx.try_again_later(0.5)
+
+    sleeps = []
+    flexmock(time).should_receive('sleep').replace_with(sleeps.append)
+    wait_for_any_cluster({'spam': ctx})
+
+    # shorter delays than a second are not rounded down to nothing
+    assert len(sleeps) == 1
+    assert 0 < sleeps[0] <= 0.5
 
 
 @pytest.mark.parametrize(('clusters_x86_64'), (
@@ -12,6 +12,8 @@ import docker
 import flexmock
 import json
 import sys
+import threading
+import time
 import pytest
 import atomic_reactor
 import atomic_reactor.util
@@ -443,6 +445,53 @@ def test_pull_base_autorebuild(monkeypatch, reactor_config_map, inspect_only):
                                 expected_digests=expected_digests)
 
 
+@pytest.mark.parametrize('max_workers', [1, 3])
+def test_pull_parent_images_concurrently(max_workers):
+    parents = ['builder:image', BASE_IMAGE, 'tools:image']
+    builder = MockBuilder()
+    builder.base_image = builder.original_base_image = ImageName.parse(BASE_IMAGE)
+    builder.parent_images = {ImageName.parse(parent): None for parent in parents}
+    workflow = flexmock(builder=builder, plugin_workspace={}, pulled_base_images=set())
+
+    lock = threading.Lock()
+    running = {'now': 0, 'max': 0}
+
+    def pull_image(image, insecure, dockercfg_path):
+        with lock:
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+        time.sleep(0.1)
+        with lock:
+            running['now'] -= 1
+        return image.to_str()
+
+    tasker = flexmock(pull_image=pull_image,
+                      tag_image=lambda image, new_image: new_image.to_str())
+
+    plugin = PullBaseImagePlugin(tasker, workflow, parent_registry=LOCALHOST_REGISTRY,
+                                 max_workers=max_workers)
+    plugin.run()
+
+    if max_workers > 1:
+        assert running['max'] > 1
+    else:
+        assert running['max'] == 1
+
+    # nonces follow the sorted order of parents, whichever finishes first
+    expected = {
+        'builder:image': '{}:0'.format(UNIQUE_ID),
+        BASE_IMAGE: '{}:1'.format(UNIQUE_ID),
+        'tools:image': '{}:2'.format(UNIQUE_ID),
+    }
+    assert {parent.to_str(): image.to_str()
+            for parent, image in builder.parent_images.items()} == expected
+    assert builder.base_image.to_str() == expected[BASE_IMAGE]
+    assert builder.parents_pulled
+    assert workflow.pulled_base_images == set(
+        ['{}/{}'.format(LOCALHOST_REGISTRY, parent) for parent in parents] +
+        list(expected.values()))
+
+
 @pytest.mark.parametrize(('exc', 'failures', 'should_succeed'), [
     (docker.errors.NotFound, 5, True),
     (docker.errors.NotFound, 25, False),
@@ -23,6 +23,7 @@ import atomic_reactor
 import koji
 from atomic_reactor.core import ContainerTasker
 from atomic_reactor.inner import DockerBuildWorkflow
+from atomic_reactor.registry_cache import registry_cache
 from atomic_reactor.util import read_yaml
 import atomic_reactor.cachito_util
 import atomic_reactor.koji_util
@@ -392,6 +393,33 @@ class TestReactorConfigPlugin(object):
         assert set([(x.name, x.max_concurrent_builds)
                     for x in enabled]) == set(clusters)
 
+    @pytest.mark.parametrize('config', [
+        None,
+        {'max_entries': 10, 'tag_ttl': 0},
+        {'cache_dir': 'registry-cache'},
+    ])
+    def test_registry_cache_config(self, tmpdir, config):
+        reactor_config = {'version': 1}
+        if config:
+            if 'cache_dir' in config:
+                config['cache_dir'] = os.path.join(str(tmpdir), config['cache_dir'])
+            reactor_config['registry_cache'] = config
+        filename = os.path.join(str(tmpdir), 'config.yaml')
+        with open(filename, 'w') as fp:
+            fp.write(yaml.safe_dump(reactor_config))
+
+        if config:
+            (flexmock(registry_cache)
+                .should_receive('configure')
+                .with_args(**config)
+                .once())
+        else:
+            flexmock(registry_cache).should_receive('configure').never()
+
+        tasker, workflow = self.prepare()
+        plugin = ReactorConfigPlugin(tasker, workflow, config_path=str(tmpdir))
+        assert plugin.run() is None
+
     @pytest.mark.parametrize(('extra_config', 'fallback', 'error'), [
         ('clusters_client_config_dir: /the/path', None, None),
         ('clusters_client_config_dir: /the/path', '/unused/path', None),
@@ -522,7 +550,7 @@ class TestReactorConfigPlugin(object):
         'openshift', 'group_manifests', 'platform_descriptors', 'prefer_schema1_digest',
         'content_versions', 'registries', 'yum_proxy', 'source_registry', 'sources_command',
         'required_secrets', 'worker_token_secrets', 'clusters', 'hide_files',
-        'skip_koji_check_for_base_image', 'deep_manifest_list_inspection'
+        'skip_koji_check_for_base_image', 'deep_manifest_list_inspection', 'registry_cache'
     ])
     def test_get_methods(self, fallback, method):
         _, workflow = self.prepare()
@@ -8,8 +8,14 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import print_function, unicode_literals, absolute_import
 
+import json
+import os
+import subprocess
+import sys
+
 import flexmock
 import pytest
+from docker.errors import APIError, NotFound
 
 from atomic_reactor.core import DockerTasker
 from atomic_reactor.inner import DockerBuildWorkflow
@@ -85,3 +91,84 @@ class TestGarbageCollectionPlugin(object):
         image_set = set(removed_images)
         assert len(image_set) == len(removed_images)
         assert image_set == expected
+
+    def test_remove_built_image_dedup(self):
+        tasker, workflow = mock_environment()
+        runner = PostBuildPluginsRunner(
+            tasker,
+            workflow,
+            [{'name': GarbageCollectionPlugin.key}]
+        )
+        image_ids = {
+            INPUT_IMAGE: 'sha256:' + INPUT_IMAGE,
+            'registry/built:1': 'sha256:' + INPUT_IMAGE,
+            'registry/built:2': 'sha256:' + INPUT_IMAGE,
+            IMPORTED_IMAGE_ID: 'sha256:base',
+            'registry/base:1': 'sha256:base',
+        }
+
+        def mock_inspect_image(image):
+            if image not in image_ids:
+                raise NotFound('not found')
+            return {'Id': image_ids[image]}
+
+        removed_images = []
+
+        def spy_remove_image(image_id, force=None):
+            removed_images.append((image_id, force))
+
+        flexmock.flexmock(tasker, inspect_image=mock_inspect_image, remove_image=spy_remove_image)
+        workflow.pulled_base_images.add('registry/base:1')
+        for image in ['registry/built:1', 'registry/built:2', 'registry/base:1', 'gone']:
+            defer_removal(workflow, image)
+
+        runner.run()
+        assert sorted(removed_images) == [
+            (INPUT_IMAGE, True),
+            (IMPORTED_IMAGE_ID, False),
+            ('gone', True),
+            ('registry/base:1', True),
+        ]
+
+    def test_remove_built_image_server_error(self, caplog):
+        tasker, workflow = mock_environment()
+        response = flexmock.flexmock(status_code=500, reason='error')
+        removed_images = []
+
+        def mock_remove_image(image_id, force=None):
+            removed_images.append(image_id)
+            if image_id == INPUT_IMAGE:
+                raise APIError('failed', response=response)
+            raise APIError('not found', response=flexmock.flexmock(status_code=404,
+                                                                   reason='Not Found'))
+
+        flexmock.flexmock(tasker,
+                          inspect_image=lambda image: {'Id': image},
+                          remove_image=mock_remove_image)
+
+        plugin = GarbageCollectionPlugin(tasker, workflow)
+        with pytest.raises(APIError):
+            plugin.run()
+        assert set(removed_images) == set([INPUT_IMAGE, IMPORTED_IMAGE_ID])
+        assert 'failed to remove image {}'.format(IMPORTED_IMAGE_ID) in caplog.text
+
+    def test_remove_built_image_background(self):
+        tasker, workflow = mock_environment()
+        defer_removal(workflow, ImageName.parse('registry/built:1'))
+        plugin = GarbageCollectionPlugin(tasker, workflow, background=True, max_workers=2)
+
+        def mock_popen(args, **kwargs):
+            assert args[:2] == [sys.executable, '-c']
+            assert kwargs['preexec_fn'] is os.setsid
+            reaper_args = json.loads(args[3])
+            assert reaper_args['max_workers'] == 2
+            assert sorted(map(tuple, reaper_args['images'])) == [
+                (INPUT_IMAGE, True),
+                (IMPORTED_IMAGE_ID, False),
+                ('registry/built:1', True),
+            ]
+            return flexmock.flexmock(pid=42)
+
+        flexmock.flexmock(subprocess, Popen=mock_popen)
+        flexmock.flexmock(tasker).should_receive('remove_image').never()
+        plugin.run()
@@ -11,6 +11,7 @@ from __future__ import unicode_literals, absolute_import
 import koji
 import os
 import sys
+import time
 from copy import deepcopy
 
 from atomic_reactor.constants import (
@@ -40,6 +41,7 @@ from textwrap import dedent
 
 import logging
 import pytest
+import responses
 
 if MOCK:
     from tests.docker_mock import mock_docker
@@ -120,9 +122,12 @@ def workflow(tmpdir):
 
     mock_reactor_config(workflow, tmpdir)
     mock_repo_config(tmpdir)
+    responses.start()
     mock_odcs_request()
     workflow._koji_session = mock_koji_session()
-    return workflow
+    yield workflow
+    responses.stop()
+    responses.reset()
 
 
 class MockSource(object):
@@ -206,10 +211,17 @@ def mock_odcs_request():
             sigkeys=['R123'])
         .and_return(ODCS_COMPOSE))
 
-    (flexmock(ODCSClient)
-        .should_receive('wait_for_compose')
-        .with_args(ODCS_COMPOSE_ID)
-        .and_return(ODCS_COMPOSE))
+    mock_compose_status(ODCS_COMPOSE)
+
+
+def mock_compose_status(compose, generating_polls=0):
+    url = '{}/composes/{}'.format(ODCS_URL, compose['id'])
+    # the latest mock for a compose wins
+    responses.remove(responses.GET, url)
+    for _ in range(generating_polls):
+        generating = dict(compose, state_name='generating')
+        responses.add(responses.GET, url, json=generating)
+    responses.add(responses.GET, url, json=compose)
 
 
 def mock_koji_session():
@@ -385,10 +397,7 @@ class TestResolveComposes(object):
                 .once()
                 .and_return(ODCS_COMPOSE))
 
-            (flexmock(ODCSClient)
-                .should_receive('wait_for_compose')
-                .with_args(ODCS_COMPOSE_ID)
-                .and_return(ODCS_COMPOSE))
+            mock_compose_status(ODCS_COMPOSE)
 
         compose_ids = []
         current_repourl = ["http://example.com/current.repo"]
@@ -406,11 +415,7 @@ class TestResolveComposes(object):
                 compose['id'] = compose_id
                 compose['result_repofile'] = ODCS_COMPOSE_REPO + '/odcs-{}.repo'.format(compose_id)
 
-                (flexmock(ODCSClient)
-                    .should_receive('wait_for_compose')
-                    .once()
-                    .with_args(compose_id)
-                    .and_return(compose))
+                mock_compose_status(compose)
 
                 compose_ids.append(compose_id)
                 expected_yum_repourls.append(compose['result_repofile'])
@@ -421,11 +426,7 @@ class TestResolveComposes(object):
                 compose['id'] = compose_id
                 compose['result_repofile'] = ODCS_COMPOSE_REPO + '/odcs-{}.repo'.format(compose_id)
 
-                (flexmock(ODCSClient)
-                    .should_receive('wait_for_compose')
-                    .once()
-                    .with_args(compose_id)
-                    .and_return(compose))
+                mock_compose_status(compose)
                 expected_yum_repourls.append(compose['result_repofile'])
 
         workflow.prebuild_results[PLUGIN_CHECK_AND_SET_PLATFORMS_KEY] = arches
@@ -698,10 +699,7 @@ class TestResolveComposes(object):
                 .with_args(source_type='pulp', source=source, arches=[arch], sigkeys=[],
                            flags=expected_flags)
                 .and_return(pulp_composes[arch]).once())
-            (flexmock(ODCSClient)
-                .should_receive('wait_for_compose')
-                .with_args(pulp_id)
-                .and_return(pulp_composes[arch]).once())
+            mock_compose_status(pulp_composes[arch])
 
         mock_content_sets_config(workflow._tmpdir, content_set)
 
@@ -740,10 +738,7 @@ class TestResolveComposes(object):
                            packages=['spam', 'bacon', 'eggs'], sigkeys=sig_keys)
                 .and_return(tag_compose).once())
 
-        (flexmock(ODCSClient)
-            .should_receive('wait_for_compose')
-            .with_args(ODCS_COMPOSE_ID)
-            .and_return(tag_compose).once())
+        mock_compose_status(tag_compose)
 
         plugin_result = self.run_plugin_with_args(workflow, reactor_config_map=reactor_config_map,
                                                   platforms=arches, is_pulp=pulp_arches)
@@ -779,10 +774,6 @@ class TestResolveComposes(object):
                 arches=['x86_64'],
                 sigkeys=[])
             .never())
-        (flexmock(ODCSClient)
-            .should_receive('wait_for_compose')
-            .with_args(85)
-            .never())
 
         mock_content_sets_config(workflow._tmpdir, '')
 
@@ -865,7 +856,7 @@ class TestResolveComposes(object):
             reac_conf['odcs']['insecure'] = plugin_args.get('odcs_insecure', False)
 
         (flexmock(ODCSClient)
-            .should_receive('__init__')
+            .should_call('__init__')
             .with_args(ODCS_URL, **exp_kwargs))
 
         self.run_plugin_with_args(workflow, plug_args, reactor_config_map=reactor_config_map)
@@ -970,11 +961,7 @@ class TestResolveComposes(object):
                 sigkeys=sigkeys)
             .and_return(odcs_compose))
 
-        (flexmock(ODCSClient)
-            .should_receive('wait_for_compose')
-            .once()
-            .with_args(odcs_compose['id'])
-            .and_return(odcs_compose))
+        mock_compose_status(odcs_compose)
 
         parent_build_info = {
             'id': 1234,
@@ -1001,7 +988,9 @@ class TestResolveComposes(object):
             'signing_intent_overridden': overridden,
             'composes': [odcs_compose],
         }
+        compose_wait_times = plugin_result.pop('compose_wait_times')
         assert plugin_result == expected_result
+        assert list(compose_wait_times) == [odcs_compose['id']]
 
     @pytest.mark.parametrize(('composes_intent', 'expected_intent'), (
         (('release', 'beta'), 'beta'),
@@ -1018,11 +1007,7 @@ class TestResolveComposes(object):
             compose['id'] = compose_id
             compose['sigkeys'] = ' '.join(SIGNING_INTENTS[signing_intent])
 
-            (flexmock(ODCSClient)
-                .should_receive('wait_for_compose')
-                .once()
-                .with_args(compose_id)
-                .and_return(compose))
+            mock_compose_status(compose)
 
             composes.append(compose)
 
@@ -1109,11 +1094,7 @@ class TestResolveComposes(object):
             .should_receive('start_compose')
             .never())
 
-        (flexmock(ODCSClient)
-            .should_receive('wait_for_compose')
-            .once()
-            .with_args(old_odcs_compose['id'])
-            .and_return(old_odcs_compose))
+        mock_compose_status(old_odcs_compose, generating_polls=1)
 
         (flexmock(ODCSClient)
             .should_receive('renew_compose')
@@ -1121,11 +1102,16 @@ class TestResolveComposes(object):
             .with_args(old_odcs_compose['id'])
             .and_return(new_odcs_compose))
 
-        (flexmock(ODCSClient)
-            .should_receive('wait_for_compose')
-            .times(1 if expect_renew else 0)
-            .with_args(new_odcs_compose['id'])
-            .and_return(new_odcs_compose))
+        mock_compose_status(new_odcs_compose, generating_polls=2)
+
+        # each second slept while polling passes on the clock
+        clock = {'now': 0}
+        (flexmock(time)
+            .should_receive('time')
+            .replace_with(lambda: clock['now']))
+        (flexmock(time)
+            .should_receive('sleep')
+            .replace_with(lambda seconds: clock.update(now=clock['now'] + seconds)))
 
         plugin_args = {
             'compose_ids': [old_odcs_compose['id']],
@@ -1134,10 +1120,19 @@ class TestResolveComposes(object):
         plugin_result = self.run_plugin_with_args(workflow, plugin_args,
                                                   reactor_config_map=reactor_config_map)
 
+        polled_urls = [call.request.url for call in responses.calls]
+        old_url = '{}/composes/{}'.format(ODCS_URL, old_odcs_compose['id'])
+        new_url = '{}/composes/{}'.format(ODCS_URL, new_odcs_compose['id'])
+
         if expect_renew:
             assert plugin_result['composes'] == [new_odcs_compose]
+            assert polled_urls == [old_url] * 2 + [new_url] * 3
+            # includes waiting for the compose before it was renewed
+            assert plugin_result['compose_wait_times'] == {new_odcs_compose['id']: 3}
         else:
             assert plugin_result['composes'] == [old_odcs_compose]
+            assert polled_urls == [old_url] * 2
+            assert plugin_result['compose_wait_times'] == {old_odcs_compose['id']: 1}
 
     def test_inject_yum_repos_from_new_compose(self, workflow, reactor_config_map):
         self.run_plugin_with_args(workflow, reactor_config_map=reactor_config_map)
@@ -1152,11 +1147,7 @@ class TestResolveComposes(object):
             compose['id'] = compose_id
             compose['result_repofile'] = ODCS_COMPOSE_REPO + '/odcs-{}.repo'.format(compose_id)
 
-            (flexmock(ODCSClient)
-                .should_receive('wait_for_compose')
-                .once()
-                .with_args(compose_id)
-                .and_return(compose))
+            mock_compose_status(compose)
 
             compose_ids.append(compose_id)
             expected_yum_repourls.append(compose['result_repofile'])
@@ -1264,7 +1255,9 @@ class TestResolveComposes(object):
             else:
                 assert ODCS_COMPOSE['result_repofile'] in yum_repourls
             assert set(results.keys()) == set(['signing_intent', 'signing_intent_overridden',
-                                               'composes'])
+                                               'composes', 'compose_wait_times'])
+            assert (set(results['compose_wait_times']) ==
+                    set(compose['id'] for compose in results['composes']))
         else:
             assert self.get_override_yum_repourls(workflow) is None
             assert results is None
@@ -8,14 +8,18 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import unicode_literals, absolute_import
 
+import io
 import logging
 
 import docker
 from flexmock import flexmock
 import pytest
 
+from atomic_reactor.compress_util import ParallelCompressedFile
+from atomic_reactor.constants import IMAGE_TYPE_DOCKER_ARCHIVE
 from atomic_reactor.inner import DockerBuildWorkflow
 from atomic_reactor.plugin import PostBuildPluginsRunner, PluginFailedException
+from atomic_reactor.plugins import post_rpmqa
 from atomic_reactor.plugins.post_rpmqa import PostBuildRPMqaPlugin
 from atomic_reactor.rpm_util import parse_rpm_output
 from tests.constants import DOCKERFILE_GIT
@@ -200,3 +204,71 @@ def test_empty_logs_failure(docker_tasker):  # noqa
     with pytest.raises(PluginFailedException) as exc_info:
         runner.run()
     assert 'Unable to gather list of installed packages in container' in str(exc_info.value)
+
+
+@pytest.mark.parametrize('exported_image', [True, False, 'gzip', 'lzma', 'chunks'])
+def test_rpmqa_read_rpmdb(tmpdir, docker_tasker, exported_image):
+    mock_docker()
+    workflow = DockerBuildWorkflow(TEST_IMAGE, source=SOURCE)
+    workflow.source = StubSource()
+    workflow.builder = StubInsideBuilder().for_workflow(workflow)
+    workflow.builder.set_base_from_scratch(False)
+
+    if exported_image in (True, 'gzip', 'lzma'):
+        path = str(tmpdir.join('image.tar'))
+        if exported_image is True:
+            with open(path, 'wb') as f:
+                f.write(b'exported')
+        else:
+            # output of the compress plugin using several threads
+            with ParallelCompressedFile(path, exported_image, 3, block_size=2) as f:
+                f.write(b'exported')
+        workflow.exported_image_sequence.append({'path': path,
+                                                 'type': IMAGE_TYPE_DOCKER_ARCHIVE})
+        flexmock(docker_tasker).should_receive('get_image').never()
+        expected_content = b'exported'
+    elif exported_image == 'chunks':
+        # docker-py 3.x returns a generator of chunks
+        (flexmock(docker_tasker)
+            .should_receive('get_image')
+            .with_args(TEST_IMAGE)
+            .and_return(chunk for chunk in [b'sa', b'ved']))
+        expected_content = b'saved'
+    else:
+        (flexmock(docker_tasker)
+            .should_receive('get_image')
+            .with_args(TEST_IMAGE)
+            .and_return(io.BytesIO(b'saved')))
+        expected_content = b'saved'
+
+    def get_image_rpm_list(image_archive):
+        assert image_archive.read(100) == expected_content
+        return PACKAGE_LIST_WITH_AUTOGENERATED
+
+    (flexmock(post_rpmqa)
+        .should_receive('get_image_rpm_list')
+        .replace_with(get_image_rpm_list)
+        .once())
+    # no container is run
+    flexmock(docker_tasker).should_receive('run').never()
+
+    plugin = PostBuildRPMqaPlugin(docker_tasker, workflow, TEST_IMAGE, read_rpmdb=True)
+    assert plugin.run() == PACKAGE_LIST
+    assert workflow.image_components == parse_rpm_output(PACKAGE_LIST)
+
+
+@pytest.mark.parametrize('rpm_list', [None, []])
+def test_rpmqa_read_rpmdb_failure(docker_tasker, rpm_list):
+    mock_docker()
+    workflow = DockerBuildWorkflow(TEST_IMAGE, source=SOURCE)
+    workflow.source = StubSource()
+    workflow.builder = StubInsideBuilder().for_workflow(workflow)
+    workflow.builder.set_base_from_scratch(False)
+
+    flexmock(docker_tasker).should_receive('get_image').and_return(io.BytesIO(b''))
+    flexmock(post_rpmqa).should_receive('get_image_rpm_list').and_return(rpm_list)
+
+    plugin = PostBuildRPMqaPlugin(docker_tasker, workflow, TEST_IMAGE, read_rpmdb=True)
+    with pytest.raises(RuntimeError) as exc_info:
+        plugin.run()
+    assert 'Unable to read list of installed packages' in str(exc_info.value)
@@ -366,6 +366,8 @@ CMD blabla"""
 
     plugins_metadata = json.loads(annotations["plugins-metadata"])
     assert "all_rpm_packages" in plugins_metadata["durations"]
+    assert plugins_metadata["registry_cache"] == {"hits": 0, "misses": 0, "entries": 0}
+    assert plugins_metadata["resources"] == {}
 
     if br_annotations:
         assert annotations['br_annotations'] == expected_br_annotations
@@ -9,21 +9,26 @@ of the BSD license. See the LICENSE file for details.
 from __future__ import print_function, unicode_literals, absolute_import
 
 from datetime import datetime
+import threading
 import time
 import platform
 import random
 import pytest
 import koji as koji
 import osbs
-from atomic_reactor.constants import IMAGE_TYPE_OCI, IMAGE_TYPE_OCI_TAR
+from atomic_reactor.constants import (IMAGE_TYPE_OCI, IMAGE_TYPE_OCI_TAR,
+                                      MEDIA_TYPE_DOCKER_V2_SCHEMA2)
 from atomic_reactor.core import DockerTasker
 from atomic_reactor.inner import DockerBuildWorkflow
+from atomic_reactor.manifest_util import ManifestUtil
 from atomic_reactor.plugin import PostBuildPluginsRunner, PluginFailedException
+from atomic_reactor.plugins import post_tag_and_push
 from atomic_reactor.plugins.post_tag_and_push import TagAndPushPlugin
 from atomic_reactor.plugins.pre_fetch_sources import PLUGIN_FETCH_SOURCES_KEY
 from atomic_reactor.plugins.pre_reactor_config import (ReactorConfigPlugin,
                                                        WORKSPACE_CONF_KEY,
                                                        ReactorConfig)
+from atomic_reactor.registry_cache import registry_cache
 from atomic_reactor.util import ManifestDigest, get_exported_image_metadata
 from tests.constants import (LOCALHOST_REGISTRY, TEST_IMAGE, TEST_IMAGE_NAME, INPUT_IMAGE, MOCK,
                              DOCKER0_REGISTRY)
@@ -632,3 +637,190 @@ def test_tag_and_push_plugin_oci(tmpdir, monkeypatch, source_oci_image_path, v2s
             assert push_conf_digests[TEST_IMAGE_NAME].oci == DIGEST_OCI
 
         assert workflow.push_conf.docker_registries[0].config is config_json
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+@pytest.mark.parametrize('fail_tag', [None, 'latest'])
+def test_tag_and_push_plugin_concurrent(max_workers, fail_tag):
+    workflow = DockerBuildWorkflow(TEST_IMAGE, source={"provider": "git", "uri": "asd"})
+    workflow.builder = StubInsideBuilder()
+    workflow.builder.image_id = INPUT_IMAGE
+    tags = ['1.0-1', '1.0', 'latest', 'unique']
+    for tag in tags[:-1]:
+        workflow.tag_conf.add_primary_image('namespace/image:' + tag)
+    workflow.tag_conf.add_unique_image('namespace/image:unique')
+
+    registries = {
+        'registry1.example.com': {'insecure': True},
+        'registry2.example.com': {'expected_media_types': [MEDIA_TYPE_DOCKER_V2_SCHEMA2]},
+    }
+
+    lock = threading.Lock()
+    pushes = {registry: [] for registry in registries}
+    digest_checks = {}
+
+    def tag_and_push_image(image_id, registry_image, insecure, force, dockercfg):
+        assert image_id == INPUT_IMAGE
+        assert insecure == registries[registry_image.registry].get('insecure', False)
+        with lock:
+            pushes[registry_image.registry].append(registry_image.tag)
+        if registry_image.tag == fail_tag:
+            raise RuntimeError('push failed')
+
+    def get_manifest_digests(registry_image, registry, insecure, dockercfg, **kwargs):
+        assert registry_image.registry == registry
+        with lock:
+            checks = digest_checks.setdefault(registry_image.to_str(), 0) + 1
+            digest_checks[registry_image.to_str()] = checks
+        # manifest of the first additional tag shows up only after a retry
+        if registry_image.tag == '1.0' and checks == 1:
+            return ManifestDigest(v1=DIGEST_V1)
+        return ManifestDigest(v1=DIGEST_V1, v2=DIGEST_V2)
+
+    tasker = flexmock(tag_and_push_image=tag_and_push_image)
+    (flexmock(post_tag_and_push)
+        .should_receive('get_manifest_digests')
+        .replace_with(get_manifest_digests))
+    (flexmock(post_tag_and_push)
+        .should_receive('get_config_from_registry')
+        .replace_with(lambda image, registry, *args: {'registry': registry}))
+    (flexmock(time)
+        .should_receive('sleep')
+        .times(len(registries)))
+
+    plugin = TagAndPushPlugin(tasker, workflow, registries=registries,
+                              max_workers=max_workers)
+
+    if fail_tag:
+        with pytest.raises(RuntimeError):
+            plugin.run()
+    else:
+        pushed_images = plugin.run()
+        assert [image.to_str() for image in pushed_images] == [
+            '{}/namespace/image:{}'.format(registry, tag)
+            for registry in registries for tag in tags
+        ]
+
+    for registry, push_conf_registry in zip(registries, workflow.push_conf.docker_registries):
+        assert push_conf_registry.uri == registry
+        # layers are uploaded by the first push, other tags follow
+        assert pushes[registry][0] == tags[0]
+        assert sorted(set(pushes[registry])) == sorted(tags)
+
+        digests = push_conf_registry.digests
+        if fail_tag:
+            # results are stored in order, up to the first failure
+            assert sorted(digests) == ['namespace/image:1.0', 'namespace/image:1.0-1']
+            break
+
+        assert sorted(digests) == sorted('namespace/image:' + tag for tag in tags)
+        assert all(digest.v2 == DIGEST_V2 for digest in digests.values())
+        assert push_conf_registry.config == {'registry': registry}
+
+
+@pytest.mark.parametrize('has_v2', [True, False])
+def test_tag_and_push_plugin_copy_manifests(has_v2):
+    workflow = DockerBuildWorkflow(TEST_IMAGE, source={"provider": "git", "uri": "asd"})
+    workflow.builder = StubInsideBuilder()
+    workflow.builder.image_id = INPUT_IMAGE
+    images = ['namespace/image:1.0-1', 'namespace/image:1.0', 'other/image:latest']
+    for image in images:
+        workflow.tag_conf.add_primary_image(image)
+    workflow.tag_conf.add_unique_image('namespace/image:unique')
+    images.append('namespace/image:unique')
+
+    registry = 'registry.example.com'
+    registries = {registry: {'insecure': True}}
+    if has_v2:
+        pushed_digests = ManifestDigest(v1=DIGEST_V1, v2=DIGEST_V2)
+    else:
+        pushed_digests = ManifestDigest(v1=DIGEST_V1)
+
+    lock = threading.Lock()
+    pushes = []
+    stored = []
+
+    def tag_and_push_image(image_id, registry_image, insecure, force, dockercfg):
+        with lock:
+            pushes.append(registry_image.to_str(registry=False))
+
+    def store_manifest_in_repository(session, manifest, media_type, source_repo, target_repo,
+                                     ref=None):
+        assert session.registry == registry
+        assert manifest == b'manifest'
+        assert media_type == MEDIA_TYPE_DOCKER_V2_SCHEMA2
+        with lock:
+            stored.append((source_repo, target_repo, ref))
+
+    tasker = flexmock(tag_and_push_image=tag_and_push_image)
+    (flexmock(post_tag_and_push)
+        .should_receive('get_manifest_digests')
+        .and_return(pushed_digests)
+        .times(1 if has_v2 else len(images)))
+    (flexmock(post_tag_and_push)
+        .should_receive('get_config_from_registry')
+        .and_return({}))
+    (flexmock(ManifestUtil)
+        .should_receive('get_manifest')
+        .with_args(object, 'namespace/image', DIGEST_V2)
+        .and_return(b'manifest', DIGEST_V2, MEDIA_TYPE_DOCKER_V2_SCHEMA2, 8)
+        .times(1 if has_v2 else 0))
+    (flexmock(ManifestUtil)
+        .should_receive('store_manifest_in_repository')
+        .replace_with(store_manifest_in_repository))
+
+    plugin = TagAndPushPlugin(tasker, workflow, registries=registries, copy_manifests=True)
+    pushed_images = plugin.run()
+
+    assert [image.to_str(registry=False) for image in pushed_images] == images
+    digests = workflow.push_conf.docker_registries[0].digests
+    if has_v2:
+        # only the first tag is pushed, others reuse its manifest
+        assert pushes == images[:1]
+        assert sorted(stored) == sorted([
+            ('namespace/image', 'namespace/image', '1.0'),
+            ('namespace/image', 'other/image', 'latest'),
+            ('namespace/image', 'namespace/image', 'unique'),
+        ])
+        assert digests[images[0]] == pushed_digests
+        for image in images[1:]:
+            assert digests[image] == ManifestDigest(v2=DIGEST_V2, oci=None)
+    else:
+        assert sorted(pushes) == sorted(images)
+        assert not stored
+        assert all(digests[image] == pushed_digests for image in images)
+
+
+def test_tag_and_push_plugin_invalidates_registry_cache():
+    workflow = DockerBuildWorkflow(TEST_IMAGE, source={"provider": "git", "uri": "asd"})
+    workflow.builder = StubInsideBuilder()
+    workflow.builder.image_id = INPUT_IMAGE
+    workflow.tag_conf.add_primary_image('namespace/image:1.0')
+
+    registry = 'registry.example.com'
+    response = requests.Response()
+    response.status_code = 200
+    response._content = b'{}'
+    pushed_key = registry_cache.make_key(registry, '/v2/namespace/image/manifests/1.0')
+    other_key = registry_cache.make_key(registry, '/v2/other/image/manifests/1.0')
+    for key in (pushed_key, other_key):
+        registry_cache.set(key, '1.0', response)
+
+    def tag_and_push_image(image_id, registry_image, insecure, force, dockercfg):
+        if registry_image.to_str() == registry + '/namespace/image:1.0':
+            # the tag was cached before the push
+            assert registry_cache.get(pushed_key, '1.0') is not None
+
+    tasker = flexmock(tag_and_push_image=tag_and_push_image)
+    (flexmock(post_tag_and_push)
+        .should_receive('get_manifest_digests')
+        .and_return(ManifestDigest(v2=DIGEST_V2)))
+    (flexmock(post_tag_and_push)
+        .should_receive('get_config_from_registry')
+        .and_return({}))
+
+    plugin = TagAndPushPlugin(tasker, workflow, registries={registry: {'insecure': True}})
+    plugin.run()
+
+    assert registry_cache.get(pushed_key, '1.0') is None
+    assert registry_cache.get(other_key, '1.0') is not None
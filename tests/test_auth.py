@@ -7,13 +7,16 @@ of the BSD license. See the LICENSE file for details.
 """
 from __future__ import unicode_literals, absolute_import
 
-from atomic_reactor.auth import HTTPBearerAuth, HTTPRegistryAuth, HTTPBasicAuthWithB64
+from atomic_reactor.auth import (HTTPBearerAuth, HTTPRegistryAuth, HTTPBasicAuthWithB64,
+                                 BearerTokenCache, bearer_token_cache)
 from requests.auth import HTTPBasicAuth
+from flexmock import flexmock
 import base64
 import json
 import pytest
 import requests
 import responses
+import time
 
 
 BEARER_TOKEN = 'the-token'
@@ -30,6 +33,12 @@ def bearer_success_callback(request):
     return (200, {}, json.dumps('success'))
 
 
+def bearer_auth_callback(request):
+    if 'Authorization' in request.headers:
+        return bearer_success_callback(request)
+    return bearer_unauthorized_callback(request)
+
+
 def b64encode(username, password):
     return base64.b64encode('{}:{}'.format(username, password).encode('utf-8')).decode('utf-8')
 
@@ -204,6 +213,118 @@ class TestHTTPBearerAuth(object):
         assert response.status_code == 401
         assert len(responses.calls) == 1
 
+    @responses.activate
+    def test_token_cached_across_instances(self):
+        responses.add(responses.GET, BEARER_REALM_URL + '?scope=repository:fedora:pull',
+                      json={'token': BEARER_TOKEN}, match_querystring=True)
+
+        url = 'https://registry.example.com/v2/fedora/manifests/{}'
+        for tag in ('latest', '1', '2'):
+            responses.add_callback(responses.GET, url.format(tag),
+                                   callback=bearer_auth_callback)
+
+        for tag in ('latest', '1', '2'):
+            response = requests.get(url.format(tag), auth=HTTPBearerAuth())
+            assert response.json() == 'success'
+
+        # 401 + token + 3 successful requests
+        assert len(responses.calls) == 5
+        assert len(bearer_token_cache) == 1
+
+    @responses.activate
+    @pytest.mark.parametrize(('first', 'second', 'shared'), (
+        ({}, {}, True),
+        ({'username': 'spam', 'password': 'bacon'}, {'username': 'spam', 'password': 'bacon'},
+         True),
+        ({'username': 'spam', 'password': 'bacon'}, {}, False),
+        ({'username': 'spam', 'password': 'bacon'}, {'username': 'spam', 'password': 'eggs'},
+         False),
+        ({'auth_b64': b64encode('spam', 'bacon')}, {}, False),
+        ({'access': ('pull',)}, {'access': ('pull', 'push')}, False),
+    ))
+    def test_token_cache_key(self, first, second, shared):
+        for scope in ('pull', 'pull,push'):
+            responses.add(responses.GET,
+                          BEARER_REALM_URL + '?scope=repository:fedora:{}'.format(scope),
+                          json={'token': BEARER_TOKEN}, match_querystring=True)
+
+        url = 'https://registry.example.com/v2/fedora/tags/list'
+        responses.add_callback(responses.GET, url, callback=bearer_auth_callback)
+
+        assert requests.get(url, auth=HTTPBearerAuth(**first)).json() == 'success'
+        assert requests.get(url, auth=HTTPBearerAuth(**second)).json() == 'success'
+
+        token_requests = [call for call in responses.calls
+                          if call.request.url.startswith(BEARER_REALM_URL)]
+        assert len(token_requests) == (1 if shared else 2)
+
+    @responses.activate
+    def test_access_token(self):
+        responses.add(responses.GET, BEARER_REALM_URL + '?scope=repository:fedora:pull',
+                      json={'access_token': BEARER_TOKEN}, match_querystring=True)
+
+        url = 'https://registry.example.com/v2/fedora/tags/list'
+        responses.add_callback(responses.GET, url, callback=bearer_auth_callback)
+
+        assert requests.get(url, auth=HTTPBearerAuth()).json() == 'success'
+
+    @responses.activate
+    def test_token_expired(self):
+        responses.add(responses.GET, BEARER_REALM_URL + '?scope=repository:fedora:pull',
+                      json={'token': BEARER_TOKEN, 'expires_in': 300}, match_querystring=True)
+
+        url = 'https://registry.example.com/v2/fedora/tags/list'
+        responses.add_callback(responses.GET, url, callback=bearer_auth_callback)
+
+        now = time.time()
+        flexmock(time).should_receive('time').and_return(now)
+        auth = HTTPBearerAuth()
+        assert requests.get(url, auth=auth).json() == 'success'
+        assert requests.get(url, auth=auth).json() == 'success'
+        assert len(responses.calls) == 4
+
+        # the token expired, a new one has to be negotiated
+        flexmock(time).should_receive('time').and_return(now + 300)
+        assert requests.get(url, auth=auth).json() == 'success'
+        assert len(responses.calls) == 7
+
+
+class TestBearerTokenCache(object):
+
+    @pytest.mark.parametrize(('expires_in', 'issued_at', 'valid_for'), (
+        (None, None, BearerTokenCache.DEFAULT_EXPIRES_IN),
+        ('invalid', None, BearerTokenCache.DEFAULT_EXPIRES_IN),
+        (300, None, 300),
+        (300, 'invalid', 300),
+        # issued 100s ago
+        (300, '2019-01-01T00:00:00Z', 200),
+        (300, '2019-01-01T00:00:00.123456789Z', 200),
+        # issued in the future (clock skew)
+        (300, '2019-01-01T00:10:00Z', 300),
+    ))
+    def test_expiration(self, expires_in, issued_at, valid_for):
+        now = 1546300900  # 2019-01-01T00:01:40Z
+        flexmock(time).should_receive('time').and_return(now)
+
+        cache = BearerTokenCache()
+        cache.set('key', 'token', expires_in=expires_in, issued_at=issued_at)
+        assert cache.get('key') == 'token'
+        assert cache.get('other-key') is None
+
+        expires_at = now + valid_for - BearerTokenCache.EXPIRY_MARGIN
+        flexmock(time).should_receive('time').and_return(expires_at - 1)
+        assert cache.get('key') == 'token'
+
+        flexmock(time).should_receive('time').and_return(expires_at)
+        assert cache.get('key') is None
+        assert len(cache) == 0
+
+    def test_clear(self):
+        cache = BearerTokenCache()
+        cache.set('key', 'token')
+        cache.clear()
+        assert cache.get('key') is None
+
 
 class TestHTTPRegistryAuth(object):
 
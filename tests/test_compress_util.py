@@ -0,0 +1,133 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import absolute_import
+
+import gzip
+import os
+try:
+    from backports import lzma
+except ImportError:
+    import lzma
+
+import pytest
+from flexmock import flexmock
+
+from atomic_reactor import compress_util
+from atomic_reactor.compress_util import (ParallelCompressedFile, open_compressed,
+                                          open_decompressed, compress_gzip_block,
+                                          compress_lzma_block)
+
+
+DECOMPRESSORS = {
+    'gzip': gzip.open,
+    'lzma': lzma.open,
+}
+
+
+def make_data(size):
+    line = b'0123456789 abcdefghijklmnopqrstuvwxyz\n'
+    data = line * (size // len(line) + 1)
+    return data[:size]
+
+
+def read_compressed(path, method):
+    with DECOMPRESSORS[method](path, 'rb') as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('method', ['gzip', 'lzma'])
+@pytest.mark.parametrize('size', [0, 1, 999, 1000, 1001, 10000])
+@pytest.mark.parametrize('write_size', [1, 300, 5000])
+def test_parallel_round_trip(tmpdir, method, size, write_size):
+    path = os.path.join(str(tmpdir), 'out')
+    data = make_data(size)
+
+    with ParallelCompressedFile(path, method, 3, block_size=1000) as f:
+        for start in range(0, len(data), write_size):
+            f.write(data[start:start + write_size])
+
+    assert f.closed
+    assert read_compressed(path, method) == data
+
+
+@pytest.mark.parametrize('method', ['gzip', 'lzma'])
+def test_parallel_independent_blocks(tmpdir, method):
+    path = os.path.join(str(tmpdir), 'out')
+    blocks = [b'a' * 100, b'b' * 100, b'c' * 50]
+    compress_block = {'gzip': compress_gzip_block, 'lzma': compress_lzma_block}[method]
+
+    with ParallelCompressedFile(path, method, 2, level=1, block_size=100) as f:
+        f.write(b''.join(blocks))
+
+    with open(path, 'rb') as f:
+        assert f.read() == b''.join(compress_block(block, 1) for block in blocks)
+
+
+def test_parallel_abort(tmpdir):
+    path = os.path.join(str(tmpdir), 'out')
+
+    with pytest.raises(ValueError):
+        with ParallelCompressedFile(path, 'gzip', 2, block_size=10) as f:
+            f.write(make_data(100))
+            raise ValueError('interrupted')
+
+    assert f.closed
+    with pytest.raises(ValueError):
+        f.write(b'more')
+
+
+@pytest.mark.parametrize('method', ['gzip', 'lzma'])
+@pytest.mark.parametrize('threads, parallel', [
+    (1, False),
+    (4, True),
+    (0, True),
+])
+@pytest.mark.parametrize('level', [None, 1, 9])
+def test_open_compressed(tmpdir, method, threads, parallel, level):
+    path = os.path.join(str(tmpdir), 'out')
+    data = make_data(10000)
+    flexmock(compress_util).should_receive('cpu_count').and_return(2)
+
+    f = open_compressed(path, method, threads=threads, level=level)
+    assert isinstance(f, ParallelCompressedFile) == parallel
+    if parallel:
+        assert f.level == (6 if level is None else level)
+    with f:
+        f.write(data)
+
+    assert read_compressed(path, method) == data
+
+
+def test_open_compressed_unsupported(tmpdir):
+    path = os.path.join(str(tmpdir), 'out')
+    with pytest.raises(RuntimeError) as exc:
+        open_compressed(path, 'spam')
+
+    assert 'Unsupported compression format' in str(exc.value)
+    assert not os.path.exists(path)
+
+
+@pytest.mark.parametrize('method', ['gzip', 'lzma', None])
+@pytest.mark.parametrize('threads', [1, 3])
+def test_open_decompressed(tmpdir, method, threads):
+    path = os.path.join(str(tmpdir), 'out')
+    data = make_data(10000)
+    if method and threads > 1:
+        # several gzip members or xz streams
+        with ParallelCompressedFile(path, method, threads, block_size=1000) as f:
+            f.write(data)
+    elif method:
+        with open_compressed(path, method) as f:
+            f.write(data)
+    else:
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    with open_decompressed(path) as f:
+        assert f.read() == data
@@ -7,7 +7,11 @@ of the BSD license. See the LICENSE file for details.
 """
 
 from __future__ import absolute_import, print_function, unicode_literals
+import hashlib
+import os
+import threading
 import time
+import zlib
 
 import koji
 import requests
@@ -15,10 +19,14 @@ import requests
 from osbs.repo_utils import ModuleSpec
 from atomic_reactor.koji_util import (koji_login, create_koji_session,
                                       TaskWatcher, tag_koji_build,
-                                      get_koji_module_build)
+                                      get_koji_module_build, get_output_metadata,
+                                      koji_multicall_map, upload_file, upload_outputs,
+                                      wait_for_tasks)
 from atomic_reactor import koji_util
 from atomic_reactor.plugin import BuildCanceledException
 from atomic_reactor.constants import HTTP_MAX_RETRIES
+from atomic_reactor.util import Output
+from tests.util import mock_koji_multicall
 import flexmock
 import pytest
 
@@ -226,6 +234,77 @@ class TestTaskWatcher(object):
 
         assert task.failed()
 
+    def test_cancel_task(self):
+        session = flexmock.flexmock()
+        task_id = 1234
+        (session
+            .should_receive('taskFinished')
+            .and_return(False)
+            .and_raise(BuildCanceledException))
+        session.should_receive('cancelTask').with_args(task_id).once()
+        flexmock.flexmock(time).should_receive('sleep')
+
+        task = TaskWatcher(session, task_id, poll_interval=0, cancel_on_build_cancel=True)
+        with pytest.raises(BuildCanceledException):
+            task.wait()
+
+        assert task.failed()
+
+    def test_adaptive_interval(self):
+        session = flexmock.flexmock()
+        task_id = 1234
+        expectation = session.should_receive('taskFinished').with_args(task_id)
+        for _ in range(6):
+            expectation.and_return(False)
+        expectation.and_return(True)
+        (session
+            .should_receive('getTaskInfo')
+            .and_return({'state': koji.TASK_STATES['CLOSED']}))
+        sleeps = []
+        flexmock.flexmock(time).should_receive('sleep').replace_with(sleeps.append)
+
+        task = TaskWatcher(session, task_id, poll_interval=2)
+        assert task.wait() == 'CLOSED'
+
+        # checks are frequent at first, then up to poll_interval seconds apart
+        assert sleeps == [0.5, 0.75, 1.125, 1.6875, 2, 2]
+
+
+class TestWaitForTasks(object):
+    def test_multiple_tasks(self):
+        session = flexmock.flexmock()
+        mock_koji_multicall(session)
+        finished = {1: [False, True], 2: [False, False, True], 3: [True]}
+        (session
+            .should_receive('taskFinished')
+            .replace_with(lambda task_id: finished[task_id].pop(0)))
+        (session
+            .should_receive('getTaskInfo')
+            .replace_with(lambda task_id, request=False: {
+                'state': koji.TASK_STATES['FAILED' if task_id == 2 else 'CLOSED']}))
+        flexmock.flexmock(time).should_receive('sleep').times(2)
+
+        assert wait_for_tasks(session, [1, 2, 3], poll_interval=0) == {
+            1: 'CLOSED', 2: 'FAILED', 3: 'CLOSED'}
+        # each unfinished task was checked in every round
+        assert finished == {1: [], 2: [], 3: []}
+
+    def test_cancel_pending_tasks(self):
+        session = flexmock.flexmock()
+        mock_koji_multicall(session)
+        (session
+            .should_receive('taskFinished')
+            .replace_with(lambda task_id: task_id == 1))
+        (flexmock.flexmock(time)
+            .should_receive('sleep')
+            .and_raise(BuildCanceledException))
+        session.should_receive('cancelTask').with_args(1).never()
+        session.should_receive('cancelTask').with_args(2).and_raise(koji.GenericError).once()
+        session.should_receive('cancelTask').with_args(3).once()
+
+        with pytest.raises(BuildCanceledException):
+            wait_for_tasks(session, [1, 2, 3], cancel_on_build_cancel=True)
+
 
 class TestTagKojiBuild(object):
     @pytest.mark.parametrize(('task_state', 'failure'), (
@@ -267,6 +346,276 @@ class TestTagKojiBuild(object):
             assert build_tag == tag_name
 
 
+class TestKojiMulticallMap(object):
+    def test_results_in_order(self):
+        session = flexmock.flexmock()
+        mock_koji_multicall(session)
+        for build_id in (3, 1, 2):
+            (session
+                .should_receive('getBuild')
+                .with_args(build_id, strict=True)
+                .and_return({'build_id': build_id})
+                .once())
+
+        results = koji_multicall_map(session, 'getBuild', [3, 1, 2], strict=True)
+        assert results == [{'build_id': 3}, {'build_id': 1}, {'build_id': 2}]
+
+    def test_empty(self):
+        session = flexmock.flexmock()
+        session.should_receive('multicall').never()
+        assert koji_multicall_map(session, 'getBuild', []) == []
+
+    def test_error(self):
+        session = flexmock.flexmock()
+        mock_koji_multicall(session)
+        (session
+            .should_receive('getBuild')
+            .and_raise(koji.GenericError('No such build')))
+
+        with pytest.raises(koji.GenericError):
+            koji_multicall_map(session, 'getBuild', [1, 2], strict=True)
+
+    @pytest.mark.parametrize('failures', [1, HTTP_MAX_RETRIES - 1, HTTP_MAX_RETRIES])
+    def test_connection_error(self, failures):
+        session = flexmock.flexmock()
+        mock_koji_multicall(session)
+        attempts = []
+
+        def get_build(build_id):
+            if build_id == 1 and len(attempts) < failures:
+                attempts.append(build_id)
+                raise requests.ConnectionError('connection reset')
+            return {'build_id': build_id}
+
+        session.should_receive('getBuild').replace_with(get_build)
+        flexmock.flexmock(time).should_receive('sleep').times(min(failures, HTTP_MAX_RETRIES))
+
+        if failures < HTTP_MAX_RETRIES:
+            results = koji_multicall_map(session, 'getBuild', [1, 2])
+            assert results == [{'build_id': 1}, {'build_id': 2}]
+        else:
+            with pytest.raises(requests.ConnectionError):
+                koji_multicall_map(session, 'getBuild', [1, 2])
+
+
+class MockedUploadSession(object):
+    """
+    Stores uploaded chunks like the hub does, optionally failing some of them
+    """
+    def __init__(self, fail_offsets=None, lose_response=False, use_fast_upload=True):
+        self.opts = {'use_fast_upload': use_fast_upload}
+        self.files = {}
+        self.fail_offsets = list(fail_offsets or [])
+        self.lose_response = lose_response
+        self.uploaded_offsets = []
+
+    def rawUpload(self, chunk, offset, path, name, overwrite=False):
+        self.uploaded_offsets.append(offset)
+        if offset in self.fail_offsets:
+            self.fail_offsets.remove(offset)
+            if not self.lose_response:
+                raise requests.ConnectionError('upload failed')
+            stored = self.files.setdefault(name, bytearray())
+            stored[offset:] = chunk
+            raise requests.ConnectionError('response lost')
+
+        stored = self.files.setdefault(name, bytearray())
+        # the hub truncates the file at offset
+        stored[offset:] = chunk
+        return {'size': len(chunk),
+                'hexdigest': '%08x' % (zlib.adler32(chunk) & 0xffffffff)}
+
+    def uploadWrapper(self, localfile, path, name=None, callback=None, blocksize=None):
+        pass
+
+    def checkUpload(self, path, name, verify=None):
+        if name not in self.files:
+            return None
+        data = bytes(self.files[name])
+        if verify == 'md5':
+            hexdigest = hashlib.md5(data).hexdigest()
+        else:
+            hexdigest = '%08x' % (zlib.adler32(data) & 0xffffffff)
+        return {'size': len(data), 'hexdigest': hexdigest}
+
+
+class TestUploadFile(object):
+    def write_file(self, tmpdir, size):
+        path = str(tmpdir.join('image.tar.gz'))
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        return path
+
+    @pytest.mark.parametrize('size', [0, 5, 10, 11])
+    def test_upload(self, tmpdir, size):
+        path = self.write_file(tmpdir, size)
+        session = MockedUploadSession()
+        callbacks = []
+        (flexmock.flexmock(session)
+            .should_receive('checkUpload')
+            .never())
+
+        assert upload_file(session, path, 'work/dir', name='spam.tar.gz', blocksize=5,
+                           callback=lambda *args: callbacks.append(args[:3])) == \
+            'work/dir/spam.tar.gz'
+
+        with open(path, 'rb') as f:
+            assert bytes(session.files['spam.tar.gz']) == f.read()
+        assert callbacks[0] == (0, size, 0)
+        assert callbacks[-1][0] == size
+
+    @pytest.mark.parametrize('lose_response', [False, True])
+    def test_resume(self, tmpdir, lose_response):
+        path = self.write_file(tmpdir, 23)
+        with open(path, 'rb') as f:
+            md5sum = hashlib.md5(f.read()).hexdigest()
+        session = MockedUploadSession(fail_offsets=[10], lose_response=lose_response)
+        flexmock.flexmock(time).should_receive('sleep')
+
+        upload_file(session, path, 'work/dir', blocksize=5,
+                    checksum=md5sum, checksum_type='md5')
+
+        with open(path, 'rb') as f:
+            assert bytes(session.files['image.tar.gz']) == f.read()
+        if lose_response:
+            # the chunk stored by the hub is not uploaded again
+            assert session.uploaded_offsets == [0, 5, 10, 15, 20]
+        else:
+            assert session.uploaded_offsets == [0, 5, 10, 10, 15, 20]
+
+    def test_restart_when_stored_data_differ(self, tmpdir):
+        path = self.write_file(tmpdir, 12)
+        with open(path, 'rb') as f:
+            adler32 = '%08x' % (zlib.adler32(f.read()) & 0xffffffff)
+        session = MockedUploadSession(fail_offsets=[10])
+        flexmock.flexmock(time).should_receive('sleep')
+        (flexmock.flexmock(session)
+            .should_receive('checkUpload')
+            .and_return({'size': 10, 'hexdigest': 'corrupted'})
+            .and_return({'size': 12, 'hexdigest': adler32}))
+
+        upload_file(session, path, 'work/dir', blocksize=5)
+
+        assert session.uploaded_offsets == [0, 5, 10, 0, 5, 10]
+
+    def test_too_many_failures(self, tmpdir):
+        path = self.write_file(tmpdir, 12)
+        session = MockedUploadSession(fail_offsets=[5] * (HTTP_MAX_RETRIES + 1))
+        flexmock.flexmock(time).should_receive('sleep')
+
+        with pytest.raises(requests.ConnectionError):
+            upload_file(session, path, 'work/dir', blocksize=5)
+
+    def test_checksum_mismatch(self, tmpdir):
+        path = self.write_file(tmpdir, 12)
+        session = MockedUploadSession(fail_offsets=[5])
+        flexmock.flexmock(time).should_receive('sleep')
+
+        with pytest.raises(koji.GenericError) as exc_info:
+            upload_file(session, path, 'work/dir', blocksize=5,
+                        checksum='0' * 32, checksum_type='md5')
+        assert 'md5 checksum of uploaded image.tar.gz does not match' in str(exc_info.value)
+
+    @pytest.mark.parametrize('blocksize', [None, 5])
+    def test_no_fast_upload(self, tmpdir, blocksize):
+        path = self.write_file(tmpdir, 12)
+        session = MockedUploadSession(use_fast_upload=False)
+        kwargs = {'blocksize': blocksize} if blocksize else {}
+        (flexmock.flexmock(session)
+            .should_receive('uploadWrapper')
+            .with_args(path, 'work/dir', name='spam.tar.gz', callback=None, **kwargs)
+            .once())
+
+        assert upload_file(session, path, 'work/dir', name='spam.tar.gz',
+                           blocksize=blocksize) == 'work/dir/spam.tar.gz'
+
+
+class TestUploadOutputs(object):
+    def make_outputs(self, tmpdir, sizes):
+        outputs = []
+        for i, size in enumerate(sizes):
+            path = str(tmpdir.join('file{}'.format(i)))
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+            outputs.append(Output(file=open(path, 'rb'),
+                                  metadata={'filename': 'file{}'.format(i)}))
+        # outputs without a file are skipped
+        outputs.append(Output(file=None, metadata={'filename': 'metadata.json'}))
+        return outputs
+
+    @pytest.mark.parametrize('max_workers', [1, 2, 4])
+    def test_upload_outputs(self, tmpdir, max_workers):
+        outputs = self.make_outputs(tmpdir, [10, 30, 20])
+        session = flexmock.flexmock()
+        # no more workers than files
+        workers = min(max_workers, 3)
+        subsessions = [flexmock.flexmock() for _ in range(workers - 1)]
+        expectation = session.should_receive('subsession').times(workers - 1)
+        for subsession in subsessions:
+            subsession.should_receive('logout').once()
+            expectation.and_return(subsession)
+
+        lock = threading.Lock()
+        started = []
+        used_sessions = set()
+
+        def upload(worker_session, output):
+            with lock:
+                started.append(output.metadata['filename'])
+                used_sessions.add(id(worker_session))
+            return output.metadata['filename'] + ' uploaded'
+
+        results = upload_outputs(session, outputs, upload, max_workers=max_workers)
+
+        assert results == ['file0 uploaded', 'file1 uploaded', 'file2 uploaded']
+        assert len(used_sessions) <= workers
+        if workers == 1:
+            assert started == ['file0', 'file1', 'file2']
+        else:
+            # largest files first
+            assert started[0] == 'file1'
+
+    def test_upload_outputs_error(self, tmpdir):
+        outputs = self.make_outputs(tmpdir, [10, 30, 20])
+        session = flexmock.flexmock()
+        subsession = flexmock.flexmock()
+        subsession.should_receive('logout').once()
+        session.should_receive('subsession').and_return(subsession).once()
+        uploaded = []
+
+        def upload(worker_session, output):
+            if output.metadata['filename'] != 'file2':
+                raise koji.GenericError(output.metadata['filename'])
+            uploaded.append(output.metadata['filename'])
+
+        with pytest.raises(koji.GenericError) as exc_info:
+            upload_outputs(session, outputs, upload, max_workers=2)
+
+        # failure of one file does not interrupt the others
+        assert uploaded == ['file2']
+        assert str(exc_info.value) == 'file0'
+
+
+class TestGetOutputMetadata(object):
+    @pytest.mark.parametrize('checksums, expected_md5', [
+        (None, '900150983cd24fb0d6963f7d28e17f72'),
+        ({'sha256sum': 'sha256'}, '900150983cd24fb0d6963f7d28e17f72'),
+        ({'md5sum': 'known'}, 'known'),
+    ])
+    def test_get_output_metadata(self, tmpdir, checksums, expected_md5):
+        path = str(tmpdir.join('image.tar.gz'))
+        with open(path, 'wb') as f:
+            f.write(b'abc')
+
+        metadata = get_output_metadata(path, 'docker-image.tar.gz', checksums=checksums)
+        assert metadata == {
+            'filename': 'docker-image.tar.gz',
+            'filesize': 3,
+            'checksum': expected_md5,
+            'checksum_type': 'md5',
+        }
+
+
 class TestGetKojiModuleBuild(object):
     def mock_get_rpms(self, session):
         (session
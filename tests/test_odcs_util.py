@@ -181,6 +181,93 @@ def test_wait_for_compose(odcs_client, final_state_id, final_state_name, expect_
         odcs_client.wait_for_compose(COMPOSE_ID)
 
 
+def mock_composes_get(odcs_client, states):
+    """
+    Serve compose states from lists, one item per request
+
+    :return: dict, compose ID mapped to number of requests for it
+    """
+    requests_count = {}
+
+    def handle_composes_get(request):
+        assert_request_token(request, odcs_client.session)
+        compose_id = int(request.url.rstrip('/').split('/')[-1])
+        count = requests_count.get(compose_id, 0)
+        requests_count[compose_id] = count + 1
+
+        state_id, state_name = states[compose_id][count]
+        return (200, {}, compose_json(state_id, state_name, compose_id=compose_id))
+
+    for compose_id in states:
+        responses.add_callback(responses.GET, '{}composes/{}'.format(ODCS_URL, compose_id),
+                               content_type='application/json',
+                               callback=handle_composes_get)
+
+    return requests_count
+
+
+@responses.activate
+def test_wait_for_composes(odcs_client):
+    states = {
+        COMPOSE_ID: [(1, 'generating'), (2, 'done')],
+        COMPOSE_ID + 1: [(2, 'done')],
+        COMPOSE_ID + 2: [(0, 'wait'), (1, 'generating'), (2, 'done')],
+    }
+    requests_count = mock_composes_get(odcs_client, states)
+
+    sleeps = []
+    (flexmock.flexmock(time)
+        .should_receive('sleep')
+        .replace_with(sleeps.append))
+
+    compose_ids = [COMPOSE_ID, COMPOSE_ID + 1, COMPOSE_ID + 2, COMPOSE_ID]
+    composes, wait_times = odcs_client.wait_for_composes(compose_ids)
+
+    assert sorted(composes) == sorted(states)
+    assert all(compose['state_name'] == 'done' for compose in composes.values())
+    assert sorted(wait_times) == sorted(states)
+    assert all(wait_time >= 0 for wait_time in wait_times.values())
+    # all composes are polled in one loop, finished ones are not polled again
+    assert sleeps == [1, 1]
+    assert requests_count == {compose_id: len(states[compose_id]) for compose_id in states}
+
+
+@responses.activate
+def test_wait_for_composes_failed(odcs_client):
+    states = {
+        COMPOSE_ID: [(1, 'generating'), (4, 'failed')],
+        COMPOSE_ID + 1: [(1, 'generating')] * 3,
+    }
+    requests_count = mock_composes_get(odcs_client, states)
+    (flexmock.flexmock(time)
+        .should_receive('sleep')
+        .and_return(None))
+
+    with pytest.raises(RuntimeError) as exc_info:
+        odcs_client.wait_for_composes([COMPOSE_ID, COMPOSE_ID + 1])
+    assert 'Failed request for compose_id={}'.format(COMPOSE_ID) in str(exc_info.value)
+    # the failure is reported without waiting for the other compose
+    assert requests_count == {COMPOSE_ID: 2, COMPOSE_ID + 1: 1}
+
+
+@responses.activate
+def test_wait_for_composes_timeout(odcs_client):
+    states = {COMPOSE_ID: [(1, 'generating')] * 2}
+    mock_composes_get(odcs_client, states)
+    (flexmock.flexmock(time)
+        .should_receive('sleep')
+        .and_return(None))
+    (flexmock.flexmock(time)
+        .should_receive('time')
+        .and_return(0)
+        .and_return(0)
+        .and_return(10))
+
+    with pytest.raises(RuntimeError) as exc_info:
+        odcs_client.wait_for_composes([COMPOSE_ID], timeout=5)
+    assert 'timed out after 5 seconds' in str(exc_info.value)
+
+
 @responses.activate
 def test_renew_compose(odcs_client):
     new_compose_id = COMPOSE_ID + 1
@@ -10,7 +10,9 @@ from __future__ import unicode_literals, absolute_import
 
 import json
 import os
+import signal
 import time
+import threading
 import inspect
 
 from dockerfile_parse import DockerfileParser
@@ -25,8 +27,10 @@ from atomic_reactor.plugin import (BuildPluginsRunner, PreBuildPluginsRunner,
                                    ExitPluginsRunner, BuildStepPluginsRunner,
                                    PluginsRunner, InappropriateBuildStepError,
                                    BuildStepPlugin, PreBuildPlugin, ExitPlugin,
-                                   PreBuildSleepPlugin, PrePublishPlugin, PostBuildPlugin)
+                                   PreBuildSleepPlugin, PrePublishPlugin, PostBuildPlugin,
+                                   BuildCanceledException)
 from atomic_reactor.plugins.pre_add_yum_repo_by_url import AddYumRepoByUrlPlugin
+from atomic_reactor.profiling import PluginProfiler
 from atomic_reactor.util import ImageName
 
 from tests.constants import DOCKERFILE_GIT, MOCK
@@ -85,20 +89,25 @@ def mock_workflow(tmpdir):
     return workflow
 
 
-@pytest.mark.parametrize('runner_type', [  # noqa
-    PreBuildPluginsRunner,
-    PrePublishPluginsRunner,
-    PostBuildPluginsRunner,
-    ExitPluginsRunner,
-    BuildStepPluginsRunner,
+@pytest.mark.parametrize(('runner_type', 'plugin_key'), [  # noqa
+    (PreBuildPluginsRunner, 'add_help'),
+    (PrePublishPluginsRunner, 'squash'),
+    (PostBuildPluginsRunner, 'tag_and_push'),
+    (ExitPluginsRunner, 'store_logs_to_file'),
+    (BuildStepPluginsRunner, 'docker_api'),
 ])
-def test_load_plugins(docker_tasker, runner_type, tmpdir):
+def test_load_plugins(docker_tasker, runner_type, plugin_key, tmpdir):
     """
     test loading plugins
     """
-    runner = runner_type(docker_tasker, mock_workflow(tmpdir), None)
-    assert runner.plugin_classes is not None
-    assert len(runner.plugin_classes) > 0
+    runner = runner_type(docker_tasker, mock_workflow(tmpdir), [{'name': plugin_key}])
+    assert plugin_key in runner.plugin_classes
+    assert [plugin.name for plugin in runner.available_plugins] == [plugin_key]
+
+
+def test_load_plugins_none_requested(docker_tasker, tmpdir):
+    runner = PreBuildPluginsRunner(docker_tasker, mock_workflow(tmpdir), None)
+    assert runner.plugin_classes == {}
 
 
 class X(object):
@@ -321,6 +330,295 @@ def test_no_appropriate_buildstep_build_plugin(caplog, tmpdir, docker_tasker):
         runner.run()
 
 
+class MyFailingPreBuildPlugin(PreBuildPlugin):
+    key = 'MyFailingPreBuildPlugin'
+    is_allowed_to_fail = True
+
+    def run(self):
+        raise RuntimeError('failed')
+
+
+@pytest.mark.parametrize('profile_dir', [None, 'profiles'])
+def test_profile_plugins(tmpdir, docker_tasker, profile_dir):
+    workflow = mock_workflow(tmpdir)
+    if profile_dir:
+        profile_dir = os.path.join(str(tmpdir), profile_dir)
+    flexmock(PluginsRunner, load_plugins=lambda x: {
+                                        MyPreBuildPlugin.key: MyPreBuildPlugin,
+                                        MyFailingPreBuildPlugin.key: MyFailingPreBuildPlugin})
+    flexmock(MyPreBuildPlugin).should_receive('run').and_return(None)
+    runner = PreBuildPluginsRunner(docker_tasker, workflow,
+                                   [{"name": MyPreBuildPlugin.key},
+                                    {"name": MyFailingPreBuildPlugin.key}],
+                                   profile=not profile_dir, profile_dir=profile_dir)
+    runner.run()
+
+    # failed plugins are profiled too
+    assert set(workflow.plugins_resources) == {MyPreBuildPlugin.key,
+                                               MyFailingPreBuildPlugin.key}
+    for key, resources in workflow.plugins_resources.items():
+        assert resources['cpu_user'] >= 0
+        assert resources['cpu_system'] >= 0
+        assert resources['http_requests'] == 0
+        if profile_dir:
+            assert resources['profile'] == os.path.join(profile_dir, '{}.prof'.format(key))
+            assert os.path.exists(resources['profile'])
+        else:
+            assert 'profile' not in resources
+
+
+def test_profile_plugins_disabled(tmpdir, docker_tasker):
+    workflow = mock_workflow(tmpdir)
+    flexmock(PluginsRunner, load_plugins=lambda x: {MyPreBuildPlugin.key: MyPreBuildPlugin})
+    flexmock(MyPreBuildPlugin).should_receive('run').and_return(None)
+    flexmock(PluginProfiler).should_receive('__init__').never()
+    runner = PreBuildPluginsRunner(docker_tasker, workflow, [{"name": MyPreBuildPlugin.key}])
+    runner.run()
+
+    assert workflow.plugins_resources == {}
+
+
+def make_declared_plugin(key, reads=(), writes=(), run=None, is_allowed_to_fail=True):
+    def default_run(self):
+        return key
+
+    return type(str(key), (PreBuildPlugin,), {
+        'key': key,
+        'reads': reads,
+        'writes': writes,
+        'is_allowed_to_fail': is_allowed_to_fail,
+        'run': run or default_run,
+    })
+
+
+def make_runner(docker_tasker, workflow, plugins, **kwargs):
+    flexmock(PluginsRunner, load_plugins=lambda x: {p.key: p for p in plugins})
+    return PreBuildPluginsRunner(docker_tasker, workflow,
+                                 [{"name": p.key} for p in plugins], **kwargs)
+
+
+@pytest.mark.parametrize(('declarations', 'expected'), [
+    # independent plugins
+    ([((), ()), ((), ()), ((), ('spam',))],
+     [set(), set(), set()]),
+    # plugin results
+    ([((), ()), (('plugin0',), ())],
+     [set(), {0}]),
+    # read after write, write after read, write after write
+    ([((), ('spam',)), (('spam',), ()), ((), ('spam',))],
+     [set(), {0}, {0, 1}]),
+    # undeclared plugins
+    ([((), ()), (None, None), ((), ()), ((), ())],
+     [set(), {0}, {1}, {1}]),
+    ([(None, ('spam',)), (('spam',), None)],
+     [set(), {0}]),
+])
+def test_get_plugin_dependencies(tmpdir, docker_tasker, declarations, expected):
+    plugins = [make_declared_plugin('plugin{}'.format(index), reads=reads, writes=writes)
+               for index, (reads, writes) in enumerate(declarations)]
+    runner = make_runner(docker_tasker, mock_workflow(tmpdir), plugins)
+
+    assert runner.get_plugin_dependencies(runner.available_plugins) == expected
+
+
+def test_concurrent_plugins(tmpdir, docker_tasker):
+    workflow = mock_workflow(tmpdir)
+    started = threading.Event()
+    threads = {}
+
+    def wait_run(self):
+        threads[self.key] = threading.current_thread()
+        # only succeeds if the next plugin is running at the same time
+        assert started.wait(10)
+        return 'waited'
+
+    def notify_run(self):
+        threads[self.key] = threading.current_thread()
+        started.set()
+        return 'notified'
+
+    def barrier_run(self):
+        threads[self.key] = threading.current_thread()
+        return self.workflow.prebuild_results.copy()
+
+    plugins = [
+        make_declared_plugin('wait', run=wait_run),
+        make_declared_plugin('notify', run=notify_run),
+        make_declared_plugin('barrier', reads=None, writes=None, run=barrier_run),
+    ]
+    runner = make_runner(docker_tasker, workflow, plugins, max_workers=2)
+    results = runner.run()
+
+    assert list(results.keys()) == ['wait', 'notify', 'barrier']
+    assert results['barrier'] == {'wait': 'waited', 'notify': 'notified'}
+    assert threads['wait'] != threads['notify']
+    # undeclared plugins run in the calling thread
+    assert threads['barrier'] == threading.current_thread()
+    assert set(workflow.plugins_timestamps) == {'wait', 'notify', 'barrier'}
+    assert set(workflow.plugins_durations) == {'wait', 'notify', 'barrier'}
+
+
+def test_concurrent_plugins_dependency(tmpdir, docker_tasker):
+    workflow = mock_workflow(tmpdir)
+
+    def slow_run(self):
+        time.sleep(0.1)
+        return 'slow'
+
+    def consumer_run(self):
+        return self.workflow.prebuild_results['slow']
+
+    plugins = [
+        make_declared_plugin('slow', run=slow_run),
+        make_declared_plugin('consumer', reads=('slow',), run=consumer_run),
+    ]
+    runner = make_runner(docker_tasker, workflow, plugins, max_workers=2)
+
+    assert runner.run() == {'slow': 'slow', 'consumer': 'slow'}
+
+
+@pytest.mark.parametrize('max_workers', [1, 3])
+@pytest.mark.parametrize('keep_going', [True, False])
+def test_concurrent_plugins_failure(tmpdir, docker_tasker, max_workers, keep_going):
+    workflow = mock_workflow(tmpdir)
+
+    def failing_run(self):
+        raise RuntimeError('{} failed'.format(self.key))
+
+    def consumer_run(self):
+        return 'consumed'
+
+    plugins = [
+        make_declared_plugin('allowed', run=failing_run),
+        make_declared_plugin('fatal', run=failing_run, is_allowed_to_fail=False),
+        make_declared_plugin('independent'),
+        make_declared_plugin('consumer', reads=('fatal',), run=consumer_run),
+    ]
+    runner = make_runner(docker_tasker, workflow, plugins, max_workers=max_workers)
+
+    with pytest.raises(PluginFailedException) as exc:
+        runner.run(keep_going=keep_going)
+
+    assert "plugin 'fatal' raised an exception: RuntimeError: fatal failed" in str(exc.value)
+    assert isinstance(workflow.prebuild_results['allowed'], RuntimeError)
+    assert workflow.plugins_errors == {'fatal': 'fatal failed'}
+    if keep_going:
+        assert isinstance(workflow.prebuild_results['fatal'], RuntimeError)
+        assert workflow.prebuild_results['independent'] == 'independent'
+        assert workflow.prebuild_results['consumer'] == 'consumed'
+    else:
+        assert 'fatal' not in workflow.prebuild_results
+        assert 'consumer' not in workflow.prebuild_results
+        if max_workers > 1:
+            # started together with the failing plugin, allowed to finish
+            assert workflow.prebuild_results['independent'] == 'independent'
+        else:
+            assert 'independent' not in workflow.prebuild_results
+
+
+def test_concurrent_plugins_keeps_configured_failure(tmpdir, docker_tasker):
+    workflow = mock_workflow(tmpdir)
+    second_failed = threading.Event()
+
+    def first_run(self):
+        assert second_failed.wait(10)
+        raise RuntimeError('first failed')
+
+    def second_run(self):
+        second_failed.set()
+        raise RuntimeError('second failed')
+
+    plugins = [
+        make_declared_plugin('first', run=first_run, is_allowed_to_fail=False),
+        make_declared_plugin('second', run=second_run, is_allowed_to_fail=False),
+    ]
+    runner = make_runner(docker_tasker, workflow, plugins, max_workers=2)
+
+    with pytest.raises(PluginFailedException) as exc:
+        runner.run()
+
+    # the failure of the plugin configured first is reported
+    assert "plugin 'first' raised an exception" in str(exc.value)
+    assert set(workflow.plugins_errors) == {'first', 'second'}
+
+
+def test_concurrent_plugins_disabled_by_default(tmpdir, docker_tasker):
+    workflow = mock_workflow(tmpdir)
+    runner = make_runner(docker_tasker, workflow, [make_declared_plugin('spam')])
+    assert runner.max_workers == 1
+
+
+def test_concurrent_plugins_single_ready_inline(tmpdir, docker_tasker):
+    workflow = mock_workflow(tmpdir)
+    threads = {}
+
+    def record_run(self):
+        threads[self.key] = threading.current_thread()
+
+    plugins = [
+        make_declared_plugin('first', run=record_run),
+        make_declared_plugin('second', reads=('first',), run=record_run),
+    ]
+    runner = make_runner(docker_tasker, workflow, plugins, max_workers=2)
+    runner.run()
+
+    # nothing could run at the same time, no need for threads
+    assert threads == {'first': threading.current_thread(),
+                       'second': threading.current_thread()}
+
+
+@pytest.mark.parametrize('profile_dir', [None, 'profiles'])
+def test_concurrent_plugins_profiled(tmpdir, docker_tasker, profile_dir):
+    if profile_dir:
+        profile_dir = os.path.join(str(tmpdir), profile_dir)
+    workflow = mock_workflow(tmpdir)
+    threads = {}
+
+    def record_run(self):
+        threads[self.key] = threading.current_thread()
+
+    plugins = [make_declared_plugin(key, run=record_run) for key in ('first', 'second')]
+    runner = make_runner(docker_tasker, workflow, plugins, max_workers=2,
+                         profile=not profile_dir, profile_dir=profile_dir)
+    runner.run()
+
+    # profiles of plugins running at the same time would include each other
+    assert threads == {'first': threading.current_thread(),
+                       'second': threading.current_thread()}
+    assert set(workflow.plugins_resources) == {'first', 'second'}
+
+
+def test_concurrent_plugins_canceled(tmpdir, docker_tasker):
+    workflow = mock_workflow(tmpdir)
+    release = threading.Event()
+
+    def blocking_run(self):
+        release.wait(30)
+
+    def cancel(*args):
+        raise BuildCanceledException('Build was canceled')
+
+    plugins = [
+        make_declared_plugin('spam', run=blocking_run),
+        make_declared_plugin('bacon', run=blocking_run),
+    ]
+    runner = make_runner(docker_tasker, workflow, plugins, max_workers=2)
+
+    original_handler = signal.signal(signal.SIGALRM, cancel)
+    try:
+        signal.setitimer(signal.ITIMER_REAL, 0.5)
+        start = time.time()
+        with pytest.raises(BuildCanceledException):
+            runner.run()
+        # running plugins are not waited for
+        assert time.time() - start < 10
+        assert not release.is_set()
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, original_handler)
+        release.set()
+
+
 @pytest.mark.parametrize('pluginconf_method, default_method, source_method, expected', [  # noqa
     ('orchestrator', 'docker_api',   None,           'orchestrator'),
     ('orchestrator', 'docker_api',   'imagebuilder', 'orchestrator'),
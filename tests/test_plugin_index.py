@@ -0,0 +1,187 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals, absolute_import
+
+import json
+import os
+import subprocess
+import sys
+from textwrap import dedent
+
+import pytest
+from flexmock import flexmock
+
+import atomic_reactor
+from atomic_reactor import plugin_index as plugin_index_module
+from atomic_reactor.constants import PLUGIN_KOJI_PARENT_KEY
+from atomic_reactor.plugin_index import PluginIndex, get_plugin_keys
+
+PLUGINS_DIR = os.path.join(os.path.dirname(atomic_reactor.__file__), 'plugins')
+
+
+def write_module(tmpdir, name, content):
+    path = os.path.join(str(tmpdir), name)
+    with open(path, 'w') as f:
+        f.write(dedent(content))
+    return path
+
+
+@pytest.mark.parametrize(('content', 'expected'), [
+    ("""\
+     class SpamPlugin(object):
+         key = 'spam'
+     """, ['spam']),
+    ("""\
+     from atomic_reactor.constants import PLUGIN_KOJI_PARENT_KEY as KEY
+     class SpamPlugin(object):
+         key = KEY
+     """, [PLUGIN_KOJI_PARENT_KEY]),
+    ("""\
+     SPAM_KEY = 'spam'
+     class SpamPlugin(object):
+         key = SPAM_KEY
+     class BaconPlugin(SpamPlugin):
+         key = SpamPlugin.key
+     class EggsPlugin(object):
+         key = "eggs"
+     class NotAPlugin(object):
+         pass
+     """, ['eggs', 'spam']),
+    ("""\
+     def helper():
+         key = 'not a plugin'
+     """, []),
+    # can't be determined without importing the module
+    ("""\
+     from somewhere import SPAM_KEY
+     class SpamPlugin(object):
+         key = SPAM_KEY
+     """, None),
+    ("""\
+     class SpamPlugin(object):
+         key = 'spam'.upper()
+     """, None),
+])
+def test_get_plugin_keys(tmpdir, content, expected):
+    assert get_plugin_keys(write_module(tmpdir, 'spam.py', content)) == expected
+
+
+def test_all_plugins_indexed():
+    for name in os.listdir(PLUGINS_DIR):
+        if name.endswith('.py') and name != '__init__.py':
+            assert get_plugin_keys(os.path.join(PLUGINS_DIR, name)), name
+
+
+def test_select_modules(tmpdir):
+    spam = write_module(tmpdir, 'spam.py', "class Spam(object):\n    key = 'spam'\n")
+    bacon = write_module(tmpdir, 'bacon.py', "class Bacon(object):\n    key = 'bacon'\n")
+    unknown = write_module(tmpdir, 'unknown.py', "class Eggs(object):\n    key = KEY\n")
+    broken = write_module(tmpdir, 'broken.py', "class Eggs(object:\n")
+    missing = os.path.join(str(tmpdir), 'missing.py')
+    files = [spam, bacon, unknown, broken, missing]
+
+    index = PluginIndex()
+    assert index.select_modules(files, ['bacon']) == [bacon, unknown, broken, missing]
+    assert index.select_modules(files, ['spam', 'bacon']) == files
+    assert index.select_modules(files, []) == [unknown, broken, missing]
+
+
+def test_select_modules_cached(tmpdir):
+    path = write_module(tmpdir, 'spam.py', "class Spam(object):\n    key = 'spam'\n")
+    index_path = os.path.join(str(tmpdir), 'cache', 'index.json')
+
+    index = PluginIndex(index_path)
+    assert index.select_modules([path], ['spam']) == [path]
+    with open(index_path) as f:
+        assert json.load(f)['modules'][path]['keys'] == ['spam']
+
+    # e.g. another process
+    (flexmock(plugin_index_module)
+        .should_receive('get_plugin_keys')
+        .never())
+    assert PluginIndex(index_path).select_modules([path], ['spam']) == [path]
+    assert PluginIndex(index_path).select_modules([path], ['bacon']) == []
+
+
+def test_select_modules_invalidated(tmpdir):
+    path = write_module(tmpdir, 'spam.py', "class Spam(object):\n    key = 'spam'\n")
+    index = PluginIndex(os.path.join(str(tmpdir), 'index.json'))
+    assert index.select_modules([path], ['spam']) == [path]
+
+    write_module(tmpdir, 'spam.py', "class Spam(object):\n    key = 'bacon'\n")
+    st = os.stat(path)
+    os.utime(path, (st.st_atime, st.st_mtime + 10))
+
+    assert index.select_modules([path], ['spam']) == []
+    assert index.select_modules([path], ['bacon']) == [path]
+
+
+@pytest.mark.parametrize('content', [
+    '{',
+    '{"version": 0, "modules": {}}',
+])
+def test_select_modules_invalid_index(tmpdir, content):
+    path = write_module(tmpdir, 'spam.py', "class Spam(object):\n    key = 'spam'\n")
+    index_path = os.path.join(str(tmpdir), 'index.json')
+    with open(index_path, 'w') as f:
+        f.write(content)
+
+    assert PluginIndex(index_path).select_modules([path], ['spam']) == [path]
+    with open(index_path) as f:
+        assert json.load(f)['modules'][path]['keys'] == ['spam']
+
+
+def test_select_modules_index_not_writable(tmpdir):
+    path = write_module(tmpdir, 'spam.py', "class Spam(object):\n    key = 'spam'\n")
+    # parent of the index is a file
+    index = PluginIndex(os.path.join(path, 'index.json'))
+    assert index.select_modules([path], ['spam']) == [path]
+
+
+LOAD_PLUGINS_SCRIPT = """
+import sys
+
+from atomic_reactor.plugin import PluginsRunner
+
+runner = PluginsRunner('PreBuildPlugin', {conf})
+if {load_all}:
+    # pretend plugins_conf is not known yet, as for the "auto" input plugin
+    del runner.plugins_conf
+    runner.load_plugins('PreBuildPlugin')
+
+print(' '.join(sorted(name for name in sys.modules
+                      if name.startswith(('pre_', 'post_', 'exit_', 'build_', 'prepub_')))))
+print('koji' in sys.modules)
+"""
+
+
+def load_plugins_in_subprocess(tmpdir, conf, load_all=False):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(sys.path)
+    env['ATOMIC_REACTOR_PLUGIN_INDEX'] = os.path.join(str(tmpdir), 'index.json')
+    script = LOAD_PLUGINS_SCRIPT.format(conf=conf, load_all=load_all)
+    output = subprocess.check_output([sys.executable, '-c', script], env=env)
+    modules, koji_imported = output.decode('utf-8').splitlines()
+    return modules.split(), koji_imported == 'True'
+
+
+def test_lazy_load_plugins(tmpdir):
+    """
+    Guard against loading plugins not requested by the build
+    """
+    conf = [{'name': 'add_labels_in_dockerfile'}]
+    # first run creates the index
+    load_plugins_in_subprocess(tmpdir, conf)
+    modules, koji_imported = load_plugins_in_subprocess(tmpdir, conf)
+
+    assert modules == ['pre_add_labels_in_df']
+    assert not koji_imported
+
+    modules, _ = load_plugins_in_subprocess(tmpdir, None, load_all=True)
+    assert len(modules) > 1
@@ -0,0 +1,115 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals, absolute_import
+
+import os
+import pstats
+
+import pytest
+import requests
+from flexmock import flexmock
+
+from atomic_reactor import profiling
+from atomic_reactor.profiling import PluginProfiler, read_proc_io
+from atomic_reactor.util import http_stats
+
+
+PROC_IO = """\
+rchar: 1000
+wchar: 2000
+syscr: 10
+syscw: 20
+read_bytes: 4096
+write_bytes: 8192
+cancelled_write_bytes: 0
+"""
+
+
+def test_read_proc_io(tmpdir):
+    path = os.path.join(str(tmpdir), 'io')
+    with open(path, 'w') as f:
+        f.write(PROC_IO)
+
+    counters = read_proc_io(path)
+    assert counters['read_bytes'] == 4096
+    assert counters['write_bytes'] == 8192
+    assert counters['rchar'] == 1000
+
+
+def test_read_proc_io_missing(tmpdir):
+    assert read_proc_io(os.path.join(str(tmpdir), 'io')) == {}
+
+
+def make_response(headers):
+    response = requests.Response()
+    response.headers = headers
+    return response
+
+
+@pytest.mark.parametrize('proc_io', [True, False])
+def test_plugin_profiler(proc_io):
+    io_counters = [{'read_bytes': 100, 'write_bytes': 200},
+                   {'read_bytes': 150, 'write_bytes': 1200}]
+    if not proc_io:
+        io_counters = [{}, {}]
+    (flexmock(profiling)
+        .should_receive('read_proc_io')
+        .and_return(io_counters[0])
+        .and_return(io_counters[1]))
+
+    with PluginProfiler('spam') as profiler:
+        data = [b'x' * 1024 for _ in range(1024)]
+        http_stats.count_response(make_response({'Content-Length': '123'}))
+        http_stats.count_response(make_response({}))
+        http_stats.count_response(make_response({'Content-Length': 'invalid'}))
+    del data
+
+    resources = profiler.resources
+    assert resources['cpu_user'] >= 0
+    assert resources['cpu_system'] >= 0
+    assert resources['max_rss_delta'] >= 0
+    assert resources['http_requests'] == 3
+    assert resources['http_bytes'] == 123
+    if proc_io:
+        assert resources['io_read_bytes'] == 50
+        assert resources['io_write_bytes'] == 1000
+    else:
+        assert resources['io_read_bytes'] is None
+        assert resources['io_write_bytes'] is None
+    assert 'profile' not in resources
+
+
+def test_plugin_profiler_cprofile(tmpdir):
+    profile_dir = os.path.join(str(tmpdir), 'profiles')
+
+    def profiled_function():
+        return sum(range(100))
+
+    with pytest.raises(RuntimeError):
+        with PluginProfiler('spam', profile_dir=profile_dir) as profiler:
+            profiled_function()
+            raise RuntimeError('plugin failed')
+
+    path = os.path.join(profile_dir, 'spam.prof')
+    assert profiler.resources['profile'] == path
+    stats = pstats.Stats(path)
+    assert any(func[2] == 'profiled_function' for func in stats.stats)
+
+
+def test_plugin_profiler_cprofile_error(tmpdir, caplog):
+    path = os.path.join(str(tmpdir), 'file')
+    with open(path, 'w'):
+        pass
+
+    # profile_dir can't be created
+    with PluginProfiler('spam', profile_dir=os.path.join(path, 'dir')) as profiler:
+        pass
+
+    assert 'profile' not in profiler.resources
+    assert "failed to store profile of plugin 'spam'" in caplog.text
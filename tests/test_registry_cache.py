@@ -0,0 +1,172 @@
+"""
+Copyright (c) 2019 Red Hat, Inc
+All rights reserved.
+
+This software may be modified and distributed under the terms
+of the BSD license. See the LICENSE file for details.
+"""
+
+from __future__ import unicode_literals, absolute_import
+
+import json
+import os
+import time
+
+import pytest
+import requests
+from flexmock import flexmock
+
+from atomic_reactor.registry_cache import RegistryCache, is_digest
+
+DIGEST = 'sha256:' + 'a' * 64
+
+
+def make_response(content, headers=None):
+    response = requests.Response()
+    response.url = 'https://registry.example.com/v2/spam/manifests/latest'
+    response.status_code = 200
+    response.headers = headers or {'Content-Type': 'application/json'}
+    response._content = content
+    return response
+
+
+def make_key(reference):
+    return RegistryCache.make_key('registry.example.com',
+                                  '/v2/spam/manifests/{}'.format(reference),
+                                  media_type='application/json')
+
+
+@pytest.mark.parametrize(('reference', 'expected'), [
+    ('latest', False),
+    (DIGEST, True),
+])
+def test_is_digest(reference, expected):
+    assert is_digest(reference) is expected
+
+
+@pytest.mark.parametrize('reference', ['latest', DIGEST])
+def test_get_set(reference):
+    cache = RegistryCache()
+    key = make_key(reference)
+    assert cache.get(key, reference) is None
+
+    cache.set(key, reference, make_response(b'{"spam": "bacon"}'))
+    response = cache.get(key, reference)
+    assert response.json() == {'spam': 'bacon'}
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'application/json'
+    assert response.url == 'https://registry.example.com/v2/spam/manifests/latest'
+
+    assert cache.get(make_key('other'), 'other') is None
+    assert cache.get_stats() == {'hits': 1, 'misses': 2, 'entries': 1}
+
+    cache.clear()
+    assert cache.get_stats() == {'hits': 0, 'misses': 0, 'entries': 0}
+    assert cache.get(key, reference) is None
+
+
+def test_tag_ttl():
+    now = time.time()
+    flexmock(time).should_receive('time').and_return(now)
+
+    cache = RegistryCache(tag_ttl=10)
+    cache.set(make_key('latest'), 'latest', make_response(b'{}'))
+    cache.set(make_key(DIGEST), DIGEST, make_response(b'{}'))
+
+    flexmock(time).should_receive('time').and_return(now + 9)
+    assert cache.get(make_key('latest'), 'latest') is not None
+
+    flexmock(time).should_receive('time').and_return(now + 10)
+    assert cache.get(make_key('latest'), 'latest') is None
+    # digests never expire
+    assert cache.get(make_key(DIGEST), DIGEST) is not None
+
+
+def test_tag_ttl_disabled():
+    cache = RegistryCache(tag_ttl=0)
+    cache.set(make_key('latest'), 'latest', make_response(b'{}'))
+    assert cache.get(make_key('latest'), 'latest') is None
+
+
+def test_lru():
+    cache = RegistryCache(max_entries=2)
+    for tag in ('1', '2'):
+        cache.set(make_key(tag), tag, make_response(b'{}'))
+
+    # '1' is now the most recently used
+    assert cache.get(make_key('1'), '1') is not None
+    cache.set(make_key('3'), '3', make_response(b'{}'))
+
+    assert cache.get(make_key('1'), '1') is not None
+    assert cache.get(make_key('2'), '2') is None
+    assert cache.get(make_key('3'), '3') is not None
+
+    cache.configure(max_entries=1)
+    assert cache.get_stats()['entries'] == 1
+
+
+def test_cache_dir(tmpdir):
+    cache_dir = os.path.join(str(tmpdir), 'cache')
+    cache = RegistryCache(cache_dir=cache_dir)
+    assert os.path.isdir(cache_dir)
+
+    cache.set(make_key(DIGEST), DIGEST, make_response(b'\x00binary'))
+    cache.set(make_key('latest'), 'latest', make_response(b'{}'))
+    # only digests are stored on disk
+    assert len(os.listdir(cache_dir)) == 1
+
+    # e.g. another process using the same directory
+    other = RegistryCache(cache_dir=cache_dir)
+    response = other.get(make_key(DIGEST), DIGEST)
+    assert response.content == b'\x00binary'
+    assert other.get(make_key('latest'), 'latest') is None
+    assert other.get_stats() == {'hits': 1, 'misses': 1, 'entries': 1}
+
+
+def test_cache_dir_corrupted(tmpdir, caplog):
+    cache = RegistryCache(cache_dir=str(tmpdir))
+    cache.set(make_key(DIGEST), DIGEST, make_response(b'{}'))
+
+    for name in os.listdir(str(tmpdir)):
+        with open(os.path.join(str(tmpdir), name), 'w') as f:
+            f.write('{')
+
+    other = RegistryCache(cache_dir=str(tmpdir))
+    assert other.get(make_key(DIGEST), DIGEST) is None
+    assert 'ignoring corrupted registry cache entry' in caplog.text
+
+    # corrupted entries are replaced
+    other.set(make_key(DIGEST), DIGEST, make_response(b'{"spam": "bacon"}'))
+    entries = [os.path.join(str(tmpdir), name) for name in os.listdir(str(tmpdir))]
+    assert len(entries) == 1
+    with open(entries[0]) as f:
+        assert json.load(f)['status_code'] == 200
+
+
+def test_auth():
+    cache = RegistryCache()
+    url = '/v2/spam/manifests/latest'
+    key = RegistryCache.make_key('registry.example.com', url, auth='pull-only')
+    cache.set(key, 'latest', make_response(b'{}'))
+
+    assert cache.get(key, 'latest') is not None
+    other = RegistryCache.make_key('registry.example.com', url, auth='pull-push')
+    assert cache.get(other, 'latest') is None
+
+
+def test_invalidate_tags(tmpdir):
+    cache = RegistryCache(cache_dir=str(tmpdir))
+    other_repo = RegistryCache.make_key('registry.example.com', '/v2/spam/bacon/manifests/latest')
+    other_registry = RegistryCache.make_key('other.example.com', '/v2/spam/manifests/latest')
+    for key, reference in [(make_key('latest'), 'latest'),
+                           (make_key(DIGEST), DIGEST),
+                           (other_repo, 'latest'),
+                           (other_registry, 'latest')]:
+        cache.set(key, reference, make_response(b'{}'))
+
+    cache.invalidate_tags('registry.example.com', 'spam')
+    assert cache.get(make_key('latest'), 'latest') is None
+    # digests never change
+    assert cache.get(make_key(DIGEST), DIGEST) is not None
+    assert cache.get(other_repo, 'latest') is not None
+    assert cache.get(other_registry, 'latest') is not None
@@ -8,9 +8,19 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import absolute_import, print_function
 
+import io
+import json
+import os
+import tarfile
+
 import pytest
+import rpm
+from flexmock import flexmock
 
-from atomic_reactor.rpm_util import rpm_qf_args, parse_rpm_output
+from atomic_reactor import rpm_util
+from atomic_reactor.compress_util import ParallelCompressedFile, open_decompressed
+from atomic_reactor.rpm_util import (rpm_qf_args, parse_rpm_output, iter_rpm_output,
+                                     get_rpm_list, get_image_rpm_list, RpmComponent)
 
 FAKE_SIGMD5 = b'0' * 32
 FAKE_SIGNATURE = "RSA/SHA256, Tue 30 Aug 2016 00:00:00, Key ID 01234567890abc"
@@ -80,3 +90,275 @@ def test_parse_rpm_output():
             'signature': None,
         }
     ]
+
+
+def test_parse_rpm_output_compact():
+    output = [
+        "name1;1.0;1;x86_64;1;2000;" + FAKE_SIGMD5.decode() + ";23000;" +
+        FAKE_SIGNATURE + ";(none)\n",
+        "gpg-pubkey;64dab85d;57d33e22;(none);(none);0;(none);1473461794;(none);(none)\n",
+    ]
+
+    res = parse_rpm_output(output, compact=True)
+
+    assert res == [RpmComponent(type='rpm', name='name1', version='1.0', release='1',
+                                arch='x86_64', sigmd5=FAKE_SIGMD5.decode(),
+                                signature='01234567890abc', epoch=1)]
+    assert [component.to_dict() for component in res] == parse_rpm_output(output)
+
+
+def test_iter_rpm_output_file(tmpdir):
+    path = str(tmpdir.join('rpms'))
+    with open(path, 'w') as f:
+        f.write("name1;1.0;1;x86_64;(none);2000;(none);23000;(none);(none)\n"
+                "truncated;1.0\n"
+                "name2;2.0;1;noarch;(none);3000;(none);24000;(none);(none)\n")
+
+    with open(path) as f:
+        components = iter_rpm_output(f)
+        assert next(components)['name'] == 'name1'
+        assert next(components)['name'] == 'name2'
+        assert list(components) == []
+
+
+def test_parse_rpm_output_many():
+    """
+    See benchmarks/rpm_output_benchmark.py for performance
+    """
+    output = []
+    expected = []
+    for i in range(5000):
+        epoch = i % 3 if i % 2 else None
+        signature = FAKE_SIGNATURE if i % 5 else '(none)'
+        output.append(';'.join(['package-{}'.format(i), '1.{}'.format(i), '1.fc31', 'x86_64',
+                                '(none)' if epoch is None else str(epoch), str(i * 1000),
+                                FAKE_SIGMD5.decode(), '1573000000', signature,
+                                '(none)']) + '\n')
+        expected.append({
+            'type': 'rpm',
+            'name': 'package-{}'.format(i),
+            'version': '1.{}'.format(i),
+            'release': '1.fc31',
+            'arch': 'x86_64',
+            'sigmd5': FAKE_SIGMD5.decode(),
+            'signature': '01234567890abc' if i % 5 else None,
+            'epoch': epoch,
+        })
+
+    assert parse_rpm_output(output) == expected
+    compact = parse_rpm_output(output, compact=True)
+    assert [component.to_dict() for component in compact] == expected
+
+
+class MockedHeader(object):
+    def __init__(self, name):
+        self.name = name
+
+    def sprintf(self, qf):
+        return qf.replace('%{NAME}', self.name).replace('%{VERSION}', '1.0')
+
+
+def test_get_rpm_list_root(tmpdir):
+    os.makedirs(os.path.join(str(tmpdir), 'usr/lib/sysimage/rpm'))
+    ts = flexmock(dbMatch=lambda: [MockedHeader('bash'), MockedHeader('glibc')])
+    ts.should_receive('closeDB').once()
+    (flexmock(rpm)
+        .should_receive('addMacro')
+        .with_args('_dbpath', '/usr/lib/sysimage/rpm')
+        .once()
+        .ordered())
+    (flexmock(rpm)
+        .should_receive('TransactionSet')
+        .with_args(str(tmpdir))
+        .and_return(ts)
+        .once()
+        .ordered())
+    (flexmock(rpm)
+        .should_receive('delMacro')
+        .with_args('_dbpath')
+        .once()
+        .ordered())
+
+    rpms = get_rpm_list(tags=['NAME', 'VERSION'], root=str(tmpdir))
+    assert rpms == ['bash;1.0', 'glibc;1.0']
+
+
+def test_get_rpm_list_root_locked(tmpdir):
+    os.makedirs(os.path.join(str(tmpdir), 'var/lib/rpm'))
+
+    def transaction_set(root):
+        # _dbpath must not change while the database is opened and read
+        assert rpm_util._rpmdb_lock.locked()
+        return flexmock(dbMatch=lambda: [MockedHeader('bash')], closeDB=lambda: None)
+
+    flexmock(rpm, addMacro=lambda name, value: None, delMacro=lambda name: None)
+    flexmock(rpm).should_receive('TransactionSet').replace_with(transaction_set).once()
+
+    assert get_rpm_list(tags=['NAME'], root=str(tmpdir)) == ['bash']
+    assert not rpm_util._rpmdb_lock.locked()
+
+
+def test_get_rpm_list_root_no_rpmdb(tmpdir):
+    flexmock(rpm).should_receive('TransactionSet').never()
+    with pytest.raises(RuntimeError):
+        get_rpm_list(root=str(tmpdir))
+
+
+def make_tar(files, compression=''):
+    """
+    :param files: list of tuples (name, content), content None for directories
+                  and a str for symlinks
+    """
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode='w:' + compression) as tar:
+        for name, content in files:
+            info = tarfile.TarInfo(name)
+            if content is None:
+                info.type = tarfile.DIRTYPE
+                tar.addfile(info)
+            elif isinstance(content, bytes):
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+            else:
+                info.type = tarfile.SYMTYPE
+                info.linkname = content
+                tar.addfile(info)
+    return data.getvalue()
+
+
+def make_image_archive(layers, compression=''):
+    """
+    Create a docker-archive with layers given as lists of files
+    """
+    files = []
+    layer_names = []
+    for i, layer in enumerate(layers):
+        name = 'layer{}/layer.tar'.format(i)
+        files.append((name, make_tar(layer)))
+        layer_names.append(name)
+    files.append(('config.json', b'{}'))
+    # manifest.json comes last, as in the output of docker save
+    files.append(('manifest.json', json.dumps([{
+        'Config': 'config.json',
+        'Layers': layer_names,
+    }]).encode('utf-8')))
+    return io.BytesIO(make_tar(files, compression=compression))
+
+
+class TestGetImageRpmList(object):
+    def mock_get_rpm_list(self, expected_files):
+        def get_rpm_list(tags, separator, root):
+            found = {}
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    with open(path, 'rb') as f:
+                        found[os.path.relpath(path, root)] = f.read()
+            assert found == expected_files
+            return ['bash;5.0']
+
+        (flexmock(rpm_util)
+            .should_receive('get_rpm_list')
+            .replace_with(get_rpm_list)
+            .once())
+
+    @pytest.mark.parametrize('compression', ['', 'gz'])
+    def test_layers_applied_in_order(self, compression):
+        rpm_util._image_rpm_lists.clear()
+        layers = [
+            [('var', None), ('var/lib/rpm/Packages', b'base'),
+             ('var/lib/rpm/__db.001', b'lock'), ('etc/os-release', b'fedora')],
+            [('usr/bin/bash', b'bash')],
+            [('./var/lib/rpm/Packages', b'updated'), ('./var/lib/rpm/.wh.__db.001', b'')],
+        ]
+        self.mock_get_rpm_list({'var/lib/rpm/Packages': b'updated'})
+
+        assert get_image_rpm_list(make_image_archive(layers, compression)) == ['bash;5.0']
+
+    @pytest.mark.parametrize('method', ['gzip', 'lzma'])
+    def test_parallel_compressed(self, tmpdir, method):
+        rpm_util._image_rpm_lists.clear()
+        layers = [[('var/lib/rpm/Packages', b'base')], [('usr/bin/bash', b'bash')]]
+        self.mock_get_rpm_list({'var/lib/rpm/Packages': b'base'})
+        # output of the compress plugin using several threads
+        path = os.path.join(str(tmpdir), 'image.tar.compressed')
+        with ParallelCompressedFile(path, method, 3, block_size=512) as f:
+            f.write(make_image_archive(layers).getvalue())
+
+        with open_decompressed(path) as image_archive:
+            assert get_image_rpm_list(image_archive) == ['bash;5.0']
+
+    def test_opaque_directory(self):
+        rpm_util._image_rpm_lists.clear()
+        layers = [
+            [('var/lib/rpm/Packages', b'bdb')],
+            # converted to sqlite
+            [('usr/lib/sysimage/rpm/rpmdb.sqlite', b'sqlite'),
+             ('var/lib/.wh.rpm', b'')],
+            [('usr/lib/sysimage/rpm/rpmdb.sqlite', b'new'),
+             ('usr/lib/sysimage/rpm/Index.db', b'index'),
+             ('usr/lib/sysimage/rpm/.wh..wh..opq', b'')],
+        ]
+        self.mock_get_rpm_list({'usr/lib/sysimage/rpm/rpmdb.sqlite': b'new',
+                                'usr/lib/sysimage/rpm/Index.db': b'index'})
+
+        assert get_image_rpm_list(make_image_archive(layers)) == ['bash;5.0']
+
+    def test_no_rpmdb(self):
+        layers = [[('usr/bin/app', b'app')]]
+        flexmock(rpm_util).should_receive('get_rpm_list').never()
+
+        assert get_image_rpm_list(make_image_archive(layers)) is None
+
+    def test_cached(self):
+        rpm_util._image_rpm_lists.clear()
+        base = [('var/lib/rpm/Packages', b'base')]
+        self.mock_get_rpm_list({'var/lib/rpm/Packages': b'base'})
+
+        assert get_image_rpm_list(make_image_archive([base])) == ['bash;5.0']
+        # layers not changing the rpm database are queried only once
+        result = get_image_rpm_list(make_image_archive([base, [('app', b'app')]]))
+        assert result == ['bash;5.0']
+
+    def test_cache_bounded(self):
+        rpm_util._image_rpm_lists.clear()
+        flexmock(rpm_util, IMAGE_RPM_LISTS_MAX_ENTRIES=2)
+        (flexmock(rpm_util)
+            .should_receive('get_rpm_list')
+            .and_return(['bash;5.0'])
+            .times(4))
+
+        def image_rpm_list(name):
+            # layers are named by their digests in real archives
+            layer = '{}/layer.tar'.format(name)
+            files = [
+                (layer, make_tar([('var/lib/rpm/Packages', b'base')])),
+                ('manifest.json', json.dumps([{'Layers': [layer]}]).encode('utf-8')),
+            ]
+            return get_image_rpm_list(io.BytesIO(make_tar(files)))
+
+        for name in ['spam', 'bacon', 'spam', 'eggs']:
+            assert image_rpm_list(name) == ['bash;5.0']
+        assert len(rpm_util._image_rpm_lists) == 2
+        # bacon was the least recently used one
+        image_rpm_list('spam')
+        image_rpm_list('bacon')
+
+    def test_shared_layer_symlink(self):
+        rpm_util._image_rpm_lists.clear()
+        files = [
+            ('layer0/layer.tar', make_tar([('var/lib/rpm/Packages', b'base')])),
+            ('layer1/layer.tar', '../layer0/layer.tar'),
+            ('manifest.json', json.dumps([{
+                'Config': 'config.json',
+                'Layers': ['layer1/layer.tar'],
+            }]).encode('utf-8')),
+        ]
+        self.mock_get_rpm_list({'var/lib/rpm/Packages': b'base'})
+
+        assert get_image_rpm_list(io.BytesIO(make_tar(files))) == ['bash;5.0']
+
+    def test_missing_manifest(self):
+        archive = io.BytesIO(make_tar([('layer0/layer.tar', make_tar([]))]))
+        with pytest.raises(RuntimeError):
+            get_image_rpm_list(archive)
@@ -8,6 +8,7 @@ of the BSD license. See the LICENSE file for details.
 
 from __future__ import unicode_literals, absolute_import
 
+import gzip
 import io
 import json
 import logging
@@ -17,7 +18,9 @@ import pytest
 import requests
 import responses
 import inspect
+import jsonschema
 import signal
+import time
 from base64 import b64encode
 from collections import namedtuple
 
@@ -33,16 +36,19 @@ from atomic_reactor.constants import (IMAGE_TYPE_DOCKER_ARCHIVE, IMAGE_TYPE_OCI,
                                       MEDIA_TYPE_DOCKER_V2_SCHEMA1, MEDIA_TYPE_DOCKER_V2_SCHEMA2,
                                       DOCKERIGNORE, RELATIVE_REPOS_PATH)
 from atomic_reactor.inner import DockerBuildWorkflow
+from atomic_reactor.registry_cache import registry_cache
 from atomic_reactor.util import (ImageName, wait_for_command,
                                  LazyGit, figure_out_build_file,
                                  render_yum_repo, process_substitutions,
-                                 get_checksums, print_version_of_tools,
+                                 get_checksums, ChecksumWriter, get_exported_image_metadata,
+                                 print_version_of_tools,
                                  get_version_of_tools,
-                                 human_size, CommandResult,
+                                 human_size, CommandResult, LogSpool,
                                  registry_hostname, Dockercfg, RegistrySession,
+                                 get_registry_adapter,
                                  get_manifest_digests, ManifestDigest,
                                  get_manifest_list, get_all_manifests,
-                                 get_inspect_for_image, get_manifest,
+                                 get_inspect_for_image, get_manifest, query_registry,
                                  get_build_json, is_scratch_build, is_isolated_build, df_parser,
                                  base_image_is_custom,
                                  are_plugins_in_order, LabelFormatter,
@@ -193,6 +199,53 @@ class TestCommandResult(object):
         cr.parse_item(item)
         assert cr.logs == [expected]
 
+    def test_stream_logs(self):
+        cr = CommandResult(stream_logs=True, max_buffered_logs=3)
+        items = [{"stream": "Step {}\n".format(i)} for i in range(10)]
+        error_item = {"error": "failed", "errorDetail": {"message": "failed"}}
+        items.insert(2, error_item)
+        items.append('not valid JSON')
+        for item in items:
+            cr.parse_item(item)
+
+        expected = ['Step {}'.format(i) for i in range(10)] + ['not valid JSON']
+        assert list(cr.logs) == expected
+        # logs can be read again and appended to afterwards
+        assert len(cr.logs) == len(expected)
+        assert list(cr.logs) == expected
+        # error items are kept, the rest is bounded
+        assert cr.parsed_logs == [error_item] + items[-3:]
+        assert cr.error is None
+
+        cr.parse_item({"stream": "last"})
+        cr.finish()
+        assert list(cr.logs) == expected + ['last']
+
+    def test_stream_logs_error(self):
+        cr = CommandResult(stream_logs=True)
+        cr.parse_item({"stream": "Step 0"})
+        cr.parse_item({"error": "failed", "errorDetail": {"message": "failed"}})
+        assert cr.is_failed()
+        assert cr.error == "failed"
+        assert cr.error_detail == {"message": "failed"}
+
+
+def test_log_spool():
+    spool = LogSpool()
+    lines = ['line {} '.format(i) * 100 for i in range(10000)]
+    for line in lines:
+        spool.append(line)
+    spool.append(b'bytes \xff')
+    spool.finish()
+    # finished spool is a valid gzip file
+    spool._file.seek(0)
+    with gzip.GzipFile(fileobj=spool._file) as f:
+        assert f.read().splitlines()[-1] == b'bytes \xff'
+    spool.append('after finish')
+
+    assert len(spool) == len(lines) + 2
+    assert list(spool) == lines + ['bytes \ufffd', 'after finish']
+
 
 BUILD_FILE_CONTENTS_DOCKER = {
     "Dockerfile": "",
@@ -339,6 +392,50 @@ def test_get_hexdigests(tmpdir, content, algorithms, expected, write_to_file, sh
         assert checksums == expected
 
 
+@pytest.mark.parametrize('chunks', [[], [b'abc'], [b'a', b'', b'bc']])
+def test_checksum_writer(tmpdir, chunks):
+    path = os.path.join(str(tmpdir), 'out')
+    with ChecksumWriter(path, ['md5', 'sha256']) as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+    assert f.closed
+    assert f.size == len(b''.join(chunks))
+    assert f.checksums == get_checksums(path, ['md5', 'sha256'])
+
+
+def test_checksum_writer_invalid_algorithm(tmpdir):
+    with pytest.raises(ValueError):
+        ChecksumWriter(os.path.join(str(tmpdir), 'out'), ['md5', 'invalid'])
+
+
+@pytest.mark.parametrize('image_type, checksums, expected_checksums', [
+    (IMAGE_TYPE_DOCKER_ARCHIVE, None,
+     {'md5sum': '900150983cd24fb0d6963f7d28e17f72',
+      'sha256sum': 'ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad'}),
+    (IMAGE_TYPE_DOCKER_ARCHIVE, {'md5sum': 'md5', 'sha256sum': 'sha256'},
+     {'md5sum': 'md5', 'sha256sum': 'sha256'}),
+    (IMAGE_TYPE_OCI, {'md5sum': 'md5', 'sha256sum': 'sha256'}, {}),
+])
+def test_get_exported_image_metadata(tmpdir, image_type, checksums, expected_checksums):
+    path = os.path.join(str(tmpdir), 'image.tar')
+    with open(path, 'wb') as f:
+        f.write(b'abc')
+
+    if checksums:
+        (flexmock(atomic_reactor.util)
+            .should_receive('get_checksums')
+            .never())
+
+    metadata = get_exported_image_metadata(path, image_type, checksums=checksums)
+
+    expected = {'path': path, 'type': image_type}
+    if image_type != IMAGE_TYPE_OCI:
+        expected['size'] = 3
+    expected.update(expected_checksums)
+    assert metadata == expected
+
+
 @pytest.mark.parametrize('path, image_type, expected', [
     ('foo.tar', IMAGE_TYPE_DOCKER_ARCHIVE, 'docker-image-XXX.x86_64.tar'),
     ('foo.tar.gz', IMAGE_TYPE_DOCKER_ARCHIVE, 'docker-image-XXX.x86_64.tar.gz'),
@@ -489,6 +586,21 @@ def test_registry_session(tmpdir, registry, insecure, method, responses_method,
     assert res.text == 'A-OK'
 
 
+def test_registry_session_shared_adapter():
+    first = RegistrySession('registry.example.com')
+    second = RegistrySession('https://registry.example.com')
+    other = RegistrySession('other.example.com')
+
+    adapter = get_registry_adapter('registry.example.com')
+    for session in (first, second):
+        for scheme in ('https', 'http'):
+            url = '{}://registry.example.com/v2/'.format(scheme)
+            assert session.session.get_adapter(url) is adapter
+    assert other.session.get_adapter('https://other.example.com/v2/') is not adapter
+    # other hosts don't use the registry connection pool
+    assert first.session.get_adapter('https://example.com/v2/') is not adapter
+
+
 @pytest.mark.parametrize(('version', 'expected'), [
     ('v1', 'application/vnd.docker.distribution.manifest.v1+json'),
     ('v2', 'application/vnd.docker.distribution.manifest.v2+json'),
@@ -653,6 +765,123 @@ def test_get_manifest_digests(tmpdir, caplog, image, registry, insecure, creds,
     assert not caplog.records
 
 
+@pytest.mark.parametrize('concurrent', [True, False])
+@pytest.mark.parametrize('use_head', [True, False])
+@pytest.mark.parametrize('head_content_type', [True, False])
+@responses.activate
+def test_get_manifest_digests_probe_mode(concurrent, use_head, head_content_type):
+    image = ImageName.parse('spam:latest')
+    url = 'https://registry.example.com/v2/spam/manifests/latest'
+    versions = ('v1', 'v2', 'v2_list', 'oci', 'oci_index')
+    found = ('v2', 'v2_list')
+
+    def request_callback(request):
+        media_type = request.headers['Accept']
+        version = [v for v in versions if get_manifest_media_type(v) == media_type][0]
+        if version not in found:
+            return (404, {}, '')
+        headers = {'Docker-Content-Digest': '{}-digest'.format(version)}
+        if request.method == 'GET' or head_content_type:
+            headers['Content-Type'] = media_type
+        body = '' if request.method == 'HEAD' else json.dumps({'mediaType': media_type})
+        return (200, headers, body)
+
+    for method in (responses.GET, responses.HEAD):
+        responses.add_callback(method, url, callback=request_callback, content_type=None)
+
+    digests = get_manifest_digests(image, 'registry.example.com', versions=versions,
+                                   concurrent=concurrent, use_head=use_head)
+    assert digests == ManifestDigest(v2='v2-digest', v2_list='v2_list-digest')
+
+    methods = [call.request.method for call in responses.calls]
+    if not use_head:
+        assert methods == ['GET'] * len(versions)
+    elif head_content_type:
+        assert methods == ['HEAD'] * len(versions)
+    else:
+        # manifests are fetched when media type can't be confirmed from headers
+        assert sorted(methods) == ['GET'] * len(found) + ['HEAD'] * len(versions)
+
+
+@pytest.mark.parametrize(('reference', 'is_blob', 'requests_after_ttl'), [
+    ('latest', False, 2),
+    ('sha256:' + 'a' * 64, False, 1),
+    ('sha256:' + 'a' * 64, True, 1),
+])
+@responses.activate
+def test_query_registry_cache(reference, is_blob, requests_after_ttl):
+    image = ImageName.parse('spam:latest')
+    session = RegistrySession('registry.example.com')
+    object_type = 'blobs' if is_blob else 'manifests'
+    url = 'https://registry.example.com/v2/spam/{}/{}'.format(object_type, reference)
+    responses.add(responses.GET, url, json={'spam': 'bacon'})
+
+    digest = None if reference == 'latest' else reference
+    for _ in range(2):
+        response = query_registry(session, image, digest=digest, version='v2', is_blob=is_blob)
+        assert response.json() == {'spam': 'bacon'}
+    assert len(responses.calls) == 1
+    assert registry_cache.get_stats()['hits'] == 1
+
+    # the cache can be bypassed
+    query_registry(session, image, digest=digest, version='v2', is_blob=is_blob,
+                   use_cache=False)
+    assert len(responses.calls) == 2
+
+    # only tag lookups expire
+    expired = time.time() + registry_cache.tag_ttl
+    flexmock(time).should_receive('time').and_return(expired)
+    query_registry(session, image, digest=digest, version='v2', is_blob=is_blob)
+    assert len(responses.calls) == 1 + requests_after_ttl
+
+
+@responses.activate
+def test_query_registry_cache_auth(tmpdir):
+    image = ImageName.parse('spam:latest')
+    url = 'https://registry.example.com/v2/spam/manifests/latest'
+    responses.add(responses.GET, url, json={'spam': 'bacon'})
+
+    dockercfg_path = str(tmpdir)
+    with open(os.path.join(dockercfg_path, '.dockercfg'), 'w') as f:
+        json.dump({'registry.example.com': {'username': 'user', 'password': 'pass'}}, f)
+
+    sessions = [
+        RegistrySession('registry.example.com'),
+        RegistrySession('registry.example.com', access=('pull', 'push')),
+        RegistrySession('registry.example.com', dockercfg_path=dockercfg_path),
+    ]
+    for session in sessions * 2:
+        query_registry(session, image)
+    # responses are not shared by different credentials or scopes
+    assert len(responses.calls) == len(sessions)
+
+
+@responses.activate
+def test_query_registry_cache_errors():
+    image = ImageName.parse('spam:latest')
+    session = RegistrySession('registry.example.com')
+    url = 'https://registry.example.com/v2/spam/manifests/latest'
+    responses.add(responses.GET, url, status=404)
+    responses.add(responses.GET, url, json={'spam': 'bacon'})
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        query_registry(session, image)
+    # failures are not cached
+    assert query_registry(session, image).json() == {'spam': 'bacon'}
+    assert len(responses.calls) == 2
+
+
+@pytest.mark.parametrize('concurrent', [True, False])
+@responses.activate
+def test_get_manifest_digests_probe_mode_not_found(concurrent):
+    image = ImageName.parse('spam:latest')
+    url = 'https://registry.example.com/v2/spam/manifests/latest'
+    responses.add(responses.GET, url, status=404)
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        get_manifest_digests(image, 'registry.example.com', concurrent=concurrent)
+
+
 @pytest.mark.parametrize('has_content_type_header', [
     True, False
 ])
@@ -1152,6 +1381,62 @@ def test_read_yaml_file_or_yaml(tmpdir, from_file, config):
     assert output == expected
 
 
+@pytest.fixture
+def clean_yaml_caches(monkeypatch):
+    monkeypatch.setattr(atomic_reactor.util, '_schema_validators', {})
+    monkeypatch.setattr(atomic_reactor.util, '_validated_yaml', {})
+    monkeypatch.delenv('ATOMIC_REACTOR_VALIDATION_CACHE', raising=False)
+
+
+def test_read_yaml_cached(clean_yaml_caches):
+    expected = yaml.safe_load(REACTOR_CONFIG_MAP)
+    check_schema = jsonschema.Draft4Validator.check_schema
+    safe_load = yaml.safe_load
+    (flexmock(jsonschema.Draft4Validator)
+        .should_receive('check_schema')
+        .replace_with(check_schema)
+        .once())
+    (flexmock(yaml)
+        .should_receive('safe_load')
+        .replace_with(safe_load)
+        .once())
+
+    output = read_yaml(REACTOR_CONFIG_MAP, 'schemas/config.json')
+    assert output == expected
+    output['version'] = 2
+
+    # neither parsed nor validated again, and not affected by changes made by callers
+    assert read_yaml(REACTOR_CONFIG_MAP, 'schemas/config.json') == expected
+
+
+def test_read_yaml_invalid_not_cached(clean_yaml_caches):
+    for _ in range(2):
+        with pytest.raises(jsonschema.ValidationError):
+            read_yaml('clusters: {}', 'schemas/config.json')
+
+
+def test_read_yaml_persistent_cache(tmpdir, monkeypatch, clean_yaml_caches):
+    cache_dir = os.path.join(str(tmpdir), 'cache')
+    monkeypatch.setenv('ATOMIC_REACTOR_VALIDATION_CACHE', cache_dir)
+    expected = yaml.safe_load(REACTOR_CONFIG_MAP)
+    safe_load = yaml.safe_load
+
+    assert read_yaml(REACTOR_CONFIG_MAP, 'schemas/config.json') == expected
+    assert len(os.listdir(cache_dir)) == 1
+
+    # e.g. another process
+    monkeypatch.setattr(atomic_reactor.util, '_validated_yaml', {})
+    flexmock(yaml).should_receive('safe_load').never()
+    assert read_yaml(REACTOR_CONFIG_MAP, 'schemas/config.json') == expected
+
+    # corrupted entry is parsed and validated again
+    with open(os.path.join(cache_dir, os.listdir(cache_dir)[0]), 'w') as f:
+        f.write('{')
+    monkeypatch.setattr(atomic_reactor.util, '_validated_yaml', {})
+    flexmock(yaml).should_receive('safe_load').replace_with(safe_load).once()
+    assert read_yaml(REACTOR_CONFIG_MAP, 'schemas/config.json') == expected
+
+
 LogEntry = namedtuple('LogEntry', ['platform', 'line'])
 
 
@@ -12,6 +12,7 @@ from __future__ import unicode_literals, absolute_import
 import pytest
 import requests
 import uuid
+from flexmock import flexmock
 
 from six import string_types
 
@@ -42,3 +43,77 @@ def has_connection():
 
 # In case we run tests in an environment without internet connection.
 requires_internet = pytest.mark.skipif(not has_connection(), reason="requires internet connection")
+
+
+class KojiMulticallCall(object):
+    """A call queued in KojiMulticallMock, like koji.VirtualCall"""
+    def __init__(self, method, args, kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.error = None
+        self._result = None
+
+    def run(self):
+        try:
+            self._result = self.method(*self.args, **self.kwargs)
+        except Exception as exc:
+            self.error = exc
+
+    @property
+    def result(self):
+        if self.error is not None:
+            raise self.error
+        return self._result
+
+
+class KojiMulticallMock(object):
+    """
+    Stand-in for koji.MultiCallSession which runs the queued calls one by
+    one using the (possibly mocked) methods of the session
+    """
+    def __init__(self, session, strict=False, batch=None):
+        self._session = session
+        self._strict = strict
+        self._calls = []
+
+    def __getattr__(self, name):
+        method = getattr(self._session, name)
+
+        def queue_call(*args, **kwargs):
+            call = KojiMulticallCall(method, args, kwargs)
+            self._calls.append(call)
+            return call
+
+        return queue_call
+
+    def call_all(self, strict=None, batch=None):
+        calls, self._calls = self._calls, []
+        for call in calls:
+            call.run()
+
+        if self._strict if strict is None else strict:
+            for call in calls:
+                if call.error is not None:
+                    raise call.error
+
+        return [call.error or [call.result] for call in calls]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.call_all()
+        return False
+
+
+def mock_koji_multicall(session):
+    """
+    Mock session.multicall() so that calls made through multicall use the
+    mocked methods of session
+    """
+    (flexmock(session)
+        .should_receive('multicall')
+        .replace_with(lambda strict=False, batch=None: KojiMulticallMock(session, strict,
+                                                                         batch)))